@@ -0,0 +1,31 @@
+import importlib
+import sys
+
+
+def lazy_imports(module_name, imports):
+    """
+    Returns the `__getattr__`, `__dir__` and `__all__` of a package whose
+    names are imported on first access (PEP 562), so that DAG files importing
+    one operator do not pay for loading every module:
+
+        __getattr__, __dir__, __all__ = lazy_imports(__name__, {
+            'LookerHook': 'airflow_looker.hooks.looker_hook',
+        })
+
+    :param module_name: the package's `__name__`
+    :type module_name: str
+    :param imports: the package's names, mapped to the module defining them
+    :type imports: dict
+    """
+    def __getattr__(name):
+        if name not in imports:
+            raise AttributeError("module {!r} has no attribute {!r}".format(module_name, name))
+        value = getattr(importlib.import_module(imports[name]), name)
+        # later lookups find the name without calling __getattr__
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[module_name])) | set(imports))
+
+    return __getattr__, __dir__, sorted(imports)
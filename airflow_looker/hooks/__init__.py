@@ -1 +1,5 @@
-from .looker_hook import LookerHook
+from airflow_looker._lazy import lazy_imports
+
+__getattr__, __dir__, __all__ = lazy_imports(__name__, {
+    'LookerHook': 'airflow_looker.hooks.looker_hook',
+})
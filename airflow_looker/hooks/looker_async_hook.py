@@ -0,0 +1,374 @@
+import asyncio
+import json
+import time
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+from airflow.hooks.base_hook import BaseHook
+from airflow.exceptions import AirflowException
+
+from airflow_looker.hooks.looker_hook import IDEMPOTENT_METHODS, RETRY_STATUS_CODES, LookerApiError, LookerHook
+from airflow_looker.hooks.metrics import endpoint_template
+from airflow_looker.hooks.payload_log import LogPayload
+
+
+class AsyncLookerHook(BaseHook):
+    """
+    A hook to talk to the Looker API over HTTP from asyncio code, i.e. triggers
+    running in the Airflow triggerer, or tasks fanning out hundreds of calls
+    from a single thread. Requires `aiohttp`.
+
+    Logs in the same way as `LookerHook.get_conn` and shares its token cache,
+    so a token fetched by either hook is reused by the other. Calls are
+    retried, rate limited and measured like `LookerHook.call`.
+
+        async with AsyncLookerHook(max_concurrency=50) as looker:
+            sqls = await looker.get_look_sqls(look_ids)
+    """
+    def __init__(self,
+                 looker_conn_id='looker_default',
+                 verify=True,
+                 token_cache=None,
+                 pool_maxsize=10,
+                 max_concurrency=None,
+                 retry_limit=3,
+                 retry_delay=0.5,
+                 retry_max_delay=30,
+                 metrics=None,
+                 log_max_length=1000):
+        """
+        :param looker_conn_id: connection that has the host i.e
+        https://looker.company.com:19999/api/3.0/, the login (client_id) and
+        the password (client_secret).
+        :type looker_conn_id: string
+        :param verify: true if we should verify API calls. Defaults to true.
+        :type verify: boolean
+        :param token_cache: cache used to share access tokens between calls.
+        Defaults to the same cache `LookerHook` would use.
+        :type token_cache: airflow_looker.hooks.token_cache.TokenCache
+        :param pool_maxsize: maximum number of connections the hook's session
+        holds open to Looker. Defaults to 10.
+        :type pool_maxsize: int
+        :param max_concurrency: maximum number of requests in flight at once,
+        however many calls are awaited concurrently. Defaults to
+        `pool_maxsize`.
+        :type max_concurrency: int
+        :param retry_limit: see `LookerHook`
+        :type retry_limit: int
+        :param retry_delay: see `LookerHook`
+        :type retry_delay: float
+        :param retry_max_delay: see `LookerHook`
+        :type retry_max_delay: float
+        :param metrics: see `LookerHook`
+        :type metrics: airflow_looker.hooks.metrics.MetricsSink
+        :param log_max_length: see `LookerHook`
+        :type log_max_length: int
+        """
+        self.looker_conn_id = looker_conn_id
+        self.verify = verify
+        self.pool_maxsize = pool_maxsize
+        self.max_concurrency = max_concurrency or pool_maxsize
+        self._hook = LookerHook(looker_conn_id=looker_conn_id, verify=verify, token_cache=token_cache,
+                                retry_limit=retry_limit, retry_delay=retry_delay, retry_max_delay=retry_max_delay,
+                                metrics=metrics, log_max_length=log_max_length)
+        self._session = None
+        self._login_lock = None
+        self._semaphore = None
+
+    @property
+    def api_endpoint(self):
+        return self._hook.api_endpoint
+
+    @property
+    def token_cache(self):
+        return self._hook.token_cache
+
+    @property
+    def metrics(self):
+        return self._hook.metrics
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the hook's HTTP session and its pooled connections
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_conn(self):
+        """
+        Returns the hook's aiohttp session, creating it on first use. Must be
+        called from a running event loop.
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize, ssl=None if self.verify else False)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _get_looker_connection(self):
+        # the connection lookup hits the metadata database, keep it off the loop
+        if self._hook._conn is None:
+            await asyncio.get_running_loop().run_in_executor(None, self._hook._get_looker_connection)
+        return self._hook._conn
+
+    async def login(self):
+        """
+        Logs in to Looker with the connection's API credentials
+        :return: tuple of the access token and its lifetime in seconds
+        """
+        conn = await self._get_looker_connection()
+        self.log.info("Logging in to Looker at %s", self.api_endpoint)
+        data = {
+            "client_id": conn.login,
+            "client_secret": conn.password
+        }
+        with self.metrics.span('login', {'looker_conn_id': self.looker_conn_id}):
+            started_at = time.monotonic()
+            async with self.get_conn().post(urljoin(self.api_endpoint, "login"), data=data) as token_request:
+                payload = await token_request.read()
+        tags = {'status': str(token_request.status)}
+        self.metrics.timing('login', time.monotonic() - started_at, tags)
+        self.metrics.incr('logins', tags=tags)
+        if token_request.status >= 400:
+            _message = "Failed to log in to Looker: {}:{}".format(token_request.status, token_request.reason)
+            self.log.error(_message)
+            raise LookerApiError(_message, token_request.status)
+        payload = json.loads(payload)
+        return payload["access_token"], payload.get("expires_in")
+
+    async def get_token(self):
+        """
+        Returns a Looker access token, logging in only if there is no cached
+        token for this connection or it is about to expire
+        """
+        await self._get_looker_connection()
+        key = self._hook._token_cache_key()
+        token = await self._get_cached_token(key)
+        if token is not None:
+            return token
+
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            token = await self._get_cached_token(key)
+            if token is None:
+                token, expires_in = await self.login()
+                # set() waits on the key's lock, which a LookerHook in another thread
+                # or process holds for a whole login, so it never runs on the loop
+                await asyncio.get_running_loop().run_in_executor(None, self.token_cache.set, key, token, expires_in)
+        return token
+
+    async def _get_cached_token(self, key):
+        if self.token_cache.async_safe:
+            return self.token_cache.get(key)
+        # file-backed caches read the file, keep that off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.token_cache.get, key)
+
+    async def call(self, method, endpoint, data, headers=None, retry=None):
+        """
+        Call the Looker API and return results. The body is read before the
+        response is returned, so `await response.json()` and
+        `await response.text()` can be used after the call.
+        :param method: the method of the call (`GET`, `POST`, etc)
+        :type method: str
+        :param endpoint: the endpoint to be called i.e. looks/run/1
+        :type endpoint: str
+        :param data: payload to be uploaded or request parameters
+        :type data: dict
+        :param headers: additional headers to be passed through as a dictionary
+        :type headers: dict
+        :param retry: see `LookerHook.call`. Defaults to retrying idempotent
+        methods only.
+        :type retry: boolean
+        """
+        token = await self.get_token()
+        url = urljoin(self.api_endpoint, endpoint)
+
+        kwargs = {}
+        if method == 'GET':
+            # GET uses params
+            kwargs['params'] = data
+        elif method != 'HEAD':
+            # Others, apart from HEAD, use data
+            kwargs['data'] = json.dumps(data)
+
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+
+        self.log.info("Sending '%s' to url: %s: %s", method, url, LogPayload(data, self._hook.log_max_length))
+        response = await self._send_with_retries(method, url, token, headers, kwargs, retry)
+
+        if response.status == 401:
+            # The cached token has expired or been revoked; log in once more.
+            # Concurrent calls rejected with the same token share one login.
+            self.log.info("Looker rejected the access token, logging in again")
+            # waits on the key's lock like set(), keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.token_cache.invalidate,
+                                                             self._hook._token_cache_key(), token)
+            token = await self.get_token()
+            response = await self._send_with_retries(method, url, token, headers, kwargs, retry)
+
+        if self._hook.payload_sampler is not None:
+            self._hook.payload_sampler.sample(method, url, response.status, data, await response.text())
+
+        if response.status >= 400:
+            self.log.error("HTTP error: %s", response.reason)
+            self.log.error("%s", LogPayload(await response.text(), self._hook.log_max_length))
+            raise LookerApiError(str(response.status) + ":" + response.reason, response.status)
+        return response
+
+    async def _send_with_retries(self, method, url, token, headers, kwargs, retry):
+        """
+        Sends the request, retrying with exponential backoff and jitter while
+        Looker is throttling or unavailable, or the connection fails
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(method, url, token, headers, kwargs)
+            except aiohttp.ClientConnectionError as e:
+                if not retry or attempt >= self._hook.retry_limit:
+                    raise
+                delay = self._hook._get_retry_delay(attempt)
+                self.log.warning("Connection error calling %s: %s. Retrying in %.2fs", url, e, delay)
+            else:
+                if not retry or attempt >= self._hook.retry_limit or response.status not in RETRY_STATUS_CODES:
+                    return response
+                delay = self._hook._get_retry_delay(attempt, response)
+                if delay is None:
+                    self.log.warning("Looker returned %s for %s and asked to retry after more than %ss, giving up",
+                                     response.status, url, self._hook.retry_max_delay)
+                    return response
+                self.log.warning("Looker returned %s for %s. Retrying in %.2fs", response.status, url, delay)
+            self.metrics.incr('retries', tags=self._metric_tags(method, url))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(self, method, url, token, headers, kwargs):
+        tags = self._metric_tags(method, url)
+        rate_limiter = self._hook.rate_limiter
+        if rate_limiter is not None:
+            # wait on the event loop instead of blocking it in acquire()
+            waiting_since = time.monotonic()
+            wait = await self._try_acquire(rate_limiter)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = await self._try_acquire(rate_limiter)
+            self.metrics.timing('rate_limit_wait', time.monotonic() - waiting_since, tags)
+
+        request_headers = dict(headers or {})
+        request_headers["Authorization"] = "token " + token
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            with self.metrics.span('request', tags):
+                started_at = time.monotonic()
+                async with self.get_conn().request(method, url, headers=request_headers, **kwargs) as response:
+                    body = await response.read()
+
+        tags['status'] = str(response.status)
+        self.metrics.timing('request', time.monotonic() - started_at, tags)
+        self.metrics.incr('requests', tags=tags)
+        if body:
+            self.metrics.incr('response_bytes', len(body), tags)
+        return response
+
+    @staticmethod
+    async def _try_acquire(rate_limiter):
+        if rate_limiter.async_safe:
+            return rate_limiter.try_acquire()
+        # limiters shared through a file lock it, keep that off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, rate_limiter.try_acquire)
+
+    @staticmethod
+    def _metric_tags(method, url):
+        return {'endpoint': endpoint_template(urlparse(url).path), 'method': method}
+
+    async def get_look_sql(self, look_id=None):
+        """
+        Gets a SQL query from a Looker look resource
+        :param look_id: unique identifier for a look resource
+        :type look_id: int
+        :return: sql string
+        """
+        if look_id is None:
+            _message = "No look_id provided"
+            self.log.error(_message)
+            raise AirflowException(_message)
+
+        endpoint = '{}/{}/run/{}'.format('api/3.0/looks', look_id, 'sql')
+        self.log.info("Fetching looker %s query", endpoint)
+        response = await self.call(method='GET', endpoint=endpoint, data=None)
+        return await response.text()
+
+    async def get_json(self, endpoint, fields=None, params=None, record=None):
+        """
+        Calls a Looker GET endpoint and decodes the JSON response, see
+        `LookerHook.get_json`
+        """
+        params = self._hook._get_params(params, fields, record)
+        response = await self.call(method='GET', endpoint=endpoint, data=params)
+        payload = await response.json(content_type=None)
+        if record is None:
+            return payload
+        if isinstance(payload, list):
+            return [record.from_dict(item) for item in payload]
+        return record.from_dict(payload)
+
+    async def get_look(self, look_id, fields=None, record=None):
+        """
+        Gets a look's definition, see `LookerHook.get_look`
+        """
+        endpoint = '{}/{}'.format('api/3.0/looks', look_id)
+        return await self.get_json(endpoint, fields=fields, record=record)
+
+    async def get_dashboard(self, dashboard_id, fields=None, record=None):
+        """
+        Gets a dashboard's definition, see `LookerHook.get_dashboard`
+        """
+        endpoint = '{}/{}'.format('api/3.0/dashboards', dashboard_id)
+        return await self.get_json(endpoint, fields=fields, record=record)
+
+    async def call_many(self, calls, return_exceptions=False):
+        """
+        Makes many calls concurrently. At most `max_concurrency` requests are
+        in flight at once, and all of them share one login.
+        :param calls: the arguments of each call, as a tuple i.e.
+        `('GET', 'api/3.0/looks/1', None)` or as a dictionary of keyword
+        arguments
+        :type calls: iterable
+        :param return_exceptions: return the exception of a failed call in
+        its place instead of raising the first one. Defaults to false.
+        :type return_exceptions: boolean
+        :return: list of responses, in the order of `calls`
+        """
+        return await asyncio.gather(*(self.call(**call) if isinstance(call, dict) else self.call(*call)
+                                      for call in calls),
+                                    return_exceptions=return_exceptions)
+
+    async def get_json_many(self, endpoints, fields=None, params=None, record=None, return_exceptions=False):
+        """
+        Calls many Looker GET endpoints concurrently and decodes their JSON
+        responses, see `get_json` and `call_many`
+        :return: list of decoded objects, in the order of `endpoints`
+        """
+        return await asyncio.gather(*(self.get_json(endpoint, fields=fields, params=params, record=record)
+                                      for endpoint in endpoints),
+                                    return_exceptions=return_exceptions)
+
+    async def get_look_sqls(self, look_ids, return_exceptions=False):
+        """
+        Gets the SQL of many looks concurrently, see `call_many`
+        :return: dictionary of look ID to SQL string
+        """
+        look_ids = list(look_ids)
+        sqls = await asyncio.gather(*(self.get_look_sql(look_id) for look_id in look_ids),
+                                    return_exceptions=return_exceptions)
+        return dict(zip(look_ids, sqls))
@@ -1,10 +1,172 @@
+import codecs
+import itertools
 import requests
 import json
-from urllib.parse import urljoin
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode, urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
 from airflow.hooks.base_hook import BaseHook
 from airflow.exceptions import AirflowException
 
+from airflow_looker.hooks.metrics import endpoint_template, get_metrics_sink
+from airflow_looker.hooks.payload_log import LogPayload, PayloadSampler
+from airflow_looker.hooks.rate_limiter import get_rate_limiter
+from airflow_looker.hooks.response_cache import get_response_cache
+from airflow_looker.hooks.routing import ROUTING_POLICIES, Router, get_instance_health
+from airflow_looker.hooks.token_cache import FileTokenCache, default_token_cache
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+# methods that may be sent to a replica instance by default
+READ_METHODS = ('GET', 'HEAD')
+
+QUERY_TASK_COMPLETE = 'complete'
+QUERY_TASK_FAILED_STATUSES = ('error', 'killed', 'expired')
+
+RENDER_TASK_COMPLETE = 'success'
+RENDER_TASK_FAILED_STATUSES = ('failure',)
+
+PDT_BUILD_COMPLETE_STATUSES = ('complete', 'success', 'done')
+PDT_BUILD_FAILED_STATUSES = ('error', 'failed', 'killed', 'stopped')
+PDT_BUILD_RUNNING_STATUSES = ('running', 'pending', 'queued', 'started', 'building', 'in_progress')
+
+# an edge of the DOT graph returned by derived_table/graph/model, i.e. "a" -> "b"
+_DOT_EDGE = re.compile(r'"?([\w.]+)"?\s*->\s*"?([\w.]+)"?')
+
+
+class LookerApiError(AirflowException):
+    """
+    Raised when Looker answers a call with an HTTP error. `status_code` holds
+    the status of the response.
+    """
+    def __init__(self, message, status_code=None):
+        super(LookerApiError, self).__init__(message)
+        self.status_code = status_code
+
+
+def iter_json_array(chunks):
+    """
+    Incrementally decodes a JSON array of objects from an iterable of byte
+    chunks, i.e. `Response.iter_content()`, yielding one item at a time so
+    only the current item and a partial chunk are held in memory
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    started = False
+    for chunk in chunks:
+        buf += text_decoder.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                item, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # the item continues in the next chunk
+                break
+            yield item
+        buf = buf[pos:]
+    if buf.strip():
+        raise ValueError("Truncated JSON array")
+
+
+# an opening or closing bracket outside of a JSON string
+_JSON_BRACKET = re.compile(rb'[\[\]{}]')
+
+
+class RowCounter(object):
+    """
+    Counts the rows of `csv`, `json` or `jsonl` results from the chunks
+    written by `download_look`, so the file doesn't need reading again. Only
+    quotes, newlines and brackets are tracked, so the cost per chunk is a few
+    scans in C rather than a parse.
+    """
+    def __init__(self, result_format):
+        """
+        :param result_format: format of the results. Other formats than
+        `csv`, `json` and `jsonl` are not counted.
+        :type result_format: str
+        """
+        self.result_format = result_format
+        self._lines = 0
+        self._last_byte = b''
+        self._in_string = False
+        self._backslashes = 0
+        self._depth = 0
+        self._items = 0
+
+    def update(self, chunk):
+        if not chunk:
+            return
+        self._last_byte = chunk[-1:]
+        if self.result_format == 'jsonl':
+            self._lines += chunk.count(b'\n')
+        elif self.result_format == 'csv':
+            # quoted fields may hold newlines; an escaped "" toggles twice
+            for i, segment in enumerate(chunk.split(b'"')):
+                if i:
+                    self._in_string = not self._in_string
+                if not self._in_string:
+                    self._lines += segment.count(b'\n')
+        elif self.result_format == 'json':
+            self._update_json(chunk)
+
+    def _update_json(self, chunk):
+        for i, segment in enumerate(chunk.split(b'"')):
+            if i:
+                # a quote preceded by an odd number of backslashes is escaped
+                if not (self._in_string and self._backslashes % 2):
+                    self._in_string = not self._in_string
+                self._backslashes = 0
+            if self._in_string:
+                stripped = segment.rstrip(b'\\')
+                trailing = len(segment) - len(stripped)
+                self._backslashes = trailing if stripped else self._backslashes + trailing
+                continue
+            for bracket in _JSON_BRACKET.findall(segment):
+                if bracket in (b'[', b'{'):
+                    if self._depth == 1:
+                        self._items += 1
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+
+    @property
+    def rows(self):
+        """
+        Number of rows counted so far, not counting the csv header, or None
+        for formats that aren't counted
+        """
+        if self.result_format == 'json':
+            return self._items
+        if self.result_format not in ('csv', 'jsonl'):
+            return None
+        lines = self._lines + (1 if self._last_byte not in (b'', b'\n') else 0)
+        return max(0, lines - 1) if self.result_format == 'csv' else lines
+
+
+# File-backed token caches, one per path, shared by every hook in the process
+_file_token_caches = {}
+
 
 class LookerHook(BaseHook):
     """
@@ -12,7 +174,18 @@ class LookerHook(BaseHook):
     """
     def __init__(self,
                  looker_conn_id='looker_default',
-                 verify=True):
+                 verify=True,
+                 token_cache=None,
+                 pool_maxsize=10,
+                 retry_limit=3,
+                 retry_delay=0.5,
+                 retry_max_delay=30,
+                 rate_limiter=None,
+                 response_cache=None,
+                 metrics=None,
+                 log_max_length=1000,
+                 replica_conn_ids=None,
+                 routing=None):
         """
         :param looker_conn_id: connection that has the host i.e
         https://looker.company.com:19999/api/3.0/, the login (client_id) and
@@ -20,53 +193,284 @@ class LookerHook(BaseHook):
         :type looker_conn_id: string
         :param verify: true if we should verify API calls. Defaults to true.
         :type verify: boolean
+        :param token_cache: cache used to share access tokens between calls.
+        Defaults to the process-wide cache, or to a file-backed cache when the
+        connection extra sets `token_cache_path`.
+        :type token_cache: airflow_looker.hooks.token_cache.TokenCache
+        :param pool_maxsize: maximum number of keep-alive connections the
+        hook's session holds open to Looker. Set this to at least the number
+        of threads sharing the hook. Defaults to 10.
+        :type pool_maxsize: int
+        :param retry_limit: number of times a call is retried after a 429,
+        502, 503 or 504 response or a connection error. Defaults to 3.
+        :type retry_limit: int
+        :param retry_delay: base of the exponential backoff between retries in
+        seconds. The actual delay is picked at random up to the backoff, unless
+        Looker sends a Retry-After header. Defaults to 0.5.
+        :type retry_delay: float
+        :param retry_max_delay: upper bound on the backoff in seconds. A call
+        whose Retry-After header asks for longer is not retried. Defaults to
+        30.
+        :type retry_max_delay: float
+        :param rate_limiter: limits the rate of calls made through the hook.
+        Defaults to the limiter shared by every hook on the connection when
+        its extra sets `rate_limit`, otherwise calls are not limited.
+        :type rate_limiter: airflow_looker.hooks.rate_limiter.RateLimiter
+        :param response_cache: read-through cache for GET calls. Defaults to
+        the cache shared by every hook on the connection when its extra sets
+        `response_cache_ttl`, otherwise responses are not cached.
+        :type response_cache: airflow_looker.hooks.response_cache.ResponseCache
+        :param metrics: sink for request, login, retry and cache metrics and
+        spans. Defaults to the sink configured by the connection extra's
+        `metrics` and `tracing`, otherwise metrics are discarded.
+        :type metrics: airflow_looker.hooks.metrics.MetricsSink
+        :param log_max_length: number of characters of a request or error
+        response payload written to the logs, after redacting secrets.
+        None logs whole payloads. Defaults to 1000.
+        :type log_max_length: int
+        :param replica_conn_ids: connections to other Looker instances, i.e. a
+        read replica, that reads are spread across. Writes always go to
+        `looker_conn_id`. Defaults to the connection extra's
+        `replica_conn_ids`, otherwise every call goes to `looker_conn_id`.
+        :type replica_conn_ids: list
+        :param routing: how reads are spread across the instances,
+        `round_robin` or `least_latency`. Defaults to the connection extra's
+        `routing`, otherwise `round_robin`.
+        :type routing: str
         """
         self.looker_conn_id = looker_conn_id
         self.verify = verify
         self.api_endpoint = None
+        self.token_cache = token_cache
+        self.pool_maxsize = pool_maxsize
+        self.retry_limit = retry_limit
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.metrics = metrics
+        self.log_max_length = log_max_length
+        self.payload_sampler = None
+        self.replica_conn_ids = replica_conn_ids
+        self.routing = routing
+        self.health = None
+        self._router = None
+        self._replicas = None
+        self._replicas_lock = threading.Lock()
+        self._conn = None
+        self._session = None
+        self._session_lock = threading.Lock()
 
-    def get_conn(self):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the hook's HTTP session and its pooled connections
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+        for replica in self._replicas or []:
+            replica.close()
+
+    def _get_session(self):
         """
-        Returns http session for use with requests
+        Returns the hook's long-lived session, creating it on first use
         """
+        # threads sharing the hook must not each create, and leak, a session
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _get_looker_connection(self):
+        """
+        Fetches and validates the Airflow connection, once per hook
+        """
+        if self._conn is not None:
+            return self._conn
+
         conn = self.get_connection(self.looker_conn_id)
 
         if conn.host is None:
             _message = "Failed to initialize looker airflow connector, connection host not provided"
-            self.logger.error(_message)
+            self.log.error(_message)
             raise AirflowException(_message)
 
         if conn.login is None:
             _message = "Failed to initialize looker Airflow connector, connection login not provided"
-            self.logger.error(_message)
+            self.log.error(_message)
             raise AirflowException(_message)
 
         if conn.password is None:
             _message = "Failed to initialize looker Airflow connector, connection password not provided"
-            self.logger.error(_message)
+            self.log.error(_message)
             raise AirflowException(_message)
 
-        session = requests.Session()
+        if self.token_cache is None:
+            token_cache_path = conn.extra_dejson.get('token_cache_path')
+            if token_cache_path:
+                self.token_cache = _file_token_caches.setdefault(token_cache_path,
+                                                                 FileTokenCache(token_cache_path))
+            else:
+                self.token_cache = default_token_cache
+
+        if self.rate_limiter is None and conn.extra_dejson.get('rate_limit'):
+            self.rate_limiter = get_rate_limiter(self.looker_conn_id,
+                                                 rate=float(conn.extra_dejson['rate_limit']),
+                                                 burst=conn.extra_dejson.get('rate_limit_burst'),
+                                                 path=conn.extra_dejson.get('rate_limit_path'))
+
+        if self.metrics is None:
+            self.metrics = get_metrics_sink(conn.extra_dejson)
+
+        if self.response_cache is None and conn.extra_dejson.get('response_cache_ttl'):
+            self.response_cache = get_response_cache(self.looker_conn_id,
+                                                     ttl=float(conn.extra_dejson['response_cache_ttl']),
+                                                     max_entries=conn.extra_dejson.get('response_cache_max_entries'),
+                                                     path=conn.extra_dejson.get('response_cache_path'))
+
+        if conn.extra_dejson.get('payload_log_path'):
+            self.payload_sampler = PayloadSampler(conn.extra_dejson['payload_log_path'],
+                                                  float(conn.extra_dejson.get('payload_log_sample_rate', 1.0)))
+
+        if self.replica_conn_ids is None:
+            replica_conn_ids = conn.extra_dejson.get('replica_conn_ids') or []
+            if isinstance(replica_conn_ids, str):
+                replica_conn_ids = [conn_id.strip() for conn_id in replica_conn_ids.split(',') if conn_id.strip()]
+            self.replica_conn_ids = list(replica_conn_ids)
+
+        if self.routing is None:
+            self.routing = conn.extra_dejson.get('routing', 'round_robin')
+        if self.routing not in ROUTING_POLICIES:
+            _message = "Failed to initialize looker Airflow connector, routing must be one of {}".format(
+                ', '.join(ROUTING_POLICIES))
+            self.log.error(_message)
+            raise AirflowException(_message)
+        self._router = Router(self.routing)
+        self.health = get_instance_health(self.looker_conn_id,
+                                          error_rate=float(conn.extra_dejson.get('failover_error_rate', 0.5)),
+                                          cooldown=float(conn.extra_dejson.get('failover_cooldown', 30)))
 
         self.api_endpoint = conn.host
-        token_request = requests.post(
-            url=urljoin(self.api_endpoint, "login"),
-            data={
-                "client_id": conn.login,
-                "client_secret": conn.password
-            },
-            verify=self.verify,
-        )
-
-        token = token_request.json()["access_token"]
+        self._conn = conn
+        return conn
+
+    def _token_cache_key(self):
+        return self.token_cache.make_key(self.looker_conn_id, self.api_endpoint)
+
+    def login(self):
+        """
+        Logs in to Looker with the connection's API credentials
+        :return: tuple of the access token and its lifetime in seconds
+        """
+        conn = self._get_looker_connection()
+        self.log.info("Logging in to Looker at %s", self.api_endpoint)
+        with self.metrics.span('login', {'looker_conn_id': self.looker_conn_id}):
+            started_at = time.monotonic()
+            token_request = self._get_session().post(
+                url=urljoin(self.api_endpoint, "login"),
+                data={
+                    "client_id": conn.login,
+                    "client_secret": conn.password
+                },
+                # don't send a stale token along with the credentials
+                headers={"Authorization": None},
+                verify=self.verify,
+            )
+        tags = {'status': str(token_request.status_code)}
+        self.metrics.timing('login', time.monotonic() - started_at, tags)
+        self.metrics.incr('logins', tags=tags)
+        try:
+            token_request.raise_for_status()
+        except requests.exceptions.HTTPError:
+            _message = "Failed to log in to Looker: {}:{}".format(token_request.status_code, token_request.reason)
+            self.log.error(_message)
+            raise LookerApiError(_message, token_request.status_code)
+
+        payload = token_request.json()
+        return payload["access_token"], payload.get("expires_in")
+
+    def get_token(self):
+        """
+        Returns a Looker access token, logging in only if there is no cached
+        token for this connection or it is about to expire
+        """
+        self._get_looker_connection()
+        return self.token_cache.get_or_fetch(self._token_cache_key(), self.login)
+
+    def invalidate_token(self, token):
+        """
+        Drops `token` from the cache so that the next call logs in again
+        """
+        self._get_looker_connection()
+        self.token_cache.invalidate(self._token_cache_key(), token)
+
+    def get_conn(self):
+        """
+        Returns http session for use with requests. The same session, and
+        with it the pooled keep-alive connections, is returned on every call
+        until the hook is closed.
+        """
+        token = self.get_token()
+
+        session = self._get_session()
         headers = {"Authorization": "token " + token}
         session.headers.update(headers)
 
         return session
 
-    def call(self, method, endpoint, data, headers=None):
+    def _get_replicas(self):
         """
-        Call the Looker API and return results
+        Returns the hooks of the replica instances, creating them on first use
+        with the same settings as this hook
+        """
+        with self._replicas_lock:
+            if self._replicas is None:
+                replicas = []
+                for conn_id in self.replica_conn_ids:
+                    replica = LookerHook(looker_conn_id=conn_id,
+                                         verify=self.verify,
+                                         pool_maxsize=self.pool_maxsize,
+                                         retry_limit=self.retry_limit,
+                                         retry_delay=self.retry_delay,
+                                         retry_max_delay=self.retry_max_delay,
+                                         metrics=self.metrics,
+                                         log_max_length=self.log_max_length,
+                                         replica_conn_ids=[])
+                    replica._get_looker_connection()
+                    replicas.append(replica)
+                self._replicas = replicas
+            return self._replicas
+
+    @staticmethod
+    def _is_instance_failure(error):
+        """
+        Whether a failed call points at an unhealthy instance, rather than at
+        the request itself, so that it can be tried on another instance
+        """
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        if isinstance(error, LookerApiError) and error.status_code is not None:
+            return error.status_code >= 500 or error.status_code == 429
+        return False
+
+    def call(self, method, endpoint, data, headers=None, stream=False, retry=None, use_cache=True,
+             allow_replica=None):
+        """
+        Call the Looker API and return results. When the hook has replicas,
+        reads are spread across the instances by the routing policy and tried
+        on the next instance if one fails with a server error, throttling or
+        a connection error. Instances failing often are skipped for a while.
         :param method: the method of the call (`GET`, `POST`, etc)
         :type method: str
         :param endpoint: the endpoint to be called i.e. looks/run/1
@@ -75,9 +479,54 @@ class LookerHook(BaseHook):
         :type data: dict
         :param headers: additional headers to be passed through as a dictionary
         :type headers: dict
+        :param stream: if true the response body is not downloaded up front,
+        and the caller must consume or close the response. Defaults to false.
+        :type stream: boolean
+        :param retry: whether to retry on throttling, gateway errors and
+        connection errors. Defaults to retrying idempotent methods only; pass
+        true to retry other methods too.
+        :type retry: boolean
+        :param use_cache: whether a GET may be answered from the hook's
+        response cache, if it has one. Defaults to true.
+        :type use_cache: boolean
+        :param allow_replica: whether the call may be sent to a replica.
+        Defaults to true for GET and HEAD calls only; pass false for reads of
+        state that only the primary has, such as a query task it runs.
+        :type allow_replica: boolean
         """
+        self._get_looker_connection()
+        if not self.replica_conn_ids:
+            return self._call(method, endpoint, data, headers, stream, retry, use_cache)
 
-        session = self.get_conn()
+        if allow_replica is None:
+            allow_replica = method in READ_METHODS
+        if allow_replica:
+            instances = self._router.order([self] + self._get_replicas(), lambda instance: instance.health)
+        else:
+            instances = [self]
+
+        for i, instance in enumerate(instances):
+            started_at = time.monotonic()
+            try:
+                response = instance._call(method, endpoint, data, headers, stream, retry, use_cache)
+            except (requests.exceptions.RequestException, AirflowException) as e:
+                if not self._is_instance_failure(e):
+                    raise
+                instance.health.record_failure()
+                self.metrics.incr('instance_failures', tags={'looker_conn_id': instance.looker_conn_id})
+                if i == len(instances) - 1:
+                    raise
+                self.log.warning("Looker instance %s failed: %s. Failing over to %s",
+                                 instance.api_endpoint, e, instances[i + 1].api_endpoint)
+                continue
+            # for streamed responses this is the time until the headers arrived
+            instance.health.record_success(time.monotonic() - started_at)
+            return response
+
+    def _call(self, method, endpoint, data, headers=None, stream=False, retry=None, use_cache=True):
+        """
+        Calls this hook's own Looker instance, see `call`
+        """
         url = urljoin(self.api_endpoint, endpoint)
 
         req = None
@@ -99,22 +548,166 @@ class LookerHook(BaseHook):
                                    data=json.dumps(data),
                                    headers=headers)
 
-        prepped_request = session.prepare_request(req)
-        self.log.info("Sending '%s' to url: %s: %s", method, url, data)
-        response = session.send(prepped_request, verify=self.verify)
+        cache_key = None
+        cached = None
+        if method == 'GET' and not stream and use_cache and self.response_cache is not None:
+            cache_key = self.response_cache.make_key(self.looker_conn_id, req.prepare().url, headers)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None and self.response_cache.is_fresh(cached):
+                self.log.info("Using cached response for '%s' to url: %s: %s", method, url,
+                              LogPayload(data, self.log_max_length))
+                self.metrics.incr('cache_hits', tags=self._metric_tags(req))
+                return self._cached_response(cached, req)
+            etag = CaseInsensitiveDict(cached['headers']).get('ETag') if cached is not None else None
+            if etag:
+                req.headers = dict(headers or {}, **{'If-None-Match': etag})
+
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+
+        token = self.get_token()
+        session = self._get_session()
+        self.log.info("Sending '%s' to url: %s: %s", method, url, LogPayload(data, self.log_max_length))
+        response = self._send_with_retries(session, req, token, stream, retry)
+
+        if response.status_code == 401:
+            # The cached token has expired or been revoked; log in once more
+            self.log.info("Looker rejected the access token, logging in again")
+            response.close()
+            self.invalidate_token(token)
+            token = self.get_token()
+            response = self._send_with_retries(session, req, token, stream, retry)
+
+        if self.payload_sampler is not None:
+            self.payload_sampler.sample(method, url, response.status_code, data,
+                                        None if stream else response.content)
+
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError:
             self.log.error("HTTP error: %s", response.reason)
-            self.log.error(response.text)
-            raise AirflowException(str(response.status_code) + ":" + response.reason)
+            self.log.error("%s", LogPayload(response.content, self.log_max_length))
+            raise LookerApiError(str(response.status_code) + ":" + response.reason, response.status_code)
+
+        if cache_key is not None:
+            if response.status_code == 304 and cached is not None:
+                self.log.info("Cached response for %s is still valid", url)
+                self.response_cache.touch(cache_key)
+                return self._cached_response(cached, req)
+            if response.status_code == 200:
+                self.response_cache.set(cache_key, response.status_code, response.headers, response.content)
+        return response
+
+    @staticmethod
+    def _cached_response(cached, req):
+        """
+        Builds a `requests.Response` from a response cache entry
+        """
+        response = requests.Response()
+        response.status_code = cached['status_code']
+        response.headers = CaseInsensitiveDict(cached['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = cached['content']
+        response.reason = 'OK'
+        response.url = req.prepare().url
+        response.request = req.prepare()
+        return response
+
+    def _send_with_retries(self, session, req, token, stream, retry):
+        """
+        Sends `req`, retrying with exponential backoff and jitter while Looker
+        is throttling or unavailable, or the connection fails
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self._send(session, req, token, stream)
+            except requests.exceptions.ConnectionError as e:
+                if not retry or attempt >= self.retry_limit:
+                    raise
+                delay = self._get_retry_delay(attempt)
+                self.log.warning("Connection error calling %s: %s. Retrying in %.2fs", req.url, e, delay)
+            else:
+                if not retry or attempt >= self.retry_limit or response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                delay = self._get_retry_delay(attempt, response)
+                if delay is None:
+                    self.log.warning("Looker returned %s for %s and asked to retry after more than %ss, giving up",
+                                     response.status_code, req.url, self.retry_max_delay)
+                    return response
+                self.log.warning("Looker returned %s for %s. Retrying in %.2fs",
+                                 response.status_code, req.url, delay)
+                response.close()
+            self.metrics.incr('retries', tags=self._metric_tags(req))
+            time.sleep(delay)
+            attempt += 1
+
+    def _get_retry_delay(self, attempt, response=None):
+        """
+        Returns the number of seconds to wait before the next retry, following
+        the response's Retry-After header if it has one. Returns None if the
+        header asks for more than `retry_max_delay`, as retrying sooner would
+        only be throttled again.
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        delay = None
+        if retry_after:
+            try:
+                delay = max(0, float(retry_after))
+            except ValueError:
+                try:
+                    delay = max(0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        if delay is not None:
+            return delay if delay <= self.retry_max_delay else None
+        return random.uniform(0, min(self.retry_max_delay, self.retry_delay * 2 ** attempt))
+
+    def _send(self, session, req, token, stream=False):
+        """
+        Sends `req` with the given access token. The token is set on the
+        request rather than read from the shared session headers, which other
+        threads using the hook may be refreshing at the same time.
+        """
+        tags = self._metric_tags(req)
+        if self.rate_limiter is not None:
+            waiting_since = time.monotonic()
+            self.rate_limiter.acquire()
+            self.metrics.timing('rate_limit_wait', time.monotonic() - waiting_since, tags)
+        prepped_request = session.prepare_request(req)
+        prepped_request.headers["Authorization"] = "token " + token
+
+        with self.metrics.span('request', tags):
+            started_at = time.monotonic()
+            try:
+                response = session.send(prepped_request, verify=self.verify, stream=stream)
+            except requests.exceptions.RequestException as e:
+                self.metrics.incr('request_errors', tags=dict(tags, error=type(e).__name__))
+                raise
+
+        # for streamed responses this is the time until the headers arrived
+        tags['status'] = str(response.status_code)
+        self.metrics.timing('request', time.monotonic() - started_at, tags)
+        self.metrics.incr('requests', tags=tags)
+        size = response.headers.get('Content-Length')
+        if size is None and not stream:
+            size = len(response.content)
+        if size:
+            self.metrics.incr('response_bytes', int(size), tags)
         return response
 
-    def get_look_sql(self, look_id=None):
+    @staticmethod
+    def _metric_tags(req):
+        return {'endpoint': endpoint_template(urlparse(req.url).path), 'method': req.method}
+
+    def get_look_sql(self, look_id=None, use_cache=True):
         """
         Gets a SQL query from a Looker look resource
         :param look_id: unique identifier for a look resource
         :type look_id: int
+        :param use_cache: whether the response may come from the hook's
+        response cache, if it has one. Defaults to true.
+        :type use_cache: boolean
         :return: sql string
         """
         if look_id is None:
@@ -124,10 +717,455 @@ class LookerHook(BaseHook):
 
         endpoint = '{}/{}/run/{}'.format('api/3.0/looks', look_id, 'sql')
         self.log.info("Fetching looker %s query", endpoint)
-        response = self.call(method='GET', endpoint=endpoint, data=None)
+        response = self.call(method='GET', endpoint=endpoint, data=None, use_cache=use_cache)
 
         if response.status_code > 200:
             _message = 'Failed to fetch query {}'.format(response.reason)
             self.log.error(_message)
             raise AirflowException(_message)
         return response.text
+
+    @staticmethod
+    def _get_params(params, fields, record):
+        """
+        Adds the `fields` projection to the request parameters, defaulting to
+        the record's fields
+        """
+        params = dict(params or {})
+        if fields is None and record is not None:
+            fields = record.fields()
+        if fields:
+            params['fields'] = fields if isinstance(fields, str) else ','.join(fields)
+        return params
+
+    def get_json(self, endpoint, fields=None, params=None, record=None, use_cache=True):
+        """
+        Calls a Looker GET endpoint and decodes the JSON response
+        :param endpoint: the endpoint to be called i.e. api/3.0/looks/1
+        :type endpoint: str
+        :param fields: fields to return i.e. `['id', 'title']`. Defaults to
+        the fields of `record`, if given, otherwise all fields.
+        :type fields: list
+        :param params: additional request parameters
+        :type params: dict
+        :param record: `Record` subclass to decode each object into instead
+        of a dict, see `airflow_looker.hooks.records`. Records are decoded
+        from the response stream, which is never cached.
+        :type record: type
+        :param use_cache: whether the response may come from the hook's
+        response cache, if it has one. Defaults to true.
+        :type use_cache: boolean
+        :return: the decoded object, or list of objects
+        """
+        params = self._get_params(params, fields, record)
+        if record is None:
+            return self.call(method='GET', endpoint=endpoint, data=params, use_cache=use_cache).json()
+
+        # decode a list one item at a time as the chunks arrive, so only the
+        # records are kept rather than the whole body, its text and the dicts
+        response = self.call(method='GET', endpoint=endpoint, data=params, stream=True)
+        with response:
+            chunks = response.iter_content(chunk_size=64 * 1024)
+            first_chunk = b''
+            for first_chunk in chunks:
+                if first_chunk.strip():
+                    break
+            chunks = itertools.chain([first_chunk], chunks)
+            if first_chunk.lstrip().startswith(b'['):
+                return [record.from_dict(item) for item in iter_json_array(chunks)]
+            return record.from_dict(json.loads(b''.join(chunks).decode('utf-8')))
+
+    def get_look(self, look_id, fields=None, record=None, use_cache=True):
+        """
+        Gets a look's definition
+        :param look_id: unique identifier for a look resource
+        :type look_id: int
+        :param fields: fields to return. Defaults to all fields, or those of
+        `record` if given.
+        :type fields: list
+        :param record: `Record` subclass to decode the look into, i.e.
+        `airflow_looker.hooks.records.Look`
+        :type record: type
+        :param use_cache: whether the response may come from the hook's
+        response cache, if it has one. Defaults to true.
+        :type use_cache: boolean
+        """
+        endpoint = '{}/{}'.format('api/3.0/looks', look_id)
+        return self.get_json(endpoint, fields=fields, record=record, use_cache=use_cache)
+
+    def get_dashboard(self, dashboard_id, fields=None, record=None, use_cache=True):
+        """
+        Gets a dashboard's definition
+        :param dashboard_id: unique identifier for a dashboard resource
+        :type dashboard_id: int or str
+        :param fields: fields to return. Defaults to all fields, or those of
+        `record` if given.
+        :type fields: list
+        :param record: `Record` subclass to decode the dashboard into, i.e.
+        `airflow_looker.hooks.records.Dashboard`
+        :type record: type
+        :param use_cache: whether the response may come from the hook's
+        response cache, if it has one. Defaults to true.
+        :type use_cache: boolean
+        """
+        endpoint = '{}/{}'.format('api/3.0/dashboards', dashboard_id)
+        return self.get_json(endpoint, fields=fields, record=record, use_cache=use_cache)
+
+    def iter_pages(self, endpoint, page_size=100, fields=None, params=None, prefetch=True, record=None,
+                   use_cache=True):
+        """
+        Lazily iterates over the pages of a Looker list endpoint that supports
+        `limit` and `offset`, i.e. `looks/search`. While a page is being
+        processed the next one is fetched in the background. Raises an
+        AirflowException if the endpoint ignores `limit` or `offset`.
+        :param endpoint: the endpoint to be called i.e. api/3.0/looks/search
+        :type endpoint: str
+        :param page_size: number of items requested per page. Defaults to 100.
+        :type page_size: int
+        :param fields: fields to return for each item i.e. `['id', 'title']`.
+        Defaults to the fields of `record`, if given, otherwise all fields.
+        :type fields: list
+        :param params: additional request parameters
+        :type params: dict
+        :param prefetch: whether to fetch the next page in the background.
+        Defaults to true.
+        :type prefetch: boolean
+        :param record: `Record` subclass to decode each item into instead of a
+        dict
+        :type record: type
+        :param use_cache: whether the response may come from the hook's
+        response cache, if it has one. Defaults to true.
+        :type use_cache: boolean
+        :return: generator of lists of items
+        """
+        params = self._get_params(params, fields, record)
+
+        def fetch(offset):
+            page_params = dict(params, limit=page_size, offset=offset)
+            return self.get_json(endpoint, params=page_params, record=record, use_cache=use_cache)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offset = 0
+            page = fetch(offset)
+            previous_page = None
+            while page:
+                # an endpoint ignoring limit and offset would otherwise return
+                # the same page forever
+                if len(page) > page_size or page == previous_page:
+                    _message = "{} does not page with limit and offset, use get_json instead".format(endpoint)
+                    self.log.error(_message)
+                    raise AirflowException(_message)
+                previous_page = page
+                offset += page_size
+                last_page = len(page) < page_size
+                next_page = None
+                if not last_page and prefetch:
+                    next_page = executor.submit(fetch, offset)
+                yield page
+                if last_page:
+                    return
+                page = next_page.result() if next_page is not None else fetch(offset)
+
+    def iter_items(self, endpoint, page_size=100, fields=None, params=None, prefetch=True, record=None,
+                   use_cache=True):
+        """
+        Lazily iterates over the items of a Looker list endpoint, one page at a
+        time. Takes the same arguments as `iter_pages`.
+        :return: generator of items
+        """
+        pages = self.iter_pages(endpoint, page_size=page_size, fields=fields, params=params, prefetch=prefetch,
+                                record=record, use_cache=use_cache)
+        for page in pages:
+            for item in page:
+                yield item
+
+    def download_look(self, look_id, result_format, path_or_fileobj, chunk_size=1024 * 1024, params=None,
+                      row_counter=None):
+        """
+        Runs a look and streams the results to a file without holding them in
+        memory
+        :param look_id: unique identifier for a look resource
+        :type look_id: int
+        :param result_format: format of the results i.e. `csv`, `json`, `txt`,
+        or `jsonl` to convert Looker's `json` results to one JSON object per
+        line on the fly
+        :type result_format: str
+        :param path_or_fileobj: path of the local file to write, or a binary
+        file-like object
+        :type path_or_fileobj: str or file
+        :param chunk_size: number of bytes read from the response at a time.
+        Defaults to 1MB.
+        :type chunk_size: int
+        :param params: additional request parameters i.e. `limit`
+        :type params: dict
+        :param row_counter: fed every chunk written, to count the rows while
+        they stream in
+        :type row_counter: RowCounter
+        :return: number of bytes written
+        """
+        json_lines = result_format == 'jsonl'
+        endpoint = '{}/{}/run/{}'.format('api/3.0/looks', look_id, 'json' if json_lines else result_format)
+        self.log.info("Downloading looker %s results", endpoint)
+        response = self.call(method='GET', endpoint=endpoint, data=params, stream=True)
+        size = self._stream_to(response, path_or_fileobj, chunk_size, json_lines, row_counter)
+        self.log.info("Downloaded %s bytes from %s", size, endpoint)
+        return size
+
+    def get_look_query_id(self, look_id):
+        """
+        Gets the ID of the query behind a look
+        :param look_id: unique identifier for a look resource
+        :type look_id: int
+        :return: query ID
+        """
+        return self.get_look(look_id, fields=['query_id'])['query_id']
+
+    def create_query_task(self, query_id, result_format='csv'):
+        """
+        Starts running a query asynchronously
+        :param query_id: unique identifier for a query resource
+        :type query_id: int
+        :param result_format: format of the results i.e. `csv`, `json`
+        :type result_format: str
+        :return: query task ID
+        """
+        body = {
+            'query_id': query_id,
+            'result_format': result_format
+        }
+        response = self.call(method='POST', endpoint='api/3.0/query_tasks', data=body)
+        query_task_id = response.json()['id']
+        self.log.info("Created query task %s for query %s", query_task_id, query_id)
+        return query_task_id
+
+    def get_query_task_status(self, query_task_id):
+        """
+        Gets the status of a query task i.e. `running`, `complete` or `error`
+        :param query_task_id: unique identifier for a query task
+        :type query_task_id: str
+        :return: status string
+        """
+        endpoint = '{}/{}'.format('api/3.0/query_tasks', query_task_id)
+        # query tasks only exist on the instance running them
+        response = self.call(method='GET', endpoint=endpoint, data={'fields': 'id,status'}, use_cache=False,
+                             allow_replica=False)
+        return response.json()['status']
+
+    def check_query_task(self, query_task_id):
+        """
+        Checks whether a query task has finished
+        :param query_task_id: unique identifier for a query task
+        :type query_task_id: str
+        :return: true if the query task is complete, false if it is still running
+        """
+        status = self.get_query_task_status(query_task_id)
+        if status in QUERY_TASK_FAILED_STATUSES:
+            _message = "Query task {} finished with status {}".format(query_task_id, status)
+            self.log.error(_message)
+            raise AirflowException(_message)
+        return status == QUERY_TASK_COMPLETE
+
+    def wait_for_query_task(self, query_task_id, poll_interval=1, max_poll_interval=30, timeout=None):
+        """
+        Polls a query task until it completes, backing off exponentially
+        between polls
+        :param query_task_id: unique identifier for a query task
+        :type query_task_id: str
+        :param poll_interval: seconds to wait before the second poll. Doubles
+        after every poll. Defaults to 1.
+        :type poll_interval: float
+        :param max_poll_interval: upper bound on the wait between polls.
+        Defaults to 30.
+        :type max_poll_interval: float
+        :param timeout: seconds after which to give up, or None to wait
+        indefinitely
+        :type timeout: float
+        """
+        started_at = time.monotonic()
+        while not self.check_query_task(query_task_id):
+            if timeout is not None and time.monotonic() - started_at + poll_interval > timeout:
+                _message = "Timed out waiting for query task {}".format(query_task_id)
+                self.log.error(_message)
+                raise AirflowException(_message)
+            self.log.info("Query task %s is still running, checking again in %ss", query_task_id, poll_interval)
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+
+    def get_query_task_results(self, query_task_id, path_or_fileobj=None, chunk_size=1024 * 1024):
+        """
+        Fetches the results of a completed query task
+        :param query_task_id: unique identifier for a query task
+        :type query_task_id: str
+        :param path_or_fileobj: path of a local file, or a binary file-like
+        object, to stream the results to. If not provided the results are
+        returned as a string.
+        :type path_or_fileobj: str or file
+        :param chunk_size: number of bytes read from the response at a time
+        when streaming. Defaults to 1MB.
+        :type chunk_size: int
+        :return: the results, or the number of bytes written
+        """
+        endpoint = '{}/{}/results'.format('api/3.0/query_tasks', query_task_id)
+        if path_or_fileobj is None:
+            return self.call(method='GET', endpoint=endpoint, data=None, use_cache=False, allow_replica=False).text
+        response = self.call(method='GET', endpoint=endpoint, data=None, stream=True, allow_replica=False)
+        return self._stream_to(response, path_or_fileobj, chunk_size)
+
+    def create_dashboard_render_task(self, dashboard_id, result_format='pdf', width=1280, height=720,
+                                     dashboard_style=None, dashboard_filters=None, params=None):
+        """
+        Starts rendering a dashboard to a file
+        :param dashboard_id: unique identifier for a dashboard resource
+        :type dashboard_id: int or str
+        :param result_format: format of the file i.e. `pdf`, `png` or `jpg`
+        :type result_format: str
+        :param width: width of the rendered dashboard in pixels
+        :type width: int
+        :param height: height of the rendered dashboard in pixels
+        :type height: int
+        :param dashboard_style: `tiled` or `single_column`. Defaults to the
+        dashboard's own layout.
+        :type dashboard_style: str
+        :param dashboard_filters: filters to apply, as a query string i.e.
+        `Region=West&Date=7 days`
+        :type dashboard_filters: str
+        :param params: additional request parameters i.e. `pdf_paper_size`
+        :type params: dict
+        :return: render task ID
+        """
+        query = dict(params or {}, width=width, height=height)
+        endpoint = '{}/{}/{}?{}'.format('api/3.0/render_tasks/dashboards', dashboard_id, result_format,
+                                        urlencode(sorted(query.items())))
+        body = {}
+        if dashboard_style is not None:
+            body['dashboard_style'] = dashboard_style
+        if dashboard_filters is not None:
+            body['dashboard_filters'] = dashboard_filters
+        response = self.call(method='POST', endpoint=endpoint, data=body)
+        render_task_id = response.json()['id']
+        self.log.info("Created render task %s for dashboard %s", render_task_id, dashboard_id)
+        return render_task_id
+
+    def get_render_task_status(self, render_task_id):
+        """
+        Gets the status of a render task i.e. `rendering`, `success` or
+        `failure`
+        :param render_task_id: unique identifier for a render task
+        :type render_task_id: str
+        :return: status string
+        """
+        endpoint = '{}/{}'.format('api/3.0/render_tasks', render_task_id)
+        # render tasks only exist on the instance running them
+        response = self.call(method='GET', endpoint=endpoint, data={'fields': 'id,status'}, use_cache=False,
+                             allow_replica=False)
+        return response.json()['status']
+
+    def check_render_task(self, render_task_id):
+        """
+        Checks whether a render task has finished
+        :param render_task_id: unique identifier for a render task
+        :type render_task_id: str
+        :return: true if the render task succeeded, false if it is still running
+        """
+        status = self.get_render_task_status(render_task_id)
+        if status in RENDER_TASK_FAILED_STATUSES:
+            _message = "Render task {} finished with status {}".format(render_task_id, status)
+            self.log.error(_message)
+            raise AirflowException(_message)
+        return status == RENDER_TASK_COMPLETE
+
+    def get_render_task_results(self, render_task_id, path_or_fileobj=None, chunk_size=1024 * 1024):
+        """
+        Fetches the file rendered by a successful render task
+        :param render_task_id: unique identifier for a render task
+        :type render_task_id: str
+        :param path_or_fileobj: path of a local file, or a binary file-like
+        object, to stream the file to. If not provided the file is returned
+        as bytes.
+        :type path_or_fileobj: str or file
+        :param chunk_size: number of bytes read from the response at a time
+        when streaming. Defaults to 1MB.
+        :type chunk_size: int
+        :return: the file's content, or the number of bytes written
+        """
+        endpoint = '{}/{}/results'.format('api/3.0/render_tasks', render_task_id)
+        if path_or_fileobj is None:
+            return self.call(method='GET', endpoint=endpoint, data=None, use_cache=False,
+                             allow_replica=False).content
+        response = self.call(method='GET', endpoint=endpoint, data=None, stream=True, allow_replica=False)
+        return self._stream_to(response, path_or_fileobj, chunk_size)
+
+    def get_derived_table_graph(self, model_name):
+        """
+        Gets the dependencies between the derived tables of a model. Uses
+        Looker API 4.0, the 3.x APIs don't expose derived tables.
+        :param model_name: name of the LookML model
+        :type model_name: str
+        :return: dictionary of derived table name to the set of derived
+        tables it is built from
+        """
+        endpoint = '{}/{}'.format('api/4.0/derived_table/graph/model', model_name)
+        graph_text = self.call(method='GET', endpoint=endpoint, data=None).json()['graph_text']
+
+        dependencies = {}
+        for upstream, downstream in _DOT_EDGE.findall(graph_text):
+            dependencies.setdefault(upstream, set())
+            dependencies.setdefault(downstream, set()).add(upstream)
+        return dependencies
+
+    def start_pdt_build(self, model_name, view_name, force_rebuild=True):
+        """
+        Starts rebuilding a persistent derived table
+        :param model_name: name of the LookML model
+        :type model_name: str
+        :param view_name: name of the view defining the derived table
+        :type view_name: str
+        :param force_rebuild: rebuild even if the table is up to date.
+        Defaults to true.
+        :type force_rebuild: boolean
+        :return: materialization ID of the build
+        """
+        endpoint = '{}/{}/{}/start'.format('api/4.0/derived_table', model_name, view_name)
+        params = {'force_rebuild': 'true' if force_rebuild else 'false', 'source': 'airflow'}
+        # this GET starts a build, so it must not be retried
+        response = self.call(method='GET', endpoint=endpoint, data=params, retry=False, use_cache=False,
+                             allow_replica=False)
+        materialization_id = response.json()['materialization_id']
+        self.log.info("Started build %s of %s.%s", materialization_id, model_name, view_name)
+        return materialization_id
+
+    def get_pdt_build_status(self, materialization_id):
+        """
+        Gets the status of a derived table build i.e. `running` or `complete`
+        :param materialization_id: materialization ID returned by
+        `start_pdt_build`
+        :type materialization_id: str
+        :return: status string
+        """
+        endpoint = '{}/{}/status'.format('api/4.0/derived_table', materialization_id)
+        response = self.call(method='GET', endpoint=endpoint, data=None, use_cache=False, allow_replica=False)
+        resp_text = response.json().get('resp_text') or '{}'
+        try:
+            return json.loads(resp_text).get('status', 'running')
+        except ValueError:
+            return resp_text.strip().lower()
+
+    def _stream_to(self, response, path_or_fileobj, chunk_size, json_lines=False, row_counter=None):
+        with response:
+            if hasattr(path_or_fileobj, 'write'):
+                return self._write_chunks(response, path_or_fileobj, chunk_size, json_lines, row_counter)
+            with open(path_or_fileobj, 'wb') as f:
+                return self._write_chunks(response, f, chunk_size, json_lines, row_counter)
+
+    @staticmethod
+    def _write_chunks(response, fileobj, chunk_size, json_lines=False, row_counter=None):
+        chunks = response.iter_content(chunk_size=chunk_size)
+        if json_lines:
+            chunks = ((json.dumps(item) + '\n').encode('utf-8') for item in iter_json_array(chunks))
+        size = 0
+        for chunk in chunks:
+            fileobj.write(chunk)
+            size += len(chunk)
+            if row_counter is not None:
+                row_counter.update(chunk)
+        return size
@@ -0,0 +1,169 @@
+import re
+import threading
+from contextlib import contextmanager
+
+# an ID-like path segment: a number, or a long hex/UUID such as a query task ID
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F-]{16,})$')
+_API_PREFIX = re.compile(r'^(/?api/[\d.]+/)+')
+
+
+def endpoint_template(endpoint):
+    """
+    Turns an endpoint into a low-cardinality template for metric tags, i.e.
+    `api/3.0/looks/42/run/csv` into `looks/{id}/run/{fmt}`
+    """
+    segments = _API_PREFIX.sub('', endpoint.split('?')[0]).strip('/').split('/')
+    template = []
+    for i, segment in enumerate(segments):
+        if i > 0 and segments[i - 1] == 'run':
+            template.append('{fmt}')
+        elif _ID_SEGMENT.match(segment):
+            template.append('{id}')
+        else:
+            template.append(segment)
+    return '/'.join(template)
+
+
+class MetricsSink(object):
+    """
+    Receives the hook's metrics. The base class discards them; subclasses
+    override `incr`, `timing` and, for tracing, `span`.
+
+    Metric names are relative, i.e. `request`, and tags are a dictionary such
+    as `{'endpoint': 'looks/{id}', 'method': 'GET', 'status': '200'}`.
+    """
+    def incr(self, name, count=1, tags=None):
+        pass
+
+    def timing(self, name, seconds, tags=None):
+        pass
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        yield
+
+
+class TaggedNameSink(MetricsSink):
+    """
+    Base for sinks without tag support, which fold the tags into the metric
+    name, i.e. `looker.request.looks_id.GET.200`
+    """
+    def __init__(self, prefix='looker'):
+        self.prefix = prefix
+
+    def _name(self, name, tags):
+        parts = [self.prefix, name] if self.prefix else [name]
+        for key in sorted(tags or {}):
+            parts.append(re.sub(r'[^\w-]+', '_', str(tags[key])).strip('_'))
+        return '.'.join(parts)
+
+
+class StatsdSink(TaggedNameSink):
+    """
+    Sends metrics to StatsD. Requires the `statsd` package.
+    """
+    def __init__(self, host='localhost', port=8125, prefix='looker', client=None):
+        super(StatsdSink, self).__init__(prefix=prefix)
+        if client is None:
+            from statsd import StatsClient
+            client = StatsClient(host=host, port=port)
+        self.client = client
+
+    def incr(self, name, count=1, tags=None):
+        self.client.incr(self._name(name, tags), count)
+
+    def timing(self, name, seconds, tags=None):
+        self.client.timing(self._name(name, tags), seconds * 1000)
+
+
+class AirflowStatsSink(TaggedNameSink):
+    """
+    Sends metrics through Airflow's `Stats` facade, i.e. to whichever StatsD
+    or OpenTelemetry backend the Airflow deployment is configured with.
+    """
+    def incr(self, name, count=1, tags=None):
+        from airflow.stats import Stats
+        Stats.incr(self._name(name, tags), count)
+
+    def timing(self, name, seconds, tags=None):
+        from datetime import timedelta
+        from airflow.stats import Stats
+        Stats.timing(self._name(name, tags), timedelta(seconds=seconds))
+
+
+class InMemorySink(MetricsSink):
+    """
+    Keeps metrics and spans in memory, i.e. for tests
+    """
+    def __init__(self):
+        self.counters = []
+        self.timings = []
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def incr(self, name, count=1, tags=None):
+        with self._lock:
+            self.counters.append((name, count, dict(tags or {})))
+
+    def timing(self, name, seconds, tags=None):
+        with self._lock:
+            self.timings.append((name, seconds, dict(tags or {})))
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        with self._lock:
+            self.spans.append((name, dict(attributes or {})))
+        yield
+
+    def count(self, name, **tags):
+        """
+        Returns the total of a counter, optionally only for the given tags
+        """
+        return sum(count for counter, count, counter_tags in self.counters
+                   if counter == name and all(counter_tags.get(key) == value for key, value in tags.items()))
+
+
+class TracingSink(MetricsSink):
+    """
+    Wraps another sink and additionally records OpenTelemetry spans around
+    logins and requests. Requires the `opentelemetry-api` package.
+    """
+    def __init__(self, sink=None, tracer=None):
+        self.sink = sink or MetricsSink()
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer('airflow_looker')
+        self.tracer = tracer
+
+    def incr(self, name, count=1, tags=None):
+        self.sink.incr(name, count, tags)
+
+    def timing(self, name, seconds, tags=None):
+        self.sink.timing(name, seconds, tags)
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        with self.sink.span(name, attributes):
+            with self.tracer.start_as_current_span('looker.' + name, attributes=attributes or {}):
+                yield
+
+
+def get_metrics_sink(extra):
+    """
+    Builds the sink configured by a connection's extra: `metrics` set to
+    `airflow` or `statsd` (with `statsd_host` and `statsd_port`), an optional
+    `metrics_prefix`, and `tracing` to add OpenTelemetry spans
+    """
+    prefix = extra.get('metrics_prefix', 'looker')
+    backend = extra.get('metrics')
+    if backend == 'statsd':
+        sink = StatsdSink(host=extra.get('statsd_host', 'localhost'),
+                          port=int(extra.get('statsd_port', 8125)),
+                          prefix=prefix)
+    elif backend == 'airflow':
+        sink = AirflowStatsSink(prefix=prefix)
+    else:
+        sink = MetricsSink()
+    if extra.get('tracing'):
+        sink = TracingSink(sink)
+    return sink
@@ -0,0 +1,116 @@
+import json
+import random
+import re
+import threading
+import time
+
+# values of these keys are replaced with `***`, whether they appear in JSON,
+# form or query string payloads. Quoted values run to the closing unescaped
+# quote, or to the end of a truncated payload, bare ones to the next separator.
+_SECRET = re.compile(
+    r'''(?i)(["']?[\w-]*(?:password|secret|token|authorization|api_key|credential)[\w-]*["']?\s*[:=]\s*)'''
+    r'''(?:(["'])(?:(?!\2)[^\\]|\\.)*(?:\2|\\?$)|[^"'&,\s}\]]+)''')
+
+
+def _redact_match(match):
+    quote = match.group(2) or ''
+    return match.group(1) + quote + '***' + quote
+
+
+def redact(text):
+    """
+    Replaces the values of secret-looking keys in `text`, i.e. the access
+    token in `{"access_token": "abc"}`, with `***`
+    """
+    return _SECRET.sub(_redact_match, text)
+
+
+def format_payload(payload, max_length=1000):
+    """
+    Renders a request or response payload for the logs, redacted and cut to
+    `max_length` characters. Only the part that is kept is rendered, so
+    logging a large payload costs no more than logging a small one.
+    :param payload: the payload, as bytes, a string or a JSON serializable
+    object
+    :param max_length: number of characters kept, or None to keep the whole
+    payload
+    :type max_length: int
+    """
+    if payload is None:
+        return 'None'
+
+    suffix = ''
+    if isinstance(payload, (bytes, str)):
+        if max_length is not None and len(payload) > max_length:
+            suffix = '... ({} more {})'.format(len(payload) - max_length,
+                                               'bytes' if isinstance(payload, bytes) else 'characters')
+            payload = payload[:max_length]
+        text = payload.decode('utf-8', 'replace') if isinstance(payload, bytes) else payload
+    else:
+        chunks = []
+        length = 0
+        for chunk in json.JSONEncoder(default=str).iterencode(payload):
+            chunks.append(chunk)
+            length += len(chunk)
+            if max_length is not None and length > max_length:
+                suffix = '... (truncated)'
+                break
+        text = ''.join(chunks)
+        if suffix:
+            text = text[:max_length]
+    return redact(text) + suffix
+
+
+class LogPayload(object):
+    """
+    Log argument rendering a payload with `format_payload` only when the
+    record is emitted, i.e.
+
+        self.log.info("Sending %s", LogPayload(data))
+
+    costs nothing if INFO is disabled.
+    """
+    __slots__ = ('payload', 'max_length')
+
+    def __init__(self, payload, max_length=1000):
+        self.payload = payload
+        self.max_length = max_length
+
+    def __str__(self):
+        return format_payload(self.payload, self.max_length)
+
+
+class PayloadSampler(object):
+    """
+    Appends the full, redacted request and response payloads of a sample of
+    calls to a JSON lines file, to debug calls whose logs are truncated
+    """
+    def __init__(self, path, sample_rate=1.0):
+        """
+        :param path: file the samples are appended to
+        :type path: str
+        :param sample_rate: fraction of calls to sample, from 0 to 1. Defaults
+        to every call.
+        :type sample_rate: float
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def sample(self, method, url, status, request_payload, response_payload):
+        """
+        Records a call if it is picked for the sample. Pass None as the
+        response payload of streamed responses.
+        """
+        if random.random() >= self.sample_rate:
+            return
+        line = json.dumps({
+            'time': time.time(),
+            'method': method,
+            'url': url,
+            'status': status,
+            'request': format_payload(request_payload, None),
+            'response': format_payload(response_payload, None) if response_payload is not None else None,
+        })
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
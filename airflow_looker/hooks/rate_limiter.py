@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - fcntl is POSIX only
+    fcntl = None
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket limiting the rate of Looker API calls. Hooks using
+    the same connection in a process share one bucket.
+    """
+    # whether try_acquire() is cheap enough to call on an event loop
+    async_safe = True
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: number of calls allowed per second on average
+        :type rate: float
+        :param burst: number of calls that may be made at once after a quiet
+        period. Defaults to `rate`, with a minimum of 1.
+        :type burst: float
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated_at = None
+
+    def acquire(self):
+        """
+        Blocks until a call may be made
+        """
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available and returns 0, otherwise returns the
+        number of seconds until one will be. Never waits for the bucket to
+        refill, check `async_safe` before calling it on an event loop.
+        """
+        with self._locked():
+            tokens, updated_at = self._load()
+            now = time.time()
+            if updated_at is not None:
+                tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._store(tokens - 1, now)
+                return 0
+            self._store(tokens, now)
+            return (1 - tokens) / self.rate
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            yield
+
+    def _load(self):
+        return self._tokens, self._updated_at
+
+    def _store(self, tokens, updated_at):
+        self._tokens = tokens
+        self._updated_at = updated_at
+
+
+class FileRateLimiter(RateLimiter):
+    """
+    Token bucket kept in a JSON file so that worker processes on the same host
+    share the limit. Updates are serialised with an exclusive lock on
+    `<path>.lock`.
+    """
+    # taking a token locks and rewrites the file
+    async_safe = False
+
+    def __init__(self, path, rate, burst=None):
+        """
+        :param path: location of the JSON file holding the bucket
+        :type path: str
+        :param rate: see `RateLimiter`
+        :type rate: float
+        :param burst: see `RateLimiter`
+        :type burst: float
+        """
+        super(FileRateLimiter, self).__init__(rate, burst)
+        self.path = path
+
+    @contextmanager
+    def _locked(self):
+        with super(FileRateLimiter, self)._locked():
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            return state['tokens'], state['updated_at']
+        except (IOError, OSError, ValueError, KeyError):
+            return self.burst, None
+
+    def _store(self, tokens, updated_at):
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'tokens': tokens, 'updated_at': updated_at}, f)
+        os.replace(tmp_path, self.path)
+
+
+# Rate limiters shared by every LookerHook in the process, keyed by connection ID
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(looker_conn_id, rate, burst=None, path=None):
+    """
+    Returns the process-wide rate limiter for a connection, creating it on
+    first use. If `path` is given the bucket is shared through that file with
+    other processes.
+    """
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(looker_conn_id)
+        if rate_limiter is None:
+            if path:
+                rate_limiter = FileRateLimiter(path, rate, burst)
+            else:
+                rate_limiter = RateLimiter(rate, burst)
+            _rate_limiters[looker_conn_id] = rate_limiter
+        return rate_limiter
@@ -0,0 +1,52 @@
+class Record(object):
+    """
+    Lightweight, `__slots__` based record for Looker API objects. Only the
+    declared fields are kept, so decoding a large payload into records drops
+    everything else as soon as each object is read.
+
+    Subclass it with the fields you need, or use `record`:
+
+        Look = record('Look', ['id', 'title', 'query_id'])
+    """
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def fields(cls):
+        """
+        Returns the `fields` request parameter that projects a Looker response
+        down to this record's fields
+        """
+        return ','.join(cls.__slots__)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__,
+                               ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+def record(name, fields):
+    """
+    Creates a `Record` subclass with the given fields
+    :param name: name of the class
+    :type name: str
+    :param fields: names of the fields to keep
+    :type fields: list
+    """
+    return type(name, (Record,), {'__slots__': tuple(fields)})
+
+
+Look = record('Look', ['id', 'title', 'description', 'space_id', 'query_id', 'user_id', 'updated_at', 'deleted'])
+Dashboard = record('Dashboard', ['id', 'title', 'description', 'space_id', 'user_id', 'deleted'])
@@ -0,0 +1,189 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseCache(object):
+    """
+    Thread-safe in-memory LRU cache of Looker GET responses. Entries are
+    served without a request for `ttl` seconds, and afterwards revalidated
+    with `If-None-Match` if Looker sent an ETag.
+    """
+    def __init__(self, ttl=300, max_entries=256):
+        """
+        :param ttl: number of seconds a response is served from the cache
+        without asking Looker. Defaults to 300.
+        :type ttl: float
+        :param max_entries: number of responses kept before the least recently
+        used is evicted. Defaults to 256.
+        :type max_entries: int
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(looker_conn_id, url, headers=None):
+        return json.dumps([looker_conn_id, url, sorted((headers or {}).items())])
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    def get(self, key):
+        """
+        Returns the cached entry for `key`, fresh or not, or None. An entry is
+        a dictionary of `status_code`, `headers`, `content` and `stored_at`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, status_code, headers, content):
+        with self._lock:
+            self._entries[key] = {
+                'status_code': status_code,
+                'headers': dict(headers),
+                'content': content,
+                'stored_at': time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def touch(self, key):
+        """
+        Marks an entry as fresh again, i.e. after Looker answered 304
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['stored_at'] = time.time()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileResponseCache(ResponseCache):
+    """
+    Response cache keeping one JSON file per response in a directory, so the
+    cache survives between task runs and is shared by processes on the host.
+    Entries older than `ttl` without an ETag are deleted when read, and once
+    the directory holds more than `max_entries` responses the least recently
+    used are deleted.
+    """
+    def __init__(self, path, ttl=300, max_entries=256):
+        """
+        :param path: directory holding the cached responses. Created with
+        0700 permissions if it does not exist.
+        :type path: str
+        :param ttl: see `ResponseCache`
+        :type ttl: float
+        :param max_entries: see `ResponseCache`
+        :type max_entries: int
+        """
+        super(FileResponseCache, self).__init__(ttl=ttl, max_entries=max_entries)
+        self.path = path
+        os.makedirs(path, mode=0o700, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not self.is_fresh(entry) and 'ETag' not in CaseInsensitiveDict(entry['headers']):
+            self._remove(entry_path)
+            return None
+        # the file's modification time orders the entries for eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        entry['content'] = base64.b64decode(entry['content'])
+        return entry
+
+    def set(self, key, status_code, headers, content, stored_at=None):
+        entry = {
+            'status_code': status_code,
+            'headers': dict(headers),
+            'content': base64.b64encode(content).decode('ascii'),
+            'stored_at': time.time() if stored_at is None else stored_at,
+        }
+        entry_path = self._entry_path(key)
+        tmp_path = '{}.{}.{}.tmp'.format(entry_path, os.getpid(), threading.get_ident())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, entry_path)
+        self._evict()
+
+    def _evict(self):
+        """
+        Deletes the least recently used entries beyond `max_entries`
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                entry_path = os.path.join(self.path, name)
+                try:
+                    entries.append((os.path.getmtime(entry_path), entry_path))
+                except OSError:
+                    pass
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, entry_path in entries[:len(entries) - self.max_entries]:
+                self._remove(entry_path)
+
+    def touch(self, key):
+        entry = self.get(key)
+        if entry is not None:
+            self.set(key, entry['status_code'], entry['headers'], entry['content'])
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.path, name))
+
+    @staticmethod
+    def _remove(entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+
+# Response caches shared by every LookerHook in the process, keyed by
+# connection ID
+_response_caches = {}
+_response_caches_lock = threading.Lock()
+
+
+def get_response_cache(looker_conn_id, ttl, max_entries=None, path=None):
+    """
+    Returns the process-wide response cache for a connection, creating it on
+    first use. If `path` is given responses are cached on disk in that
+    directory.
+    """
+    with _response_caches_lock:
+        response_cache = _response_caches.get(looker_conn_id)
+        if response_cache is None:
+            if path:
+                response_cache = FileResponseCache(path, ttl=ttl, max_entries=max_entries or 256)
+            else:
+                response_cache = ResponseCache(ttl=ttl, max_entries=max_entries or 256)
+            _response_caches[looker_conn_id] = response_cache
+        return response_cache
@@ -0,0 +1,110 @@
+import itertools
+import threading
+import time
+
+ROUTING_POLICIES = ('round_robin', 'least_latency')
+
+
+class InstanceHealth(object):
+    """
+    Thread-safe tracker of a Looker instance's error rate and latency, as
+    exponentially weighted moving averages. An instance whose error rate
+    reaches `error_rate` is skipped for `cooldown` seconds, after which it is
+    tried again.
+    """
+    def __init__(self, error_rate=0.5, cooldown=30, alpha=0.2):
+        """
+        :param error_rate: error rate, from 0 to 1, at which the instance is
+        considered unhealthy. Defaults to 0.5.
+        :type error_rate: float
+        :param cooldown: number of seconds an unhealthy instance is skipped.
+        Defaults to 30.
+        :type cooldown: float
+        :param alpha: weight of the latest call in the moving averages.
+        Defaults to 0.2.
+        :type alpha: float
+        """
+        self.error_rate_threshold = error_rate
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.error_rate = 0.0
+        self.latency = None
+        self.unhealthy_until = None
+        self._lock = threading.Lock()
+
+    def is_healthy(self):
+        with self._lock:
+            return self.unhealthy_until is None or time.time() >= self.unhealthy_until
+
+    def record_success(self, seconds):
+        with self._lock:
+            self.error_rate *= 1 - self.alpha
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += self.alpha * (seconds - self.latency)
+            if self.error_rate < self.error_rate_threshold:
+                self.unhealthy_until = None
+
+    def record_failure(self):
+        with self._lock:
+            self.error_rate += self.alpha * (1 - self.error_rate)
+            if self.error_rate >= self.error_rate_threshold:
+                self.unhealthy_until = time.time() + self.cooldown
+
+
+class Router(object):
+    """
+    Orders the instances a read is tried on: healthy instances first, by the
+    routing policy, then unhealthy ones as a last resort
+    """
+    def __init__(self, policy='round_robin'):
+        """
+        :param policy: `round_robin` to spread reads evenly, or
+        `least_latency` to prefer the instance that has been answering
+        fastest. Defaults to `round_robin`.
+        :type policy: str
+        """
+        if policy not in ROUTING_POLICIES:
+            raise ValueError("routing must be one of {}".format(', '.join(ROUTING_POLICIES)))
+        self.policy = policy
+        self._counter = itertools.count()
+
+    def order(self, instances, health):
+        """
+        :param instances: the instances, primary first
+        :type instances: list
+        :param health: returns the `InstanceHealth` of an instance
+        :type health: callable
+        :return: list of the instances in the order to try them
+        """
+        healthy = [instance for instance in instances if health(instance).is_healthy()]
+        unhealthy = [instance for instance in instances if instance not in healthy]
+        if not healthy:
+            return unhealthy
+        if self.policy == 'least_latency':
+            # instances without a measurement yet go first, to get one
+            healthy.sort(key=lambda instance: health(instance).latency or 0)
+        else:
+            start = next(self._counter) % len(healthy)
+            healthy = healthy[start:] + healthy[:start]
+        return healthy + unhealthy
+
+
+# Health of the instances shared by every LookerHook in the process, keyed by
+# connection ID
+_instance_health = {}
+_instance_health_lock = threading.Lock()
+
+
+def get_instance_health(looker_conn_id, error_rate=0.5, cooldown=30):
+    """
+    Returns the process-wide health tracker of a connection's instance,
+    creating it on first use
+    """
+    with _instance_health_lock:
+        health = _instance_health.get(looker_conn_id)
+        if health is None:
+            health = InstanceHealth(error_rate=error_rate, cooldown=cooldown)
+            _instance_health[looker_conn_id] = health
+        return health
@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - fcntl is POSIX only
+    fcntl = None
+
+
+class TokenCache(object):
+    """
+    Thread-safe in-memory cache of Looker access tokens, shared by every hook
+    in the process. Tokens are keyed by connection ID and host.
+    """
+    # whether get() is cheap enough to call on an event loop
+    async_safe = True
+
+    def __init__(self, leeway=60):
+        """
+        :param leeway: number of seconds before `expires_in` runs out at which
+        a cached token is no longer handed out. Defaults to 60.
+        :type leeway: int
+        """
+        self.leeway = leeway
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def make_key(looker_conn_id, host):
+        return '{}@{}'.format(looker_conn_id, host)
+
+    def get(self, key):
+        """
+        Returns the cached access token for `key`, or None if there is no
+        token or it is about to expire
+        """
+        entry = self._load(key)
+        if entry is None:
+            return None
+        expires_at = entry.get('expires_at')
+        if expires_at is not None and time.time() >= expires_at - self.leeway:
+            return None
+        return entry['access_token']
+
+    def set(self, key, access_token, expires_in=None):
+        """
+        Stores an access token. A token without `expires_in` is kept until it
+        is invalidated, i.e. after Looker rejects it with a 401.
+        """
+        with self._locked(key):
+            self._set(key, access_token, expires_in)
+
+    def invalidate(self, key, access_token=None):
+        """
+        Drops the cached token for `key`. If `access_token` is given the entry
+        is only dropped while it still holds that token, so concurrent callers
+        that saw the same 401 only trigger a single login.
+        """
+        with self._locked(key):
+            entry = self._load(key)
+            if entry is None:
+                return
+            if access_token is None or entry['access_token'] == access_token:
+                self._delete(key)
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Returns the cached token for `key`, calling `fetch` to log in when
+        there is none. `fetch` must return an `(access_token, expires_in)`
+        tuple. Only one caller per key logs in at a time.
+        """
+        token = self.get(key)
+        if token is not None:
+            return token
+        with self._locked(key):
+            token = self.get(key)
+            if token is None:
+                token, expires_in = fetch()
+                self._set(key, token, expires_in)
+            return token
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @contextmanager
+    def _locked(self, key):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            yield
+
+    def _set(self, key, access_token, expires_in):
+        expires_at = None if expires_in is None else time.time() + expires_in
+        self._store(key, {'access_token': access_token, 'expires_at': expires_at})
+
+    def _load(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class FileTokenCache(TokenCache):
+    """
+    Token cache backed by a JSON file so that tokens can be shared between
+    worker processes on the same host. Writes are serialised with an
+    exclusive lock on `<path>.lock`.
+    """
+    # reads go through the file
+    async_safe = False
+
+    def __init__(self, path, leeway=60):
+        """
+        :param path: location of the JSON file holding the tokens. It is
+        created with 0600 permissions if it does not exist.
+        :type path: str
+        :param leeway: see `TokenCache`
+        :type leeway: int
+        """
+        super(FileTokenCache, self).__init__(leeway=leeway)
+        self.path = path
+
+    def clear(self):
+        with self._file_lock():
+            self._write({})
+
+    @contextmanager
+    def _locked(self, key):
+        with super(FileTokenCache, self)._locked(key):
+            with self._file_lock():
+                yield
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self, key):
+        return self._read().get(key)
+
+    def _store(self, key, entry):
+        # only called while the key is locked, which also holds the file
+        # lock, so this read-modify-write is safe across processes
+        entries = self._read()
+        entries[key] = entry
+        self._write(entries)
+
+    def _delete(self, key):
+        entries = self._read()
+        entries.pop(key, None)
+        self._write(entries)
+
+
+# Shared by every LookerHook in the process unless a connection configures a
+# file-backed cache through its `token_cache_path` extra.
+default_token_cache = TokenCache()
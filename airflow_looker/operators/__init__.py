@@ -1 +1,12 @@
-from .looker_operator import LookerUpdateDataGroupByIDOperator
+from airflow_looker._lazy import lazy_imports
+
+__getattr__, __dir__, __all__ = lazy_imports(__name__, {
+    'LookerUpdateDataGroupByIDOperator': 'airflow_looker.operators.looker_operator',
+    'LookerUpdateDataGroupsOperator': 'airflow_looker.operators.looker_operator',
+    'LookerDownloadLookOperator': 'airflow_looker.operators.looker_operator',
+    'LookerExportLooksOperator': 'airflow_looker.operators.looker_operator',
+    'LookerRunQueryOperator': 'airflow_looker.operators.looker_operator',
+    'LookerRebuildDerivedTablesOperator': 'airflow_looker.operators.looker_operator',
+    'LookerSyncContentOperator': 'airflow_looker.operators.looker_operator',
+    'LookerRenderDashboardsOperator': 'airflow_looker.operators.looker_operator',
+})
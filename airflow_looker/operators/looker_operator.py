@@ -1,9 +1,34 @@
+import hashlib
+import json
+import os
 import time
-from airflow_looker.hooks.looker_hook import LookerHook
-from airflow.models import BaseOperator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import timedelta
+from fnmatch import fnmatch
+from airflow.exceptions import AirflowException, AirflowRescheduleException
+from airflow.models import BaseOperator, Variable
+from airflow.utils import timezone
 from airflow.utils.decorators import apply_defaults
 
 
+@contextmanager
+def _atomic_path(path):
+    """
+    Yields a temporary path to write `path` to. It replaces `path` once the
+    block succeeds and is removed if the block fails, so a failed write never
+    looks complete.
+    """
+    part_path = path + '.part'
+    try:
+        yield part_path
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, path)
+
+
 class LookerOperator(BaseOperator):
     ui_color = '#615286'
 
@@ -12,8 +37,10 @@ class LookerOperator(BaseOperator):
         super(LookerOperator, self).__init__(*args, **kwargs)
         self.looker_conn_id = looker_conn_id
 
-    def _get_hook(self):
-        return LookerHook(looker_conn_id=self.looker_conn_id)
+    def _get_hook(self, **kwargs):
+        # imported here to keep importing the operators cheap when DAG files are parsed
+        from airflow_looker.hooks.looker_hook import LookerHook
+        return LookerHook(looker_conn_id=self.looker_conn_id, **kwargs)
 
 
 class LookerUpdateDataGroupByIDOperator(LookerOperator):
@@ -26,21 +53,900 @@ class LookerUpdateDataGroupByIDOperator(LookerOperator):
     :type looker_conn_id: string
     :param stale_before: The datagroup is stale if refreshed before this time. Defaults to now.
     :type stale_before: time
+    :param deferrable: Wait in the triggerer until Looker has checked the datagroup's trigger after
+        `stale_before`, without holding a worker slot. Requires Airflow 2.2+ and `aiohttp`. Defaults to false.
+    :type deferrable: boolean
+    :param poke_interval: The maximum number of seconds between polls when deferred. Defaults to 60.
+    :type poke_interval: float
     """
     @apply_defaults
-    def __init__(self, looker_conn_id='looker_default', datagroup_id=None, stale_before=time.time(), *args, **kwargs):
+    def __init__(self, looker_conn_id='looker_default', datagroup_id=None, stale_before=time.time(), deferrable=False,
+                 poke_interval=60, *args, **kwargs):
         super(LookerUpdateDataGroupByIDOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
         self.datagroup_id = datagroup_id
         self.stale_before = stale_before
+        self.deferrable = deferrable
+        self.poke_interval = poke_interval
 
     def execute(self, context):
-        # get hook and call
-        looker = self._get_hook()
-
         endpoint = '{}/{}'.format('api/3.0/datagroups', self.datagroup_id)
         body = {
             'stale_before': self.stale_before
         }
 
-        self.log.info("Calling: %s with body: %s", endpoint, body)
-        looker.call(method='PATCH', endpoint=endpoint, data=body)
+        # get hook and call
+        with self._get_hook() as looker:
+            self.log.info("Calling: %s with body: %s", endpoint, body)
+            # setting stale_before is idempotent, so it is safe to retry
+            looker.call(method='PATCH', endpoint=endpoint, data=body, retry=True)
+
+        if self.deferrable:
+            from airflow_looker.triggers.looker_trigger import LookerDatagroupTrigger
+            self.defer(trigger=LookerDatagroupTrigger(datagroup_id=self.datagroup_id,
+                                                      stale_before=self.stale_before,
+                                                      looker_conn_id=self.looker_conn_id,
+                                                      max_poll_interval=self.poke_interval),
+                       method_name='execute_complete')
+
+    def execute_complete(self, context, event=None):
+        if event['status'] != 'success':
+            raise AirflowException(event['message'])
+        self.log.info("Looker checked datagroup %s at %s", self.datagroup_id, event['trigger_check_at'])
+
+
+class LookerUpdateDataGroupsOperator(LookerOperator):
+    """
+    Update many datagroups at once, sending the updates concurrently over a
+    single Looker session.
+
+    Every datagroup is attempted before the task fails. The outcome for each
+    datagroup is returned, and so pushed to XCom, as a dictionary of
+    datagroup ID to `{'success': bool, 'error': str}`.
+
+    :param datagroup_ids: The Datagroup IDs to update.
+    :type datagroup_ids: list
+    :param name_pattern: Shell-style pattern, i.e. `orders_*`, matched against the
+        datagroup names returned by Looker. Used instead of `datagroup_ids`.
+    :type name_pattern: string
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param stale_before: The datagroups are stale if refreshed before this time. Defaults to now.
+    :type stale_before: time
+    :param max_workers: The maximum number of concurrent updates. Defaults to 8.
+    :type max_workers: int
+    """
+    @apply_defaults
+    def __init__(self, looker_conn_id='looker_default', datagroup_ids=None, name_pattern=None, stale_before=None,
+                 max_workers=8, *args, **kwargs):
+        super(LookerUpdateDataGroupsOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        if (datagroup_ids is None) == (name_pattern is None):
+            raise AirflowException("Exactly one of datagroup_ids or name_pattern must be provided")
+        self.datagroup_ids = datagroup_ids
+        self.name_pattern = name_pattern
+        self.stale_before = stale_before
+        self.max_workers = max_workers
+
+    def _resolve_datagroup_ids(self, looker):
+        if self.datagroup_ids is not None:
+            return list(self.datagroup_ids)
+
+        # datagroup IDs are those of the primary, which the updates go to
+        response = looker.call(method='GET', endpoint='api/3.0/datagroups', data=None, allow_replica=False)
+        datagroup_ids = [datagroup['id'] for datagroup in response.json()
+                         if fnmatch(datagroup['name'], self.name_pattern)]
+        self.log.info("Datagroups matching '%s': %s", self.name_pattern, datagroup_ids)
+        return datagroup_ids
+
+    def _update_datagroup(self, looker, datagroup_id, body):
+        endpoint = '{}/{}'.format('api/3.0/datagroups', datagroup_id)
+        try:
+            looker.call(method='PATCH', endpoint=endpoint, data=body, retry=True)
+        except Exception as e:
+            self.log.error("Failed to update datagroup %s: %s", datagroup_id, e)
+            return {'success': False, 'error': str(e)}
+        return {'success': True, 'error': None}
+
+    def execute(self, context):
+        body = {
+            'stale_before': int(time.time()) if self.stale_before is None else self.stale_before
+        }
+
+        with self._get_hook(pool_maxsize=self.max_workers) as looker:
+            datagroup_ids = self._resolve_datagroup_ids(looker)
+            # log in before fanning out so the workers share one token
+            looker.get_token()
+
+            self.log.info("Updating %s datagroups with body: %s", len(datagroup_ids), body)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                outcomes = executor.map(lambda datagroup_id: self._update_datagroup(looker, datagroup_id, body),
+                                        datagroup_ids)
+                results = dict(zip((str(datagroup_id) for datagroup_id in datagroup_ids), outcomes))
+
+        failed = [datagroup_id for datagroup_id, result in results.items() if not result['success']]
+        if failed:
+            context['ti'].xcom_push(key='return_value', value=results)
+            raise AirflowException("Failed to update {} of {} datagroups: {}".format(
+                len(failed), len(results), ', '.join(failed)))
+        return results
+
+
+class LookerDownloadLookOperator(LookerOperator):
+    """
+    Run a look and stream its results to a local file.
+
+    :param look_id: The Look ID to run. Required.
+    :type look_id: int
+    :param path: The local file to write the results to. Required.
+    :type path: string
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param result_format: The format of the results, i.e. `csv` or `json`. Defaults to `csv`.
+    :type result_format: string
+    :param chunk_size: The number of bytes written at a time. Defaults to 1MB.
+    :type chunk_size: int
+    :param query_params: Additional request parameters, i.e. `{'limit': -1}`.
+    :type query_params: dict
+    """
+    template_fields = ('path',)
+
+    @apply_defaults
+    def __init__(self, looker_conn_id='looker_default', look_id=None, path=None, result_format='csv',
+                 chunk_size=1024 * 1024, query_params=None, *args, **kwargs):
+        super(LookerDownloadLookOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        self.look_id = look_id
+        self.path = path
+        self.result_format = result_format
+        self.chunk_size = chunk_size
+        self.query_params = query_params
+
+    def execute(self, context):
+        with self._get_hook() as looker:
+            looker.download_look(look_id=self.look_id,
+                                 result_format=self.result_format,
+                                 path_or_fileobj=self.path,
+                                 chunk_size=self.chunk_size,
+                                 params=self.query_params)
+        return self.path
+
+
+class LookerRunQueryOperator(LookerOperator):
+    """
+    Run a query, or the query behind a look, as an asynchronous Looker query
+    task and fetch its results once it completes.
+
+    In `poke` mode the task polls Looker with exponential backoff while holding
+    its worker slot. In `reschedule` mode the task frees its slot between polls;
+    the ID of the running query task is kept in an Airflow Variable until the
+    results have been fetched.
+
+    :param query_id: The Query ID to run. Either this or `look_id` is required.
+    :type query_id: int
+    :param look_id: The Look ID whose query should be run.
+    :type look_id: int
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param result_format: The format of the results, i.e. `csv` or `json`. Defaults to `csv`.
+    :type result_format: string
+    :param path: The local file to stream the results to. If not provided the results are returned, and so
+        pushed to XCom, as a string.
+    :type path: string
+    :param mode: How to wait for the query, `poke` or `reschedule`. Defaults to `poke`.
+    :type mode: string
+    :param poke_interval: The maximum number of seconds between polls. Defaults to 30.
+    :type poke_interval: float
+    :param timeout: The number of seconds after which to give up on the query. Defaults to no timeout.
+    :type timeout: float
+    :param deferrable: Wait for the query in the triggerer instead, whatever the `mode`. Requires Airflow 2.2+
+        and `aiohttp`. Defaults to false.
+    :type deferrable: boolean
+    """
+    template_fields = ('path',)
+    valid_modes = ('poke', 'reschedule')
+
+    @apply_defaults
+    def __init__(self, looker_conn_id='looker_default', query_id=None, look_id=None, result_format='csv', path=None,
+                 mode='poke', poke_interval=30, timeout=None, deferrable=False, *args, **kwargs):
+        super(LookerRunQueryOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        if (query_id is None) == (look_id is None):
+            raise AirflowException("Exactly one of query_id or look_id must be provided")
+        if mode not in self.valid_modes:
+            raise AirflowException("mode must be one of {}".format(', '.join(self.valid_modes)))
+        self.query_id = query_id
+        self.look_id = look_id
+        self.result_format = result_format
+        self.path = path
+        self.mode = mode
+        self.poke_interval = poke_interval
+        self.timeout = timeout
+        self.deferrable = deferrable
+
+    @property
+    def reschedule(self):
+        return self.mode == 'reschedule'
+
+    def _start_query_task(self, looker):
+        query_id = self.query_id
+        if query_id is None:
+            query_id = looker.get_look_query_id(self.look_id)
+        return looker.create_query_task(query_id, result_format=self.result_format)
+
+    def _fetch_results(self, looker, query_task_id):
+        results = looker.get_query_task_results(query_task_id, path_or_fileobj=self.path)
+        return self.path if self.path is not None else results
+
+    def execute(self, context):
+        with self._get_hook() as looker:
+            if self.deferrable:
+                return self._execute_deferrable(looker)
+            if self.reschedule:
+                return self._execute_reschedule(looker, context)
+
+            query_task_id = self._start_query_task(looker)
+            looker.wait_for_query_task(query_task_id, max_poll_interval=self.poke_interval, timeout=self.timeout)
+            return self._fetch_results(looker, query_task_id)
+
+    def _execute_deferrable(self, looker):
+        from airflow_looker.triggers.looker_trigger import LookerQueryTaskTrigger
+        query_task_id = self._start_query_task(looker)
+        self.defer(trigger=LookerQueryTaskTrigger(query_task_id=query_task_id,
+                                                  looker_conn_id=self.looker_conn_id,
+                                                  max_poll_interval=self.poke_interval),
+                   method_name='execute_complete',
+                   timeout=None if self.timeout is None else timedelta(seconds=self.timeout))
+
+    def execute_complete(self, context, event=None):
+        if event['status'] != 'success':
+            raise AirflowException(event['message'])
+        with self._get_hook() as looker:
+            return self._fetch_results(looker, event['query_task_id'])
+
+    @staticmethod
+    def _state_key(context):
+        """
+        Returns the Variable keeping the running query task of this task
+        instance. `task_instance_key_str` only has the logical date, which
+        runs triggered on the same day and mapped task instances share.
+        """
+        ti = context['ti']
+        map_index = getattr(ti, 'map_index', -1)
+        return 'looker_query_task__{}__{}__{}__{}'.format(ti.dag_id, ti.run_id, ti.task_id, map_index)
+
+    def _execute_reschedule(self, looker, context):
+        state_key = self._state_key(context)
+        state = Variable.get(state_key, default_var=None, deserialize_json=True)
+        if state is None:
+            state = {'query_task_id': self._start_query_task(looker), 'started_at': time.time()}
+            Variable.set(state_key, state, serialize_json=True)
+
+        query_task_id = state['query_task_id']
+        try:
+            complete = looker.check_query_task(query_task_id)
+            if not complete and self.timeout is not None and time.time() - state['started_at'] > self.timeout:
+                raise AirflowException("Timed out waiting for query task {}".format(query_task_id))
+        except AirflowException:
+            Variable.delete(state_key)
+            raise
+
+        if not complete:
+            self.log.info("Query task %s is still running, rescheduling in %ss", query_task_id, self.poke_interval)
+            raise AirflowRescheduleException(timezone.utcnow() + timedelta(seconds=self.poke_interval))
+
+        results = self._fetch_results(looker, query_task_id)
+        Variable.delete(state_key)
+        return results
+
+
+class LookerRebuildDerivedTablesOperator(LookerOperator):
+    """
+    Rebuild a set of persistent derived tables in dependency order.
+
+    The dependencies between the tables are read from the model's derived
+    table graph. A table's build starts as soon as the builds of every other
+    requested table it depends on, directly or through other derived tables,
+    have completed, with at most `max_active_builds` builds running at once.
+    Tables depending on a failed build are skipped. A build also fails if it
+    runs longer than `build_timeout`, or if Looker reports a status that is
+    neither running, complete nor failed. The task fails once no more builds
+    can run if any table failed or was skipped.
+
+    The outcome per table is returned, and so pushed to XCom, as a dictionary
+    of view name to `{'status': 'success' | 'failed' | 'skipped', 'materialization_id': str, 'seconds': float}`.
+
+    Uses the Looker API 4.0 derived table endpoints.
+
+    :param model_name: The LookML model defining the derived tables. Required.
+    :type model_name: string
+    :param view_names: The views of the derived tables to rebuild. Required.
+    :type view_names: list
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param max_active_builds: The maximum number of builds running at once. Defaults to 4.
+    :type max_active_builds: int
+    :param force_rebuild: Rebuild the tables even if they are up to date. Defaults to true.
+    :type force_rebuild: boolean
+    :param poke_interval: The number of seconds between checks on the running builds. Defaults to 30.
+    :type poke_interval: float
+    :param build_timeout: The number of seconds after which a build is considered failed. Optional.
+    :type build_timeout: float
+    """
+    @apply_defaults
+    def __init__(self, model_name=None, view_names=None, looker_conn_id='looker_default', max_active_builds=4,
+                 force_rebuild=True, poke_interval=30, build_timeout=None, *args, **kwargs):
+        super(LookerRebuildDerivedTablesOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        self.model_name = model_name
+        self.view_names = view_names
+        self.max_active_builds = max_active_builds
+        self.force_rebuild = force_rebuild
+        self.poke_interval = poke_interval
+        self.build_timeout = build_timeout
+
+    @staticmethod
+    def _get_build_dependencies(graph, view_names):
+        """
+        Returns, for each requested view, the other requested views it depends
+        on directly or through derived tables that weren't requested
+        """
+        targets = set(view_names)
+        dependencies = {}
+        for view_name in targets:
+            found = set()
+            seen = set()
+            stack = list(graph.get(view_name, ()))
+            while stack:
+                upstream = stack.pop()
+                if upstream in seen:
+                    continue
+                seen.add(upstream)
+                if upstream in targets:
+                    found.add(upstream)
+                else:
+                    stack.extend(graph.get(upstream, ()))
+            dependencies[view_name] = found
+        return dependencies
+
+    def execute(self, context):
+        from airflow_looker.hooks.looker_hook import (
+            PDT_BUILD_COMPLETE_STATUSES,
+            PDT_BUILD_FAILED_STATUSES,
+            PDT_BUILD_RUNNING_STATUSES,
+        )
+
+        with self._get_hook() as looker:
+            graph = looker.get_derived_table_graph(self.model_name)
+            dependencies = self._get_build_dependencies(graph, self.view_names)
+
+            results = {}
+            running = {}
+            pending = set(dependencies)
+            while pending or running:
+                # skip until nothing changes, a failure spreads down chains in any sort order
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for view_name in sorted(pending):
+                        if any(results.get(upstream, {}).get('status') in ('failed', 'skipped')
+                               for upstream in dependencies[view_name]):
+                            self.log.warning("Skipping %s as a derived table it depends on failed", view_name)
+                            results[view_name] = {'status': 'skipped', 'materialization_id': None, 'seconds': 0}
+                            pending.discard(view_name)
+                            skipped = True
+
+                for view_name in sorted(pending):
+                    upstreams = [results.get(upstream, {}).get('status') for upstream in dependencies[view_name]]
+                    if all(status == 'success' for status in upstreams) and len(running) < self.max_active_builds:
+                        materialization_id = looker.start_pdt_build(self.model_name, view_name,
+                                                                    force_rebuild=self.force_rebuild)
+                        running[view_name] = (materialization_id, time.monotonic())
+                        pending.discard(view_name)
+
+                if not running:
+                    if pending:
+                        raise AirflowException("Derived tables depend on each other in a cycle: {}".format(
+                            ', '.join(sorted(pending))))
+                    continue
+                time.sleep(self.poke_interval)
+
+                for view_name, (materialization_id, started_at) in list(running.items()):
+                    status = looker.get_pdt_build_status(materialization_id)
+                    seconds = time.monotonic() - started_at
+                    if status in PDT_BUILD_COMPLETE_STATUSES:
+                        outcome = 'success'
+                    elif status in PDT_BUILD_FAILED_STATUSES:
+                        outcome = 'failed'
+                    elif status not in PDT_BUILD_RUNNING_STATUSES:
+                        # an unknown status could otherwise be waited on forever
+                        self.log.error("Build of %s returned the unrecognised status %r", view_name, status)
+                        outcome = 'failed'
+                    elif self.build_timeout is not None and seconds > self.build_timeout:
+                        self.log.error("Build of %s timed out after %.0fs", view_name, seconds)
+                        outcome = 'failed'
+                    else:
+                        continue
+                    self.log.info("Build of %s finished with status %s after %.0fs", view_name, status, seconds)
+                    results[view_name] = {'status': outcome, 'materialization_id': materialization_id,
+                                          'seconds': seconds}
+                    del running[view_name]
+
+        unsuccessful = sorted(view_name for view_name, result in results.items() if result['status'] != 'success')
+        if unsuccessful:
+            context['ti'].xcom_push(key='return_value', value=results)
+            raise AirflowException("Failed to rebuild {} of {} derived tables: {}".format(
+                len(unsuccessful), len(results), ', '.join(unsuccessful)))
+        return results
+
+
+class LookerExportLooksOperator(LookerOperator):
+    """
+    Export many looks to files in a local directory, running them concurrently
+    over a single Looker session.
+
+    Each look's results are streamed to `<directory>/look_<look_id>.<result_format>`,
+    and a `manifest.json` listing the file, row count, size in bytes and
+    download time of every look is written alongside them. Every look is
+    attempted before the task fails. The manifest entries are also returned,
+    and so pushed to XCom.
+
+    :param directory: The local directory to write the results to. Required.
+    :type directory: string
+    :param look_ids: The Look IDs to export. Either this or `folder_id` is required.
+    :type look_ids: list
+    :param folder_id: The folder (space) whose looks should be exported.
+    :type folder_id: int
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param result_format: `csv`, `json` or `jsonl` (one JSON object per line). Defaults to `csv`.
+    :type result_format: string
+    :param max_workers: The maximum number of concurrent exports. Defaults to 4.
+    :type max_workers: int
+    :param query_params: Additional request parameters, i.e. `{'limit': -1}`.
+    :type query_params: dict
+    """
+    template_fields = ('directory',)
+    valid_formats = ('csv', 'json', 'jsonl')
+
+    @apply_defaults
+    def __init__(self, directory=None, look_ids=None, folder_id=None, looker_conn_id='looker_default',
+                 result_format='csv', max_workers=4, query_params=None, *args, **kwargs):
+        super(LookerExportLooksOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        if (look_ids is None) == (folder_id is None):
+            raise AirflowException("Exactly one of look_ids or folder_id must be provided")
+        if result_format not in self.valid_formats:
+            raise AirflowException("result_format must be one of {}".format(', '.join(self.valid_formats)))
+        self.directory = directory
+        self.look_ids = look_ids
+        self.folder_id = folder_id
+        self.result_format = result_format
+        self.max_workers = max_workers
+        self.query_params = query_params
+
+    def _resolve_look_ids(self, looker):
+        if self.look_ids is not None:
+            return list(self.look_ids)
+        endpoint = '{}/{}/looks'.format('api/3.0/spaces', self.folder_id)
+        look_ids = [look['id'] for look in looker.get_json(endpoint, fields=['id'])]
+        self.log.info("Looks in folder %s: %s", self.folder_id, look_ids)
+        return look_ids
+
+    def _export_look(self, looker, look_id):
+        from airflow_looker.hooks.looker_hook import RowCounter
+
+        path = os.path.join(self.directory, 'look_{}.{}'.format(look_id, self.result_format))
+        started_at = time.monotonic()
+        try:
+            # rows are counted as they are written rather than by reading the file again
+            row_counter = RowCounter(self.result_format)
+            with _atomic_path(path) as part_path:
+                size = looker.download_look(look_id, self.result_format, part_path, params=self.query_params,
+                                            row_counter=row_counter)
+            rows = row_counter.rows
+        except Exception as e:
+            self.log.error("Failed to export look %s: %s", look_id, e)
+            return {'look_id': look_id, 'path': None, 'success': False, 'error': str(e), 'rows': None,
+                    'bytes': None, 'seconds': time.monotonic() - started_at}
+        seconds = time.monotonic() - started_at
+        self.log.info("Exported look %s: %s rows, %s bytes in %.1fs", look_id, rows, size, seconds)
+        return {'look_id': look_id, 'path': path, 'success': True, 'error': None, 'rows': rows, 'bytes': size,
+                'seconds': seconds}
+
+    def execute(self, context):
+        os.makedirs(self.directory, exist_ok=True)
+
+        with self._get_hook(pool_maxsize=self.max_workers) as looker:
+            look_ids = self._resolve_look_ids(looker)
+            # log in before fanning out so the workers share one token
+            looker.get_token()
+
+            self.log.info("Exporting %s looks to %s", len(look_ids), self.directory)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                manifest = list(executor.map(lambda look_id: self._export_look(looker, look_id), look_ids))
+
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        failed = [str(entry['look_id']) for entry in manifest if not entry['success']]
+        if failed:
+            context['ti'].xcom_push(key='return_value', value=manifest)
+            raise AirflowException("Failed to export {} of {} looks: {}".format(
+                len(failed), len(manifest), ', '.join(failed)))
+        return manifest
+
+
+class LookerSyncContentOperator(LookerOperator):
+    """
+    Incrementally mirror Looker content metadata (looks, dashboards and
+    explores), writing only what changed since the last run as JSON lines.
+
+    A state file keeps the `updated_at` and a hash of every object synced.
+    Each run lists looks and dashboards newest first, projected down to `id`
+    and `updated_at`, stops at the newest change it already has, and fetches
+    the full definitions of the changed objects only. Definitions whose hash
+    is unchanged are not emitted. Explores have no `updated_at` and are
+    compared by hash on every run, from a single `lookml_models` call.
+
+    Every read bypasses the hook's response cache, so that a stale definition
+    is never saved against a newer `updated_at`.
+
+    Incremental runs see deletions through Looker's soft-deleted content. A
+    full sweep, listing every object by ID, also catches hard deletes. It runs on
+    the first sync and then every `full_sync_interval` seconds.
+
+    Each line of `output_path` is either
+    `{"type": "look", "id": 1, "op": "upsert", "object": {...}}` or
+    `{"type": "look", "id": 1, "op": "delete"}`. The state file is only
+    updated once the deltas were written, so a failed run is retried in full
+    by the next one. A summary of the run is returned, and so pushed to XCom.
+
+    :param state_path: The local JSON file keeping the sync state. Required.
+    :type state_path: string
+    :param output_path: The local file to write the deltas to. Required.
+    :type output_path: string
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param content_types: The content to sync, out of `looks`, `dashboards` and `explores`. Defaults to all.
+    :type content_types: list
+    :param fields: The fields to sync per content type, i.e. `{'looks': ['id', 'title', 'updated_at']}`.
+        Defaults to all fields. Leaving out volatile fields such as `view_count` avoids spurious upserts.
+    :type fields: dict
+    :param full_sync_interval: The number of seconds between full sweeps. Defaults to a day.
+    :type full_sync_interval: float
+    :param full_sync: Force a full sweep on this run. Defaults to false.
+    :type full_sync: boolean
+    :param max_workers: The maximum number of definitions fetched concurrently. Defaults to 8.
+    :type max_workers: int
+    :param page_size: The number of objects listed per request. Defaults to 1000.
+    :type page_size: int
+    """
+    template_fields = ('state_path', 'output_path')
+    searches = {
+        'looks': ('look', 'api/3.0/looks/search', 'api/3.0/looks/{}'),
+        'dashboards': ('dashboard', 'api/3.0/dashboards/search', 'api/3.0/dashboards/{}'),
+    }
+    explore_fields = ('name', 'label', 'description', 'group_label', 'hidden')
+
+    @apply_defaults
+    def __init__(self, state_path=None, output_path=None, looker_conn_id='looker_default',
+                 content_types=('looks', 'dashboards', 'explores'), fields=None, full_sync_interval=24 * 60 * 60,
+                 full_sync=False, max_workers=8, page_size=1000, *args, **kwargs):
+        super(LookerSyncContentOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        unknown = set(content_types) - set(self.searches) - {'explores'}
+        if unknown:
+            raise AirflowException("Unknown content types: {}".format(', '.join(sorted(unknown))))
+        self.state_path = state_path
+        self.output_path = output_path
+        self.content_types = list(content_types)
+        self.fields = fields or {}
+        self.full_sync_interval = full_sync_interval
+        self.full_sync = full_sync
+        self.max_workers = max_workers
+        self.page_size = page_size
+
+    @staticmethod
+    def _hash(obj):
+        return hashlib.sha256(json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {'last_full_sync_at': None, 'content': {}}
+
+    def _save_state(self, state):
+        with _atomic_path(self.state_path) as part_path, open(part_path, 'w') as f:
+            json.dump(state, f)
+
+    def _list_changes(self, looker, search, known, watermark, full):
+        """
+        Returns the listed objects that are new or have a different
+        `updated_at`, the IDs of deleted objects and the new watermark
+        """
+        changed = []
+        deleted = set()
+        seen = set()
+        newest = watermark
+        since = timezone.parse(watermark) if watermark and not full else None
+
+        # sort the sweep too, offsets into an unordered listing can skip or repeat objects
+        params = {'sorts': 'id'} if full else {'sorts': 'updated_at desc'}
+        with closing(looker.iter_items(search, page_size=self.page_size, fields=['id', 'updated_at'],
+                                       params=params, use_cache=False)) as items:
+            for item in items:
+                updated_at = item.get('updated_at')
+                if since is not None and (updated_at is None or timezone.parse(updated_at) < since):
+                    break
+                seen.add(str(item['id']))
+                if updated_at and (newest is None or timezone.parse(updated_at) > timezone.parse(newest)):
+                    newest = updated_at
+                if known.get(str(item['id']), {}).get('updated_at') != updated_at or updated_at is None:
+                    changed.append(item)
+
+        if full:
+            deleted = set(known) - seen
+        else:
+            params = {'deleted': 'true', 'sorts': 'deleted_at desc'}
+            with closing(looker.iter_items(search, page_size=self.page_size, fields=['id', 'deleted_at'],
+                                           params=params, use_cache=False)) as items:
+                for item in items:
+                    if since is not None and (not item.get('deleted_at') or timezone.parse(item['deleted_at']) < since):
+                        break
+                    deleted.add(str(item['id']))
+            deleted &= set(known)
+        return changed, deleted, newest
+
+    def _sync_searchable(self, looker, content_type, state, full, write):
+        object_type, search, endpoint = self.searches[content_type]
+        type_state = state['content'].setdefault(content_type, {'watermark': None, 'objects': {}})
+        known = type_state['objects']
+
+        changed, deleted, watermark = self._list_changes(looker, search, known, type_state['watermark'], full)
+        self.log.info("%s: %s listed as changed, %s deleted", content_type, len(changed), len(deleted))
+
+        fields = self.fields.get(content_type)
+        upserts = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            objects = executor.map(lambda item: looker.get_json(endpoint.format(item['id']), fields=fields,
+                                                                use_cache=False), changed)
+            for item, obj in zip(changed, objects):
+                object_hash = self._hash(obj)
+                key = str(item['id'])
+                if known.get(key, {}).get('hash') != object_hash:
+                    write({'type': object_type, 'id': item['id'], 'op': 'upsert', 'object': obj})
+                    upserts += 1
+                known[key] = {'id': item['id'], 'updated_at': item.get('updated_at'), 'hash': object_hash}
+
+        for key in sorted(deleted):
+            write({'type': object_type, 'id': known.pop(key)['id'], 'op': 'delete'})
+        type_state['watermark'] = watermark
+        return upserts, len(deleted)
+
+    def _sync_explores(self, looker, state, write):
+        known = state['content'].setdefault('explores', {'watermark': None, 'objects': {}})['objects']
+        fields = self.fields.get('explores') or self.explore_fields
+        models = looker.get_json('api/3.0/lookml_models', fields=['name', 'explores'], use_cache=False)
+
+        seen = set()
+        upserts = 0
+        for model in models:
+            for explore in model.get('explores') or []:
+                key = '{}::{}'.format(model['name'], explore['name'])
+                obj = dict({field: explore.get(field) for field in fields}, model=model['name'])
+                object_hash = self._hash(obj)
+                seen.add(key)
+                if known.get(key, {}).get('hash') != object_hash:
+                    write({'type': 'explore', 'id': key, 'op': 'upsert', 'object': obj})
+                    known[key] = {'id': key, 'updated_at': None, 'hash': object_hash}
+                    upserts += 1
+
+        deleted = set(known) - seen
+        for key in sorted(deleted):
+            write({'type': 'explore', 'id': known.pop(key)['id'], 'op': 'delete'})
+        return upserts, len(deleted)
+
+    def execute(self, context):
+        state = self._load_state()
+        now = time.time()
+        last_full_sync_at = state.get('last_full_sync_at')
+        full = (self.full_sync or last_full_sync_at is None or
+                now - last_full_sync_at >= self.full_sync_interval or
+                any(content_type not in state['content'] for content_type in self.content_types))
+        self.log.info("Running %s sync of %s", 'a full' if full else 'an incremental', ', '.join(self.content_types))
+
+        summary = {'path': self.output_path, 'full_sync': full, 'upserts': {}, 'deletes': {}}
+        with _atomic_path(self.output_path) as part_path, \
+                self._get_hook(pool_maxsize=self.max_workers) as looker, open(part_path, 'w') as f:
+            # log in before fanning out so the workers share one token
+            looker.get_token()
+
+            def write(delta):
+                f.write(json.dumps(delta) + '\n')
+
+            for content_type in self.content_types:
+                if content_type == 'explores':
+                    upserts, deletes = self._sync_explores(looker, state, write)
+                else:
+                    upserts, deletes = self._sync_searchable(looker, content_type, state, full, write)
+                summary['upserts'][content_type] = upserts
+                summary['deletes'][content_type] = deletes
+
+        if full:
+            state['last_full_sync_at'] = now
+        self._save_state(state)
+        self.log.info("Wrote %s upserts and %s deletes to %s", sum(summary['upserts'].values()),
+                      sum(summary['deletes'].values()), self.output_path)
+        return summary
+
+
+class LookerRenderDashboardsOperator(LookerOperator):
+    """
+    Render many dashboards to files in a local directory, i.e. as PDFs, over a
+    single Looker session.
+
+    Render tasks are submitted for at most `max_active_renders` dashboards at
+    once, to protect Looker's render queue, and every running task is polled
+    in one loop. The wait between polls starts at `poll_interval` and doubles
+    while no render finishes, up to `max_poll_interval`. Each finished render
+    is streamed to `<directory>/dashboard_<dashboard_id>.<result_format>` in
+    the background while the others are polled, and a `manifest.json` listing
+    the file, size and render time of every dashboard is written alongside
+    them. Every dashboard is attempted before the task fails. The manifest
+    entries are also returned, and so pushed to XCom.
+
+    :param directory: The local directory to write the files to. Required.
+    :type directory: string
+    :param dashboard_ids: The IDs of the dashboards to render, each listed once. Required.
+    :type dashboard_ids: list
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param result_format: `pdf`, `png` or `jpg`. Defaults to `pdf`.
+    :type result_format: string
+    :param width: The width of the rendered dashboards in pixels. Defaults to 1280.
+    :type width: int
+    :param height: The height of the rendered dashboards in pixels. Defaults to 720.
+    :type height: int
+    :param dashboard_style: `tiled` or `single_column`. Defaults to each dashboard's own layout.
+    :type dashboard_style: string
+    :param dashboard_filters: Filters applied to every dashboard, as a query string i.e. `Region=West`.
+    :type dashboard_filters: string
+    :param render_params: Additional request parameters, i.e. `{'pdf_paper_size': 'a4', 'pdf_landscape': 'true'}`.
+    :type render_params: dict
+    :param max_active_renders: The maximum number of render tasks running at once. Defaults to 4.
+    :type max_active_renders: int
+    :param max_workers: The maximum number of concurrent downloads of finished renders. Defaults to 4.
+    :type max_workers: int
+    :param poll_interval: The number of seconds before the first poll of the running renders. Defaults to 5.
+    :type poll_interval: float
+    :param max_poll_interval: The maximum number of seconds between polls. Defaults to 60.
+    :type max_poll_interval: float
+    :param render_timeout: The number of seconds after which a render is given up on. Optional.
+    :type render_timeout: float
+    """
+    template_fields = ('directory', 'dashboard_filters')
+    valid_formats = ('pdf', 'png', 'jpg')
+
+    @apply_defaults
+    def __init__(self, directory=None, dashboard_ids=None, looker_conn_id='looker_default', result_format='pdf',
+                 width=1280, height=720, dashboard_style=None, dashboard_filters=None, render_params=None,
+                 max_active_renders=4, max_workers=4, poll_interval=5, max_poll_interval=60, render_timeout=None,
+                 *args, **kwargs):
+        super(LookerRenderDashboardsOperator, self).__init__(looker_conn_id=looker_conn_id, *args, **kwargs)
+        if not dashboard_ids:
+            raise AirflowException("dashboard_ids must be a non-empty list")
+        # a repeated dashboard would share a render slot and an output file with the first one
+        keys = [str(dashboard_id) for dashboard_id in dashboard_ids]
+        duplicates = sorted(key for key in set(keys) if keys.count(key) > 1)
+        if duplicates:
+            raise AirflowException("dashboard_ids must not repeat dashboards: {}".format(', '.join(duplicates)))
+        if result_format not in self.valid_formats:
+            raise AirflowException("result_format must be one of {}".format(', '.join(self.valid_formats)))
+        self.directory = directory
+        self.dashboard_ids = dashboard_ids
+        self.result_format = result_format
+        self.width = width
+        self.height = height
+        self.dashboard_style = dashboard_style
+        self.dashboard_filters = dashboard_filters
+        self.render_params = render_params
+        self.max_active_renders = max_active_renders
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.render_timeout = render_timeout
+
+    @staticmethod
+    def _result(dashboard_id, render_task_id, started_at, path=None, size=None, error=None):
+        return {'dashboard_id': dashboard_id, 'render_task_id': render_task_id, 'path': path,
+                'success': error is None, 'error': error, 'bytes': size, 'seconds': time.monotonic() - started_at}
+
+    def _start_render(self, looker, dashboard_id):
+        return looker.create_dashboard_render_task(dashboard_id, result_format=self.result_format, width=self.width,
+                                                   height=self.height, dashboard_style=self.dashboard_style,
+                                                   dashboard_filters=self.dashboard_filters,
+                                                   params=self.render_params)
+
+    def _download(self, looker, dashboard_id, render_task_id, started_at):
+        path = os.path.join(self.directory, 'dashboard_{}.{}'.format(dashboard_id, self.result_format))
+        try:
+            with _atomic_path(path) as part_path:
+                size = looker.get_render_task_results(render_task_id, part_path)
+        except Exception as e:
+            self.log.error("Failed to download the render of dashboard %s: %s", dashboard_id, e)
+            return self._result(dashboard_id, render_task_id, started_at, error=str(e))
+        result = self._result(dashboard_id, render_task_id, started_at, path=path, size=size)
+        self.log.info("Rendered dashboard %s: %s bytes in %.1fs", dashboard_id, size, result['seconds'])
+        return result
+
+    def _poll(self, looker, running, executor, downloads, results):
+        """
+        Checks every running render once, handing finished ones to `executor`
+        for download. Returns the number of renders that left `running`.
+        """
+        finished = 0
+        for dashboard_id, (render_task_id, started_at) in list(running.items()):
+            try:
+                done = looker.check_render_task(render_task_id)
+            except Exception as e:
+                self.log.error("Failed to render dashboard %s: %s", dashboard_id, e)
+                results[dashboard_id] = self._result(dashboard_id, render_task_id, started_at, error=str(e))
+            else:
+                if done:
+                    downloads[dashboard_id] = executor.submit(self._download, looker, dashboard_id, render_task_id,
+                                                              started_at)
+                elif self.render_timeout is not None and time.monotonic() - started_at > self.render_timeout:
+                    _message = "Timed out waiting for render task {}".format(render_task_id)
+                    self.log.error("Failed to render dashboard %s: %s", dashboard_id, _message)
+                    results[dashboard_id] = self._result(dashboard_id, render_task_id, started_at, error=_message)
+                else:
+                    continue
+            del running[dashboard_id]
+            finished += 1
+        return finished
+
+    def execute(self, context):
+        os.makedirs(self.directory, exist_ok=True)
+
+        results = {}
+        # one extra connection for the polling loop next to the downloads
+        with self._get_hook(pool_maxsize=self.max_workers + 1) as looker:
+            # log in before fanning out so the workers share one token
+            looker.get_token()
+
+            self.log.info("Rendering %s dashboards to %s", len(self.dashboard_ids), self.directory)
+            pending = list(self.dashboard_ids)
+            running = {}
+            downloads = {}
+            poll_interval = self.poll_interval
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while pending or running:
+                    while pending and len(running) < self.max_active_renders:
+                        dashboard_id = pending.pop(0)
+                        started_at = time.monotonic()
+                        try:
+                            running[dashboard_id] = (self._start_render(looker, dashboard_id), started_at)
+                        except Exception as e:
+                            self.log.error("Failed to start rendering dashboard %s: %s", dashboard_id, e)
+                            results[dashboard_id] = self._result(dashboard_id, None, started_at, error=str(e))
+                    if not running:
+                        continue
+
+                    time.sleep(poll_interval)
+                    if self._poll(looker, running, executor, downloads, results):
+                        poll_interval = self.poll_interval
+                    else:
+                        poll_interval = min(poll_interval * 2, self.max_poll_interval)
+                        self.log.info("%s renders still running, checking again in %ss", len(running), poll_interval)
+
+            for dashboard_id, download in downloads.items():
+                results[dashboard_id] = download.result()
+
+        manifest = [results[dashboard_id] for dashboard_id in self.dashboard_ids]
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        failed = [str(entry['dashboard_id']) for entry in manifest if not entry['success']]
+        if failed:
+            context['ti'].xcom_push(key='return_value', value=manifest)
+            raise AirflowException("Failed to render {} of {} dashboards: {}".format(
+                len(failed), len(manifest), ', '.join(failed)))
+        return manifest
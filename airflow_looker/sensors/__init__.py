@@ -0,0 +1,5 @@
+from airflow_looker._lazy import lazy_imports
+
+__getattr__, __dir__, __all__ = lazy_imports(__name__, {
+    'LookerDatagroupSensor': 'airflow_looker.sensors.looker_sensor',
+})
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from airflow.exceptions import AirflowException
+from airflow.sensors.base_sensor_operator import BaseSensorOperator
+from airflow.utils.decorators import apply_defaults
+
+
+class LookerDatagroupSensor(BaseSensorOperator):
+    """
+    Wait until Looker has acted on datagroup updates and derived table builds,
+    i.e. downstream of `LookerUpdateDataGroupByIDOperator` or
+    `LookerRebuildDerivedTablesOperator`.
+
+    A datagroup is ready once Looker has checked its trigger after
+    `stale_before`, and a build once its status is complete. Every poke reads
+    all datagroups in one call and the build statuses concurrently, so one
+    sensor can watch many of them. The sensor fails as soon as a datagroup
+    trigger or a build fails.
+
+    Runs in `reschedule` mode with exponential backoff between pokes by
+    default, so no worker slot is held while waiting.
+
+    :param datagroup_ids: The datagroups to wait for.
+    :type datagroup_ids: list
+    :param materialization_ids: The derived table builds to wait for, as returned by `start_pdt_build`.
+    :type materialization_ids: list
+    :param stale_before: The `stale_before` timestamp the datagroups were updated with. Defaults to the
+        time the sensor started.
+    :type stale_before: int
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param max_workers: The maximum number of build statuses checked concurrently. Defaults to 8.
+    :type max_workers: int
+    """
+    template_fields = ('datagroup_ids', 'materialization_ids', 'stale_before')
+    ui_color = '#615286'
+
+    @apply_defaults
+    def __init__(self, datagroup_ids=None, materialization_ids=None, stale_before=None,
+                 looker_conn_id='looker_default', max_workers=8, *args, **kwargs):
+        kwargs.setdefault('mode', 'reschedule')
+        kwargs.setdefault('exponential_backoff', True)
+        super(LookerDatagroupSensor, self).__init__(*args, **kwargs)
+        if not datagroup_ids and not materialization_ids:
+            raise AirflowException("At least one of datagroup_ids or materialization_ids must be provided")
+        self.datagroup_ids = datagroup_ids or []
+        self.materialization_ids = materialization_ids or []
+        self.stale_before = stale_before
+        self.looker_conn_id = looker_conn_id
+        self.max_workers = max_workers
+
+    def _get_hook(self, **kwargs):
+        # imported here to keep importing the sensor cheap when DAG files are parsed
+        from airflow_looker.hooks.looker_hook import LookerHook
+        return LookerHook(looker_conn_id=self.looker_conn_id, **kwargs)
+
+    def _get_stale_before(self, context):
+        if self.stale_before is not None:
+            return int(self.stale_before)
+        # in reschedule mode the start date is that of the first poke
+        return int(context['ti'].start_date.timestamp())
+
+    def _poke_datagroups(self, looker, stale_before):
+        """
+        Returns the IDs of the datagroups whose trigger Looker has not checked
+        since `stale_before`
+        """
+        if not self.datagroup_ids:
+            return []
+
+        # polling must not be answered from the response cache, nor by a
+        # replica whose trigger checks may lag behind the primary's
+        response = looker.call(method='GET', endpoint='api/3.0/datagroups', use_cache=False, allow_replica=False,
+                               data={'fields': 'id,triggered_at,trigger_check_at,trigger_error'})
+        datagroups = {str(datagroup['id']): datagroup for datagroup in response.json()}
+
+        pending = []
+        for datagroup_id in self.datagroup_ids:
+            datagroup = datagroups.get(str(datagroup_id))
+            if datagroup is None:
+                _message = "Datagroup {} not found".format(datagroup_id)
+                self.log.error(_message)
+                raise AirflowException(_message)
+            if datagroup.get('trigger_error'):
+                _message = "Datagroup {} trigger failed: {}".format(datagroup_id, datagroup['trigger_error'])
+                self.log.error(_message)
+                raise AirflowException(_message)
+            trigger_check_at = datagroup.get('trigger_check_at')
+            if trigger_check_at is None or trigger_check_at < stale_before:
+                pending.append(datagroup_id)
+        return pending
+
+    def _poke_builds(self, looker):
+        """
+        Returns the IDs of the derived table builds that are still running
+        """
+        from airflow_looker.hooks.looker_hook import PDT_BUILD_COMPLETE_STATUSES, PDT_BUILD_FAILED_STATUSES
+
+        if not self.materialization_ids:
+            return []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            statuses = list(executor.map(looker.get_pdt_build_status, self.materialization_ids))
+
+        pending = []
+        for materialization_id, status in zip(self.materialization_ids, statuses):
+            if status in PDT_BUILD_FAILED_STATUSES:
+                _message = "Derived table build {} failed with status {}".format(materialization_id, status)
+                self.log.error(_message)
+                raise AirflowException(_message)
+            if status not in PDT_BUILD_COMPLETE_STATUSES:
+                pending.append(materialization_id)
+        return pending
+
+    def poke(self, context):
+        stale_before = self._get_stale_before(context)
+        with self._get_hook(pool_maxsize=self.max_workers) as looker:
+            pending_datagroups = self._poke_datagroups(looker, stale_before)
+            pending_builds = self._poke_builds(looker)
+
+        if pending_datagroups or pending_builds:
+            self.log.info("Waiting for %s of %s datagroups and %s of %s derived table builds. Datagroups: %s, "
+                          "builds: %s", len(pending_datagroups), len(self.datagroup_ids), len(pending_builds),
+                          len(self.materialization_ids), pending_datagroups, pending_builds)
+            return False
+        self.log.info("Looker checked %s datagroups since %s and completed %s derived table builds",
+                      len(self.datagroup_ids), stale_before, len(self.materialization_ids))
+        return True
@@ -0,0 +1,125 @@
+import asyncio
+
+from airflow.exceptions import AirflowException
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+from airflow_looker.hooks.looker_async_hook import AsyncLookerHook
+from airflow_looker.hooks.looker_hook import QUERY_TASK_COMPLETE, QUERY_TASK_FAILED_STATUSES
+
+
+class LookerTrigger(BaseTrigger):
+    """
+    Base trigger that polls Looker from the triggerer with exponential
+    backoff until `check` reports the work is done.
+
+    Fires a single event, `{'status': 'success', ...}` once done or
+    `{'status': 'error', 'message': ...}` if Looker reports a failure or the
+    API call fails.
+
+    :param looker_conn_id: reference to a specific Looker connection.
+    :type looker_conn_id: string
+    :param poll_interval: seconds to wait before the second poll. Doubles after every poll. Defaults to 5.
+    :type poll_interval: float
+    :param max_poll_interval: upper bound on the wait between polls. Defaults to 60.
+    :type max_poll_interval: float
+    """
+    def __init__(self, looker_conn_id='looker_default', poll_interval=5, max_poll_interval=60):
+        super(LookerTrigger, self).__init__()
+        self.looker_conn_id = looker_conn_id
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+
+    def _serialize_kwargs(self):
+        return {
+            'looker_conn_id': self.looker_conn_id,
+            'poll_interval': self.poll_interval,
+            'max_poll_interval': self.max_poll_interval,
+        }
+
+    def serialize(self):
+        classpath = '{}.{}'.format(self.__class__.__module__, self.__class__.__name__)
+        return classpath, self._serialize_kwargs()
+
+    def _get_hook(self):
+        return AsyncLookerHook(looker_conn_id=self.looker_conn_id)
+
+    async def check(self, looker):
+        """
+        Returns a truthy payload for the success event once the work is done,
+        or None to keep polling. Raises AirflowException on failure.
+        """
+        raise NotImplementedError()
+
+    async def run(self):
+        poll_interval = self.poll_interval
+        async with self._get_hook() as looker:
+            while True:
+                try:
+                    result = await self.check(looker)
+                except AirflowException as e:
+                    yield TriggerEvent({'status': 'error', 'message': str(e)})
+                    return
+                if result is not None:
+                    yield TriggerEvent(dict(result, status='success'))
+                    return
+                self.log.info("Looker is still working, checking again in %ss", poll_interval)
+                await asyncio.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, self.max_poll_interval)
+
+
+class LookerQueryTaskTrigger(LookerTrigger):
+    """
+    Waits for an asynchronous Looker query task to complete.
+
+    :param query_task_id: The query task to wait for. Required.
+    :type query_task_id: string
+    """
+    def __init__(self, query_task_id, *args, **kwargs):
+        super(LookerQueryTaskTrigger, self).__init__(*args, **kwargs)
+        self.query_task_id = query_task_id
+
+    def _serialize_kwargs(self):
+        return dict(super(LookerQueryTaskTrigger, self)._serialize_kwargs(), query_task_id=self.query_task_id)
+
+    async def check(self, looker):
+        endpoint = '{}/{}'.format('api/3.0/query_tasks', self.query_task_id)
+        response = await looker.call(method='GET', endpoint=endpoint, data={'fields': 'id,status'})
+        status = (await response.json(content_type=None))['status']
+        if status in QUERY_TASK_FAILED_STATUSES:
+            raise AirflowException("Query task {} finished with status {}".format(self.query_task_id, status))
+        if status == QUERY_TASK_COMPLETE:
+            return {'query_task_id': self.query_task_id}
+        return None
+
+
+class LookerDatagroupTrigger(LookerTrigger):
+    """
+    Waits for Looker to act on a datagroup update, i.e. until it has checked
+    the datagroup's trigger after `stale_before`.
+
+    :param datagroup_id: The datagroup to wait for. Required.
+    :type datagroup_id: int
+    :param stale_before: The `stale_before` timestamp the datagroup was updated with. Required.
+    :type stale_before: int
+    """
+    def __init__(self, datagroup_id, stale_before, *args, **kwargs):
+        super(LookerDatagroupTrigger, self).__init__(*args, **kwargs)
+        self.datagroup_id = datagroup_id
+        self.stale_before = stale_before
+
+    def _serialize_kwargs(self):
+        return dict(super(LookerDatagroupTrigger, self)._serialize_kwargs(),
+                    datagroup_id=self.datagroup_id,
+                    stale_before=self.stale_before)
+
+    async def check(self, looker):
+        endpoint = '{}/{}'.format('api/3.0/datagroups', self.datagroup_id)
+        response = await looker.call(method='GET', endpoint=endpoint, data=None)
+        datagroup = await response.json(content_type=None)
+        if datagroup.get('trigger_error'):
+            _message = "Datagroup {} trigger failed: {}".format(self.datagroup_id, datagroup['trigger_error'])
+            raise AirflowException(_message)
+        trigger_check_at = datagroup.get('trigger_check_at')
+        if trigger_check_at is not None and trigger_check_at >= self.stale_before:
+            return {'datagroup_id': self.datagroup_id, 'trigger_check_at': trigger_check_at}
+        return None
@@ -0,0 +1,281 @@
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_API_PREFIX = re.compile(r'^/(api/[\d.]+/)?')
+
+
+class FakeLooker(object):
+    """
+    Local HTTP server answering the parts of the Looker API used by the hook,
+    for benchmarks and tests. Runs in a background thread:
+
+        with FakeLooker(latency=0.005) as looker:
+            conn = looker.connection()
+            ...
+
+    Supported endpoints are `login`, `looks/{id}`, `looks/{id}/run/{format}`,
+    `datagroups` and `datagroups/{id}`, with or without an `api/x.y/` prefix.
+    Any other answer can be queued per request path in `responses`, as
+    `(status, payload)` or `(status, payload, headers)` tuples which are
+    served in order, before authentication is checked.
+    """
+    client_id = 'bench-client-id'
+    client_secret = 'bench-client-secret'
+
+    def __init__(self, latency=0.0, rate_limit=None, token_ttl=3600, rows=1000, row_size=100, datagroups=100,
+                 chunk_size=64 * 1024):
+        """
+        :param latency: seconds every response is delayed by
+        :type latency: float
+        :param rate_limit: number of API calls per second answered before the
+        server responds 429 with a `Retry-After` header. Logins are not
+        limited. Defaults to no limit.
+        :type rate_limit: float
+        :param token_ttl: number of seconds an access token is accepted. The
+        login response always announces an hour, so shorter lifetimes make
+        the hook handle 401 responses.
+        :type token_ttl: float
+        :param rows: number of rows returned when running a look
+        :type rows: int
+        :param row_size: approximate size in bytes of every row
+        :type row_size: int
+        :param datagroups: number of datagroups listed by `datagroups`
+        :type datagroups: int
+        :param chunk_size: size of the chunks look results are streamed in
+        :type chunk_size: int
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.token_ttl = token_ttl
+        self.rows = rows
+        self.row_size = row_size
+        self.datagroups = datagroups
+        self.chunk_size = chunk_size
+        self.counts = {}
+        self.responses = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._tokens = {}
+        self._window = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def connection(self, conn_id='looker_benchmark', extra=None):
+        """
+        Returns an Airflow connection pointing at the server
+        """
+        return looker_connection(self.url, conn_id=conn_id, extra=extra)
+
+    def start(self):
+        handler = type('FakeLookerHandler', (_Handler,), {'looker': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def logins(self):
+        return self.counts.get('login', 0)
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens[token] = time.time() + self.token_ttl
+        return token
+
+    def revoke_tokens(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def is_valid(self, token):
+        with self._lock:
+            expires_at = self._tokens.get(token)
+        return expires_at is not None and time.time() < expires_at
+
+    def queued_response(self, path):
+        with self._lock:
+            queue = self.responses.get(path)
+            return queue.pop(0) if queue else None
+
+    def track(self, delta):
+        with self._lock:
+            self.in_flight += delta
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def throttle(self):
+        """
+        Returns the number of seconds the caller has to wait before calling
+        again, or None if the call is allowed
+        """
+        if not self.rate_limit:
+            return None
+        now = time.time()
+        with self._lock:
+            self._window = [at for at in self._window if now - at < 1]
+            if len(self._window) >= self.rate_limit:
+                return 1 - (now - self._window[0])
+            self._window.append(now)
+        return None
+
+    def iter_rows(self, result_format):
+        """
+        Yields look results in chunks of about `chunk_size` bytes
+        """
+        padding = 'x' * max(0, self.row_size - 40)
+        if result_format == 'json':
+            rows = ('{}{{"id": {}, "name": "row {}", "padding": "{}"}}'.format(', ' if i else '[', i, i, padding)
+                    for i in range(self.rows))
+            last = ']'
+        else:
+            rows = ('{},row {},{}\n'.format(i, i, padding) for i in range(self.rows))
+            last = ''
+            yield 'id,name,padding\n'.encode('utf-8')
+        chunk = []
+        size = 0
+        for row in rows:
+            chunk.append(row)
+            size += len(row)
+            if size >= self.chunk_size:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+                size = 0
+        chunk.append(last)
+        yield ''.join(chunk).encode('utf-8')
+
+
+def looker_connection(url, conn_id='looker_benchmark', extra=None):
+    """
+    Returns an Airflow connection for the fake Looker server at `url`
+    """
+    from airflow.models import Connection
+    return Connection(conn_id=conn_id, conn_type='http', host=url, login=FakeLooker.client_id,
+                      password=FakeLooker.client_secret, extra=json.dumps(extra or {}))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+    looker = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def _handle(self, method):
+        looker = self.looker
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with looker._lock:
+            looker.requests.append({'method': method, 'path': url.path, 'headers': dict(self.headers)})
+        looker.track(1)
+        try:
+            if looker.latency:
+                time.sleep(looker.latency)
+            self._respond(method, url, body)
+        finally:
+            looker.track(-1)
+
+    def _respond(self, method, url, body):
+        looker = self.looker
+        path = _API_PREFIX.sub('', url.path).strip('/')
+
+        if method == 'POST' and path == 'login':
+            looker.count('login')
+            form = parse_qs(body.decode('utf-8'))
+            if form.get('client_id') != [looker.client_id] or form.get('client_secret') != [looker.client_secret]:
+                return self._send_json(401, {'message': 'Invalid credentials'})
+            return self._send_json(200, {'access_token': looker.issue_token(), 'expires_in': 3600})
+
+        queued = looker.queued_response(url.path)
+        if queued is not None:
+            return self._send_json(*queued)
+
+        authorization = self.headers.get('Authorization') or ''
+        if not looker.is_valid(authorization[len('token '):]):
+            looker.count('unauthorized')
+            return self._send_json(401, {'message': 'Requires authentication.'})
+
+        wait = looker.throttle()
+        if wait is not None:
+            looker.count('throttled')
+            return self._send_json(429, {'message': 'Too many requests'}, {'Retry-After': '{:.3f}'.format(wait)})
+
+        segments = path.split('/')
+        looker.count('{} {}'.format(method, re.sub(r'/\d+', '/{id}', path)))
+        if method == 'GET' and segments[0] == 'looks' and len(segments) == 4 and segments[2] == 'run':
+            if segments[3] == 'sql':
+                return self._send_text(200, 'SELECT * FROM look_{}'.format(segments[1]))
+            return self._send_stream(looker.iter_rows(segments[3]))
+        if method == 'GET' and segments[0] == 'looks' and len(segments) == 2:
+            look = {'id': int(segments[1]), 'title': 'Look {}'.format(segments[1]), 'query_id': int(segments[1])}
+            fields = parse_qs(url.query).get('fields')
+            if fields:
+                look = {name: value for name, value in look.items() if name in fields[0].split(',')}
+            return self._send_json(200, look)
+        if method == 'GET' and path == 'datagroups':
+            return self._send_json(200, [{'id': i, 'name': 'datagroup_{}'.format(i)}
+                                         for i in range(1, looker.datagroups + 1)])
+        if method == 'PATCH' and segments[0] == 'datagroups' and len(segments) == 2:
+            return self._send_json(200, dict(json.loads(body or b'{}'), id=int(segments[1])))
+        return self._send_json(404, {'message': 'Not found'})
+
+    def _send_text(self, status, text, headers=None, content_type='text/plain'):
+        payload = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send_text(status, json.dumps(payload), headers, content_type='application/json')
+
+    def _send_stream(self, chunks):
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            if chunk:
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
@@ -0,0 +1,90 @@
+"""
+Measures what importing the package costs a DAG file.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 20 --max-ms 50
+
+Every statement is timed in a fresh Python process that has already imported
+Airflow, as the scheduler's DAG processor has, so only the package's own cost
+is measured. The median of `--repeat` runs is reported with the package
+modules the statement loaded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import OrderedDict
+
+STATEMENTS = OrderedDict([
+    ('package', 'import airflow_looker'),
+    ('operator', 'from airflow_looker import LookerUpdateDataGroupByIDOperator'),
+    ('sensor', 'from airflow_looker import LookerDatagroupSensor'),
+    ('hook', 'from airflow_looker import LookerHook'),
+])
+
+_MEASURE = '''
+import json, sys, time
+import airflow
+from airflow.models import BaseOperator
+from airflow.sensors.base_sensor_operator import BaseSensorOperator
+started_at = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - started_at
+print(json.dumps({{"seconds": seconds, "modules": sorted(m for m in sys.modules if m.startswith("airflow_looker"))}}))
+'''
+
+
+def measure(statement):
+    """
+    Runs `statement` in a fresh process and returns the seconds it took and
+    the package modules it loaded
+    """
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', _MEASURE.format(statement=statement)],
+                                     cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def run(names, repeat):
+    all_results = []
+    for name in names:
+        runs = sorted((measure(STATEMENTS[name]) for _ in range(repeat)), key=lambda result: result['seconds'])
+        all_results.append(OrderedDict([
+            ('benchmark', name),
+            ('statement', STATEMENTS[name]),
+            ('median_ms', runs[len(runs) // 2]['seconds'] * 1000),
+            ('min_ms', runs[0]['seconds'] * 1000),
+            ('modules', runs[0]['modules']),
+        ]))
+    return all_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of airflow_looker")
+    parser.add_argument('--only', default=','.join(STATEMENTS),
+                        type=lambda value: [name for name in value.split(',') if name],
+                        help="comma separated statements to time, out of: {}".format(', '.join(STATEMENTS)))
+    parser.add_argument('--repeat', type=int, default=10, help="runs per statement, the median is reported")
+    parser.add_argument('--max-ms', type=float, help="exit with an error if a median is slower than this")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = set(args.only) - set(STATEMENTS)
+    if unknown:
+        parser.error("unknown statements: {}".format(', '.join(sorted(unknown))))
+
+    all_results = run(args.only, args.repeat)
+    for results in all_results:
+        print('{:<10} {:>8.1f} ms median  {:>8.1f} ms min  {}'.format(
+            results['benchmark'], results['median_ms'], results['min_ms'], ', '.join(results['modules'])))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+    slow = [results['benchmark'] for results in all_results
+            if args.max_ms is not None and results['median_ms'] > args.max_ms]
+    if slow:
+        sys.exit("Slower than {} ms: {}".format(args.max_ms, ', '.join(slow)))
+
+
+if __name__ == '__main__':
+    main()
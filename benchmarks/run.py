@@ -0,0 +1,231 @@
+"""
+Benchmarks for LookerHook against a local fake Looker server.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --only call,download --latency 20 --rate-limit 200 --json results.json
+
+Every benchmark runs `--repeat` times, each in a fresh Python process so that
+the peak RSS of one run does not leak into the next, while the fake server
+runs in this process. The run with the median throughput is reported.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from benchmarks.fake_looker import FakeLooker, looker_connection
+
+CONN_ID = 'looker_benchmark'
+
+
+def _hook(args, sink, **kwargs):
+    from airflow_looker.hooks.looker_hook import LookerHook
+    return LookerHook(looker_conn_id=CONN_ID, metrics=sink, pool_maxsize=args.concurrency,
+                      retry_limit=args.retry_limit, **kwargs)
+
+
+def bench_call(args, sink):
+    """
+    GET `looks/{id}` from `--concurrency` threads sharing one hook
+    """
+    with _hook(args, sink) as looker:
+        looker.get_token()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda i: looker.call('GET', 'api/3.0/looks/{}'.format(i % 100 + 1), None),
+                              range(args.requests)))
+    return {'timing': 'request'}
+
+
+def bench_login(args, sink):
+    """
+    Log in `--requests` times from `--concurrency` threads
+    """
+    with _hook(args, sink) as looker:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda i: looker.login(), range(args.requests)))
+    return {'timing': 'login'}
+
+
+def bench_datagroups(args, sink):
+    """
+    Update `--requests` datagroups with `LookerUpdateDataGroupsOperator`
+    """
+    from airflow_looker.operators.looker_operator import LookerUpdateDataGroupsOperator
+
+    class _Operator(LookerUpdateDataGroupsOperator):
+        def _get_hook(self, **kwargs):
+            kwargs.pop('pool_maxsize', None)
+            return _hook(args, sink, **kwargs)
+
+    operator = _Operator(task_id='benchmark_datagroups', looker_conn_id=CONN_ID,
+                         datagroup_ids=list(range(1, args.requests + 1)), max_workers=args.concurrency)
+    operator.execute(context={'ti': mock.Mock()})
+    return {'timing': 'request'}
+
+
+def bench_download(args, sink):
+    """
+    Stream `--downloads` look results of `--rows` rows to a file, one at a time
+    """
+    fd, path = tempfile.mkstemp(prefix='looker_benchmark_')
+    os.close(fd)
+    size = 0
+    try:
+        with _hook(args, sink) as looker:
+            for look_id in range(1, args.downloads + 1):
+                looker.download_look(look_id, args.format, path)
+                size += os.path.getsize(path)
+    finally:
+        os.remove(path)
+    return {'timing': 'request', 'bytes': size}
+
+
+BENCHMARKS = OrderedDict([
+    ('call', bench_call),
+    ('login', bench_login),
+    ('datagroups', bench_datagroups),
+    ('download', bench_download),
+])
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of `values`
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(percent / 100.0 * len(values))) - 1))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+
+def run_benchmark(name, args):
+    """
+    Runs one benchmark in this process against the server at `args.url` and
+    returns its results
+    """
+    from airflow.hooks.base_hook import BaseHook
+    from airflow_looker.hooks.metrics import InMemorySink
+
+    extra = {'rate_limit': args.client_rate_limit} if args.client_rate_limit else {}
+    sink = InMemorySink()
+    with mock.patch.object(BaseHook, 'get_connection', return_value=looker_connection(args.url, CONN_ID, extra)):
+        started_at = time.monotonic()
+        details = BENCHMARKS[name](args, sink)
+        elapsed = time.monotonic() - started_at
+
+    timing_name = details.pop('timing')
+    latencies = [seconds for timing, seconds, _ in sink.timings if timing == timing_name]
+    results = OrderedDict([
+        ('benchmark', name),
+        ('requests', len(latencies)),
+        ('seconds', elapsed),
+        ('requests_per_second', len(latencies) / elapsed if elapsed else None),
+        ('p50_ms', percentile(latencies, 50) * 1000 if latencies else None),
+        ('p99_ms', percentile(latencies, 99) * 1000 if latencies else None),
+        ('peak_rss_mb', peak_rss_mb()),
+        ('logins', sink.count('logins')),
+        ('retries', sink.count('retries')),
+    ])
+    if 'bytes' in details:
+        results['mb_per_second'] = details['bytes'] / 1024.0 / 1024 / elapsed
+    return results
+
+
+def _child_args(args):
+    child_args = []
+    for option in ('requests', 'concurrency', 'downloads', 'format', 'retry_limit', 'client_rate_limit', 'log_level'):
+        value = getattr(args, option)
+        if value is not None:
+            child_args += ['--' + option.replace('_', '-'), str(value)]
+    return child_args
+
+
+def run(args):
+    server = FakeLooker(latency=args.latency / 1000.0, rate_limit=args.rate_limit, token_ttl=args.token_ttl,
+                        rows=args.rows, row_size=args.row_size)
+    all_results = []
+    with server:
+        for name in args.only:
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.check_output(
+                    [sys.executable, '-m', 'benchmarks.run', '--child', name, '--url', server.url] + _child_args(args),
+                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    env=dict(os.environ, PYTHONWARNINGS='ignore'))
+                runs.append(json.loads(output.decode('utf-8').strip().splitlines()[-1], object_pairs_hook=OrderedDict))
+            runs.sort(key=lambda results: results['requests_per_second'] or 0)
+            all_results.append(runs[len(runs) // 2])
+    return all_results
+
+
+def print_table(all_results):
+    columns = [('benchmark', '{}'), ('requests', '{}'), ('requests_per_second', '{:.1f}'), ('p50_ms', '{:.2f}'),
+               ('p99_ms', '{:.2f}'), ('peak_rss_mb', '{:.1f}'), ('logins', '{}'), ('retries', '{}'),
+               ('mb_per_second', '{:.1f}')]
+    rows = [[name for name, _ in columns]]
+    for results in all_results:
+        rows.append([fmt.format(results[name]) if results.get(name) is not None else '-' for name, fmt in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LookerHook against a local fake Looker server")
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        type=lambda value: [name for name in value.split(',') if name],
+                        help="comma separated benchmarks to run, out of: {}".format(', '.join(BENCHMARKS)))
+    parser.add_argument('--requests', type=int, default=500, help="calls, logins or datagroups per run")
+    parser.add_argument('--concurrency', type=int, default=8, help="threads sharing the hook")
+    parser.add_argument('--downloads', type=int, default=5, help="look results downloaded per run")
+    parser.add_argument('--format', default='csv', help="result format of the downloads")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the median is reported")
+    parser.add_argument('--retry-limit', type=int, default=10, help="the hook's retry_limit")
+    parser.add_argument('--client-rate-limit', type=float, help="the connection's rate_limit extra")
+    parser.add_argument('--latency', type=float, default=0, help="server latency in milliseconds")
+    parser.add_argument('--rate-limit', type=float, help="calls per second the server allows before answering 429")
+    parser.add_argument('--token-ttl', type=float, default=3600, help="seconds the server accepts a token")
+    parser.add_argument('--rows', type=int, default=100000, help="rows per look result")
+    parser.add_argument('--row-size', type=int, default=100, help="bytes per result row")
+    parser.add_argument('--log-level', default='WARNING', help="level of the hook's logs during the runs")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: {}".format(', '.join(sorted(unknown))))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        logging.getLogger('airflow_looker').setLevel(args.log_level)
+        logging.getLogger('airflow.task').setLevel(args.log_level)
+        print(json.dumps(run_benchmark(args.child, args)))
+        return
+
+    all_results = run(args)
+    print_table(all_results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -55,13 +55,23 @@ class UploadCommand(Command):
 setup(
     name='airflow-looker',
     version=about['__version__'],
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     install_requires=['apache-airflow >= 1.10.3'],
     extras_require={
+        'async': [
+            'aiohttp'
+        ],
+        'statsd': [
+            'statsd'
+        ],
+        'tracing': [
+            'opentelemetry-api'
+        ],
         'dev': [
             'pytest',
             'flake8',
-            'requests_mock'
+            'requests_mock',
+            'aiohttp'
         ]
     },
     author='GoCardless',
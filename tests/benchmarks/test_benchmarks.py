@@ -0,0 +1,65 @@
+import json
+import unittest
+from unittest import mock
+
+import requests
+from airflow import AirflowException
+from airflow.hooks.base_hook import BaseHook
+from airflow_looker.hooks.looker_hook import LookerHook
+from airflow_looker.hooks.metrics import InMemorySink
+from airflow_looker.hooks.token_cache import default_token_cache
+from benchmarks.fake_looker import FakeLooker
+from benchmarks.run import BENCHMARKS, parse_args, percentile, run_benchmark
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        default_token_cache.clear()
+
+    def test_fake_looker_streams_look_results(self):
+        with FakeLooker(rows=100, chunk_size=256) as looker:
+            with mock.patch.object(BaseHook, "get_connection", return_value=looker.connection()):
+                hook = LookerHook(looker_conn_id='looker_benchmark')
+                response = hook.call(method='GET', endpoint='api/3.0/looks/7/run/json', data=None, stream=True)
+                rows = json.loads(response.content)
+        self.assertEqual(100, len(rows))
+        self.assertEqual({"id": 99, "name": "row 99"}, {key: rows[-1][key] for key in ("id", "name")})
+
+    def test_fake_looker_expires_tokens_and_throttles(self):
+        with FakeLooker(token_ttl=0, rate_limit=1) as looker:
+            with mock.patch.object(BaseHook, "get_connection", return_value=looker.connection()):
+                metrics = InMemorySink()
+                hook = LookerHook(looker_conn_id='looker_benchmark', metrics=metrics)
+                with self.assertRaises(AirflowException):
+                    hook.call(method='GET', endpoint='api/3.0/looks/1', data=None)
+            self.assertEqual(2, metrics.count("logins"))
+            self.assertEqual(2, looker.counts["unauthorized"])
+
+            looker.token_ttl = 60
+            token = looker.issue_token()
+            headers = {"Authorization": "token " + token}
+            self.assertEqual(200, requests.get(looker.url + "api/3.0/looks/1", headers=headers).status_code)
+            throttled = requests.get(looker.url + "api/3.0/looks/1", headers=headers)
+            self.assertEqual(429, throttled.status_code)
+            self.assertLessEqual(float(throttled.headers["Retry-After"]), 1)
+
+    def test_run_benchmarks(self):
+        with FakeLooker(rows=1000) as looker:
+            args = parse_args(['--requests', '20', '--concurrency', '4', '--downloads', '2'])
+            args.url = looker.url
+            for name in BENCHMARKS:
+                default_token_cache.clear()
+                results = run_benchmark(name, args)
+                self.assertEqual(name, results["benchmark"])
+                self.assertEqual(2 if name == 'download' else 20, results["requests"])
+                self.assertGreater(results["requests_per_second"], 0)
+                self.assertLessEqual(results["p50_ms"], results["p99_ms"])
+                self.assertGreater(results["peak_rss_mb"], 0)
+        self.assertGreater(results["mb_per_second"], 0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(7, percentile([7], 99))
+        self.assertIsNone(percentile([], 50))
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from airflow.hooks.base_hook import BaseHook
+from airflow_looker.hooks import rate_limiter
+from airflow_looker.hooks.looker_async_hook import AsyncLookerHook
+from airflow_looker.hooks.looker_hook import LookerApiError
+from airflow_looker.hooks.metrics import InMemorySink
+from airflow_looker.hooks.rate_limiter import FileRateLimiter
+from airflow_looker.hooks.records import Look
+from airflow_looker.hooks.token_cache import FileTokenCache, default_token_cache
+from benchmarks.fake_looker import FakeLooker
+
+
+class TestAsyncLookerHook(unittest.TestCase):
+    def setUp(self):
+        default_token_cache.clear()
+        self.looker = FakeLooker(latency=0.01).start()
+        self.addCleanup(self.looker.stop)
+
+    def run_with_hook(self, test, extra=None, **kwargs):
+        async def run():
+            connection = self.looker.connection('looker_default', extra=extra)
+            with mock.patch.object(BaseHook, 'get_connection', return_value=connection):
+                async with AsyncLookerHook(**kwargs) as looker:
+                    return await test(looker)
+        return asyncio.run(run())
+
+    def test_get_look_sqls_bounds_concurrency(self):
+        sqls = self.run_with_hook(lambda looker: looker.get_look_sqls(range(1, 101)), max_concurrency=5)
+
+        self.assertEqual({look_id: 'SELECT * FROM look_{}'.format(look_id) for look_id in range(1, 101)}, sqls)
+        self.assertEqual(5, self.looker.max_in_flight)
+        self.assertEqual(1, self.looker.logins)
+
+    def test_concurrent_calls_share_token_refresh(self):
+        async def test(looker):
+            await looker.get_token()
+            self.looker.revoke_tokens()
+            return await looker.call_many([('GET', 'api/3.0/looks/{}/run/sql'.format(i), None) for i in range(20)])
+
+        responses = self.run_with_hook(test, max_concurrency=20)
+
+        self.assertEqual([200] * 20, [response.status for response in responses])
+        self.assertEqual(2, self.looker.logins)
+
+    def test_call_retries_throttled_requests(self):
+        self.looker.responses['/api/3.0/looks/1'] = [(429, {'message': 'Too many requests'}, {'Retry-After': '0'}),
+                                                     (503, {'message': 'Unavailable'})]
+        metrics = InMemorySink()
+
+        look = self.run_with_hook(lambda looker: looker.get_look(1, record=Look), metrics=metrics)
+
+        self.assertEqual(Look(id=1, title='Look 1', query_id=1), look)
+        self.assertEqual(2, metrics.count('retries', endpoint='looks/{id}'))
+        self.assertEqual(3, metrics.count('requests', endpoint='looks/{id}'))
+
+    def test_get_json_many_returns_exceptions(self):
+        self.looker.responses['/api/3.0/looks/2'] = [(404, {'message': 'Not found'})]
+
+        looks = self.run_with_hook(lambda looker: looker.get_json_many(
+            ['api/3.0/looks/1', 'api/3.0/looks/2'], fields=['id', 'title'], return_exceptions=True))
+
+        self.assertEqual({'id': 1, 'title': 'Look 1'}, looks[0])
+        self.assertIsInstance(looks[1], LookerApiError)
+        self.assertEqual(404, looks[1].status_code)
+
+    def test_file_rate_limiter_is_acquired_off_the_event_loop(self):
+        threads = []
+        try_acquire = FileRateLimiter.try_acquire
+
+        def record_thread(limiter):
+            threads.append(threading.current_thread())
+            return try_acquire(limiter)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(rate_limiter._rate_limiters, clear=True), \
+                mock.patch.object(FileRateLimiter, 'try_acquire', record_thread):
+            extra = {'rate_limit': 100, 'rate_limit_path': os.path.join(directory, 'bucket.json')}
+            sqls = self.run_with_hook(lambda looker: looker.get_look_sqls([1, 2, 3]), extra=extra)
+
+        self.assertEqual(3, len(sqls))
+        self.assertEqual(3, len(threads))
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_file_token_cache_is_used_off_the_event_loop(self):
+        threads = []
+        read = FileTokenCache._read
+
+        def record_thread(cache):
+            threads.append(threading.current_thread())
+            return read(cache)
+
+        async def test(looker):
+            await looker.get_token()
+            self.looker.revoke_tokens()
+            return await looker.get_look_sql(1)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(FileTokenCache, '_read', record_thread):
+            token_cache = FileTokenCache(os.path.join(directory, 'tokens.json'))
+            sql = self.run_with_hook(test, token_cache=token_cache)
+
+        self.assertEqual('SELECT * FROM look_1', sql)
+        self.assertEqual(2, self.looker.logins)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
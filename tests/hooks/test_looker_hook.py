@@ -1,14 +1,27 @@
 import io
+import os
 import json
+import tempfile
+import time
 import requests
 import unittest
 import requests_mock
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 from requests import Response
 from airflow import AirflowException
 from airflow.hooks.base_hook import BaseHook
 from airflow.models import Connection
-from airflow_looker.hooks.looker_hook import LookerHook
+from airflow_looker.hooks.looker_hook import LookerApiError, LookerHook, RowCounter, iter_json_array
+from airflow_looker.hooks.payload_log import LogPayload, format_payload, redact
+from airflow_looker.hooks.metrics import InMemorySink, MetricsSink, StatsdSink, endpoint_template, get_metrics_sink
+from airflow_looker.hooks import rate_limiter
+from airflow_looker.hooks.rate_limiter import FileRateLimiter, RateLimiter
+from airflow_looker.hooks import response_cache
+from airflow_looker.hooks import routing
+from airflow_looker.hooks.records import Look, record
+from airflow_looker.hooks.response_cache import FileResponseCache, ResponseCache
+from airflow_looker.hooks.token_cache import FileTokenCache, TokenCache, default_token_cache
 
 
 class TestLookerHook(unittest.TestCase):
@@ -25,6 +38,8 @@ class TestLookerHook(unittest.TestCase):
         self.looker_auth_token = "fancy-pancy-access-token"
         self.login_response_payload = {"access_token": self.looker_auth_token}
         self.default_hook = LookerHook()
+        default_token_cache.clear()
+        routing._instance_health.clear()
         session = requests.Session()
         adapter = requests_mock.Adapter()
         session.mount('mock', adapter)
@@ -259,7 +274,8 @@ WHERE artist = "cardi b"
         mock_request.assert_called_once_with(
             data=None,
             endpoint=endpoint,
-            method=query_fetch_method
+            method=query_fetch_method,
+            use_cache=True
         )
         self.assertEqual(mock_sql_query.decode('utf8'), query)
 
@@ -281,6 +297,923 @@ WHERE artist = "cardi b"
         with self.assertRaises(AirflowException):
             self.default_hook.get_look_sql()
 
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_reuses_cached_token(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        login = mock_request.post(
+            looker_auth_url,
+            status_code=200,
+            text=json.dumps({"access_token": self.looker_auth_token, "expires_in": 3600}),
+            reason='OK'
+        )
+        mock_request.get(looks_url, status_code=200, text='[]', reason='OK')
+
+        self.default_hook.call(method="GET", endpoint="looks", data=None)
+        self.default_hook.call(method="GET", endpoint="looks", data=None)
+        LookerHook().call(method="GET", endpoint="looks", data=None)
+        self.assertEqual(1, login.call_count)
+        self.assertEqual(2, mock_get_connection.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_logs_in_again_when_token_expires(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        login = mock_request.post(
+            looker_auth_url,
+            status_code=200,
+            text=json.dumps({"access_token": self.looker_auth_token, "expires_in": 30}),
+            reason='OK'
+        )
+        mock_request.get(looks_url, status_code=200, text='[]', reason='OK')
+
+        # 30 seconds is within the default leeway so the token is never reused
+        self.default_hook.call(method="GET", endpoint="looks", data=None)
+        self.default_hook.call(method="GET", endpoint="looks", data=None)
+        self.assertEqual(2, login.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_refreshes_token_once_on_401(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        login = mock_request.post(
+            looker_auth_url,
+            [
+                {'status_code': 200, 'text': json.dumps({"access_token": "expired", "expires_in": 3600})},
+                {'status_code': 200, 'text': json.dumps({"access_token": "fresh", "expires_in": 3600})},
+            ]
+        )
+        looks = mock_request.get(
+            looks_url,
+            [
+                {'status_code': 401, 'text': '{"message":"Requires authentication."}', 'reason': 'Unauthorized'},
+                {'status_code': 200, 'text': '[]', 'reason': 'OK'},
+            ]
+        )
+
+        response = self.default_hook.call(method="GET", endpoint="looks", data=None)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, login.call_count)
+        self.assertEqual("token fresh", looks.last_request.headers['Authorization'])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_raises_when_token_rejected_twice(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        login = mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(looks_url, status_code=401, text='{}', reason='Unauthorized')
+
+        with self.assertRaises(AirflowException):
+            self.default_hook.call(method="GET", endpoint="looks", data=None)
+        self.assertEqual(2, login.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_login_failure(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        mock_request.post(looker_auth_url, status_code=403, text='{}', reason='Forbidden')
+
+        with self.assertRaises(AirflowException):
+            self.default_hook.get_conn()
+
+    def test_token_cache_get_or_fetch(self):
+        cache = TokenCache(leeway=60)
+        fetch = mock.Mock(return_value=("token", 3600))
+        self.assertEqual("token", cache.get_or_fetch("key", fetch))
+        self.assertEqual("token", cache.get_or_fetch("key", fetch))
+        self.assertEqual(1, fetch.call_count)
+
+        cache.invalidate("key", "another-token")
+        self.assertEqual("token", cache.get("key"))
+        cache.invalidate("key", "token")
+        self.assertIsNone(cache.get("key"))
+
+    def test_file_token_cache_is_shared(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "tokens.json")
+            FileTokenCache(path).set("key", "token", 3600)
+            self.assertEqual("token", FileTokenCache(path).get("key"))
+            self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_file_token_cache_from_connection_extra(self, mock_request, mock_get_connection):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "tokens.json")
+            self.looker_airflow_connection.extra = json.dumps({"token_cache_path": path})
+            mock_get_connection.return_value = self.looker_airflow_connection
+            looker_auth_url = "{}{}".format(self.looker_host, "login")
+            mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+
+            self.default_hook.get_conn()
+            self.assertIsInstance(self.default_hook.token_cache, FileTokenCache)
+            self.assertEqual(self.looker_auth_token, FileTokenCache(path).get(
+                TokenCache.make_key("looker_default", self.looker_host)))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_conn_reuses_session(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+
+        hook = LookerHook(pool_maxsize=32)
+        session = hook.get_conn()
+        self.assertIs(session, hook.get_conn())
+        self.assertEqual(32, session.get_adapter(self.looker_host)._pool_maxsize)
+
+    def test_threads_share_one_session(self):
+        def slow_session():
+            time.sleep(0.01)
+            return mock.Mock()
+
+        hook = LookerHook()
+        with mock.patch("airflow_looker.hooks.looker_hook.requests.Session", side_effect=slow_session) as session:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                sessions = list(executor.map(lambda _: hook._get_session(), range(8)))
+        self.assertEqual(1, session.call_count)
+        self.assertEqual(1, len(set(map(id, sessions))))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_context_manager_closes_session(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+
+        with mock.patch.object(requests.Session, "close") as mock_close:
+            with LookerHook() as hook:
+                hook.get_conn()
+        mock_close.assert_called_once_with()
+        self.assertIsNone(hook._session)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_download_look_to_path(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        results_url = "{}{}".format(self.looker_host, "api/3.0/looks/42/run/csv")
+        results = b"id,name\n" + b"".join(b"%d,row\n" % i for i in range(1000))
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        looks = mock_request.get(results_url, status_code=200, body=io.BytesIO(results))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "results.csv")
+            size = self.default_hook.download_look(42, "csv", path, chunk_size=64, params={"limit": -1})
+            with open(path, "rb") as f:
+                self.assertEqual(results, f.read())
+        self.assertEqual(len(results), size)
+        self.assertEqual({"limit": ["-1"]}, looks.last_request.qs)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_download_look_to_fileobj(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        results_url = "{}{}".format(self.looker_host, "api/3.0/looks/42/run/json")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(results_url, status_code=200, body=io.BytesIO(b'[{"id": 1}]'))
+
+        fileobj = io.BytesIO()
+        self.default_hook.download_look(42, "json", fileobj)
+        self.assertEqual(b'[{"id": 1}]', fileobj.getvalue())
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_create_query_task(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        query_tasks_url = "{}{}".format(self.looker_host, "api/3.0/query_tasks")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        query_tasks = mock_request.post(query_tasks_url, status_code=200, text='{"id": "abc123"}')
+
+        self.assertEqual("abc123", self.default_hook.create_query_task(42, result_format="json"))
+        self.assertEqual({"query_id": 42, "result_format": "json"}, query_tasks.last_request.json())
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_dashboard_render_task(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        render_url = "{}{}".format(self.looker_host, "api/3.0/render_tasks/dashboards/7/pdf")
+        render_task_url = "{}{}".format(self.looker_host, "api/3.0/render_tasks/r1")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        render = mock_request.post(render_url, status_code=200, text='{"id": "r1"}')
+        mock_request.get(render_task_url, status_code=200, text='{"id": "r1", "status": "failure"}')
+        mock_request.get(render_task_url + "/results", status_code=200, content=b"%PDF-1.4")
+
+        self.assertEqual("r1", self.default_hook.create_dashboard_render_task(
+            7, width=800, height=600, dashboard_style="tiled", params={"pdf_paper_size": "a4"}))
+        self.assertEqual({"height": ["600"], "pdf_paper_size": ["a4"], "width": ["800"]}, render.last_request.qs)
+        self.assertEqual({"dashboard_style": "tiled"}, render.last_request.json())
+        with self.assertRaisesRegex(AirflowException, "Render task r1 finished with status failure"):
+            self.default_hook.check_render_task("r1")
+        fileobj = io.BytesIO()
+        self.assertEqual(8, self.default_hook.get_render_task_results("r1", fileobj))
+        self.assertEqual(b"%PDF-1.4", fileobj.getvalue())
+
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(LookerHook, "get_query_task_status")
+    def test_wait_for_query_task_backs_off(self, mock_get_status, mock_sleep):
+        mock_get_status.side_effect = ["added", "running", "running", "running", "complete"]
+
+        self.default_hook.wait_for_query_task("abc123", poll_interval=1, max_poll_interval=5)
+
+        self.assertEqual([mock.call(1), mock.call(2), mock.call(4), mock.call(5)], mock_sleep.call_args_list)
+
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(LookerHook, "get_query_task_status")
+    def test_wait_for_query_task_error(self, mock_get_status, mock_sleep):
+        mock_get_status.side_effect = ["running", "error"]
+
+        with self.assertRaises(AirflowException):
+            self.default_hook.wait_for_query_task("abc123")
+
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(LookerHook, "get_query_task_status")
+    def test_wait_for_query_task_timeout(self, mock_get_status, mock_sleep):
+        mock_get_status.return_value = "running"
+
+        with self.assertRaises(AirflowException):
+            self.default_hook.wait_for_query_task("abc123", poll_interval=1, timeout=0.5)
+        mock_sleep.assert_not_called()
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_query_task_results(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        results_url = "{}{}".format(self.looker_host, "api/3.0/query_tasks/abc123/results")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(results_url, status_code=200, text="id\n1\n")
+
+        self.assertEqual("id\n1\n", self.default_hook.get_query_task_results("abc123"))
+        fileobj = io.BytesIO()
+        self.assertEqual(5, self.default_hook.get_query_task_results("abc123", path_or_fileobj=fileobj))
+        self.assertEqual(b"id\n1\n", fileobj.getvalue())
+
+    @requests_mock.mock()
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_retries_throttled_requests(self, mock_request, mock_get_connection, mock_sleep):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        looks = mock_request.get(
+            looks_url,
+            [
+                {'status_code': 429, 'text': '{}', 'reason': 'Too Many Requests', 'headers': {'Retry-After': '2'}},
+                {'status_code': 503, 'text': '{}', 'reason': 'Service Unavailable'},
+                {'exc': requests.exceptions.ConnectionError('Connection reset by peer')},
+                {'status_code': 200, 'text': '[]', 'reason': 'OK'},
+            ]
+        )
+
+        hook = LookerHook(retry_delay=1, retry_max_delay=3)
+        response = hook.call(method="GET", endpoint="looks", data=None)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(4, looks.call_count)
+        delays = [delay for (delay,), _ in mock_sleep.call_args_list]
+        self.assertEqual(2, delays[0])
+        self.assertTrue(0 <= delays[1] <= 2)
+        self.assertTrue(0 <= delays[2] <= 3)
+
+    @requests_mock.mock()
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_gives_up_after_retry_limit(self, mock_request, mock_get_connection, mock_sleep):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        looks = mock_request.get(looks_url, status_code=502, text='{}', reason='Bad Gateway')
+
+        with self.assertRaises(AirflowException):
+            LookerHook(retry_limit=2).call(method="GET", endpoint="looks", data=None)
+        self.assertEqual(3, looks.call_count)
+
+    @requests_mock.mock()
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_only_retries_non_idempotent_methods_when_asked(self, mock_request, mock_get_connection, mock_sleep):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        looks = mock_request.post(
+            looks_url,
+            [
+                {'status_code': 503, 'text': '{}', 'reason': 'Service Unavailable'},
+                {'status_code': 200, 'text': '{}', 'reason': 'OK'},
+            ]
+        )
+
+        with self.assertRaises(AirflowException):
+            self.default_hook.call(method="POST", endpoint="looks", data={})
+        self.assertEqual(1, looks.call_count)
+
+        response = self.default_hook.call(method="POST", endpoint="looks", data={}, retry=True)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, looks.call_count)
+
+    @requests_mock.mock()
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_does_not_wait_out_long_retry_after(self, mock_request, mock_get_connection, mock_sleep):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        looks = mock_request.get(looks_url, status_code=429, text='{}', reason='Too Many Requests',
+                                 headers={'Retry-After': '3600'})
+
+        with self.assertRaisesRegex(AirflowException, "429:Too Many Requests"):
+            LookerHook(retry_max_delay=30).call(method="GET", endpoint="looks", data=None)
+        self.assertEqual(1, looks.call_count)
+        mock_sleep.assert_not_called()
+
+    def test_retry_delay_from_retry_after_date(self):
+        response = Response()
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(0, self.default_hook._get_retry_delay(0, response))
+
+    @mock.patch("airflow_looker.hooks.rate_limiter.time")
+    def test_rate_limiter_allows_burst_then_waits(self, mock_time):
+        mock_time.time.return_value = 1000.0
+        limiter = RateLimiter(rate=2, burst=3)
+
+        for _ in range(3):
+            self.assertEqual(0, limiter.try_acquire())
+        self.assertAlmostEqual(0.5, limiter.try_acquire())
+
+        mock_time.time.return_value = 1000.5
+        self.assertEqual(0, limiter.try_acquire())
+
+    def test_file_rate_limiter_is_shared(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "bucket.json")
+            self.assertEqual(0, FileRateLimiter(path, rate=1, burst=1).try_acquire())
+            self.assertGreater(FileRateLimiter(path, rate=1, burst=1).try_acquire(), 0)
+
+    @requests_mock.mock()
+    @mock.patch.object(RateLimiter, "acquire")
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_rate_limit_from_connection_extra(self, mock_request, mock_get_connection, mock_acquire):
+        self.looker_airflow_connection.extra = json.dumps({"rate_limit": 5, "rate_limit_burst": 10})
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "looks")
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(looks_url, status_code=200, text='[]')
+
+        with mock.patch.dict(rate_limiter._rate_limiters, clear=True):
+            first_hook, second_hook = LookerHook(), LookerHook()
+            first_hook.call(method="GET", endpoint="looks", data=None)
+            second_hook.call(method="GET", endpoint="looks", data=None)
+
+        self.assertIs(first_hook.rate_limiter, second_hook.rate_limiter)
+        self.assertEqual(5, first_hook.rate_limiter.rate)
+        self.assertEqual(10, first_hook.rate_limiter.burst)
+        self.assertEqual(2, mock_acquire.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_iter_pages(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        search_url = "{}{}".format(self.looker_host, "api/3.0/looks/search")
+        looks = [{"id": i} for i in range(5)]
+
+        def page(request, context):
+            offset, limit = int(request.qs["offset"][0]), int(request.qs["limit"][0])
+            return json.dumps(looks[offset:offset + limit])
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        search = mock_request.get(search_url, status_code=200, text=page)
+
+        pages = list(self.default_hook.iter_pages("api/3.0/looks/search", page_size=2, fields=["id", "title"]))
+
+        self.assertEqual([looks[0:2], looks[2:4], looks[4:5]], pages)
+        self.assertEqual(3, search.call_count)
+        self.assertEqual(["id,title"], search.last_request.qs["fields"])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_iter_items_stops_on_empty_page(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        search_url = "{}{}".format(self.looker_host, "api/3.0/users/search")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        search = mock_request.get(search_url, [
+            {'status_code': 200, 'text': '[{"id": 1}, {"id": 2}]'},
+            {'status_code': 200, 'text': '[]'},
+        ])
+
+        items = list(self.default_hook.iter_items("api/3.0/users/search", page_size=2, prefetch=False))
+
+        self.assertEqual([{"id": 1}, {"id": 2}], items)
+        self.assertEqual(2, search.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_iter_pages_fails_on_endpoints_that_do_not_page(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        dashboards_url = "{}{}".format(self.looker_host, "api/3.0/dashboards")
+        folders_url = "{}{}".format(self.looker_host, "api/3.0/folders")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(dashboards_url, status_code=200, text='[{"id": 1}, {"id": 2}, {"id": 3}]')
+        folders = mock_request.get(folders_url, status_code=200, text='[{"id": 1}, {"id": 2}]')
+
+        with self.assertRaisesRegex(AirflowException, "does not page with limit and offset"):
+            list(self.default_hook.iter_items("api/3.0/dashboards", page_size=2))
+        with self.assertRaisesRegex(AirflowException, "does not page with limit and offset"):
+            list(self.default_hook.iter_items("api/3.0/folders", page_size=2, prefetch=False))
+        self.assertEqual(2, folders.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_look_with_fields(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        look_url = "{}{}".format(self.looker_host, "api/3.0/looks/42")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        look = mock_request.get(look_url, status_code=200, text='{"id": 42, "title": "Revenue"}')
+
+        self.assertEqual({"id": 42, "title": "Revenue"}, self.default_hook.get_look(42, fields=["id", "title"]))
+        self.assertEqual(["id,title"], look.last_request.qs["fields"])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_look_as_record(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        look_url = "{}{}".format(self.looker_host, "api/3.0/looks/42")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        look = mock_request.get(look_url, status_code=200, headers={"Content-Type": "application/json"},
+                                body=io.BytesIO(b'{"id": 42, "title": "Revenue", "query": {"id": 7}}'))
+
+        result = self.default_hook.get_look(42, record=Look)
+
+        self.assertIsInstance(result, Look)
+        self.assertEqual(42, result.id)
+        self.assertEqual("Revenue", result.title)
+        self.assertIsNone(result.query_id)
+        self.assertFalse(hasattr(result, "__dict__"))
+        self.assertEqual([Look.fields()], look.last_request.qs["fields"])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_iter_items_as_records(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        search_url = "{}{}".format(self.looker_host, "api/3.0/dashboards/search")
+        DashboardTitle = record("DashboardTitle", ["id", "title"])
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        search = mock_request.get(search_url, status_code=200, body=io.BytesIO(b'[{"id": "1", "title": "Board"}]'))
+
+        items = list(self.default_hook.iter_items("api/3.0/dashboards/search", record=DashboardTitle))
+
+        self.assertEqual([DashboardTitle(id="1", title="Board")], items)
+        self.assertEqual(["id,title"], search.last_request.qs["fields"])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_json_decodes_record_lists_incrementally(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        looks_url = "{}{}".format(self.looker_host, "api/3.0/looks")
+        body = ("\n  " + json.dumps([{"id": i, "title": "Look {}".format(i), "extra": "x" * 1000}
+                                     for i in range(200)])).encode("utf-8")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(looks_url, status_code=200, body=io.BytesIO(body))
+
+        with mock.patch("airflow_looker.hooks.looker_hook.iter_json_array", wraps=iter_json_array) as decode:
+            looks = self.default_hook.get_json("api/3.0/looks", record=Look)
+
+        decode.assert_called_once()
+        self.assertEqual([Look(id=i, title="Look {}".format(i)) for i in range(200)], looks)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_look_sql_is_cached(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        sql_url = "{}{}".format(self.looker_host, "api/3.0/looks/42/run/sql")
+
+        login = mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        sql = mock_request.get(sql_url, status_code=200, text="SELECT 1", reason='OK')
+
+        hook = LookerHook(response_cache=ResponseCache(ttl=60))
+        self.assertEqual("SELECT 1", hook.get_look_sql(42))
+        self.assertEqual("SELECT 1", hook.get_look_sql(42))
+        self.assertEqual(1, sql.call_count)
+
+        hook.call(method="GET", endpoint="api/3.0/looks/42/run/sql", data=None, use_cache=False)
+        self.assertEqual(2, sql.call_count)
+        self.assertEqual(1, login.call_count)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_stale_cached_response_is_revalidated_with_etag(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        look_url = "{}{}".format(self.looker_host, "api/3.0/looks/42")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        look = mock_request.get(look_url, [
+            {'status_code': 200, 'text': '{"id": 42}', 'headers': {'ETag': '"v1"'}},
+            {'status_code': 304, 'text': '', 'reason': 'Not Modified'},
+        ])
+
+        hook = LookerHook(response_cache=ResponseCache(ttl=0))
+        self.assertEqual({"id": 42}, hook.get_look(42))
+        self.assertEqual({"id": 42}, hook.get_look(42))
+        self.assertEqual(2, look.call_count)
+        self.assertEqual('"v1"', look.last_request.headers['If-None-Match'])
+
+    def test_response_cache_evicts_least_recently_used(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", 200, {}, b"a")
+        cache.set("b", 200, {}, b"b")
+        cache.get("a")
+        cache.set("c", 200, {}, b"c")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(b"a", cache.get("a")["content"])
+
+    def test_file_response_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            FileResponseCache(tmp_dir, ttl=60).set("key", 200, {"Content-Type": "text/plain"}, b"SELECT 1")
+            entry = FileResponseCache(tmp_dir, ttl=60).get("key")
+            self.assertEqual(b"SELECT 1", entry["content"])
+            self.assertTrue(FileResponseCache(tmp_dir, ttl=60).is_fresh(entry))
+
+            FileResponseCache(tmp_dir, ttl=60).set("stale", 200, {}, b"", stored_at=0)
+            self.assertIsNone(FileResponseCache(tmp_dir, ttl=60).get("stale"))
+
+    def test_file_response_cache_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = FileResponseCache(tmp_dir, ttl=60, max_entries=2)
+            cache.set("a", 200, {"ETag": '"a"'}, b"a")
+            cache.set("b", 200, {"ETag": '"b"'}, b"b")
+            os.utime(cache._entry_path("a"), (1000, 1000))
+            os.utime(cache._entry_path("b"), (2000, 2000))
+            cache.get("a")
+            cache.set("c", 200, {}, b"c")
+
+            self.assertEqual(2, len(os.listdir(tmp_dir)))
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(b"a", cache.get("a")["content"])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_json_can_bypass_the_cache(self, mock_request, mock_get_connection):
+        self.looker_airflow_connection.extra = json.dumps({"response_cache_ttl": 600})
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        look_url = "{}{}".format(self.looker_host, "api/3.0/looks/1")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        look = mock_request.get(look_url, [{"status_code": 200, "text": '{"title": "old"}'},
+                                           {"status_code": 200, "text": '{"title": "new"}'}])
+
+        hook = LookerHook(response_cache=ResponseCache(ttl=600))
+        self.assertEqual({"title": "old"}, hook.get_look(1))
+        self.assertEqual({"title": "old"}, hook.get_look(1))
+        self.assertEqual({"title": "new"}, hook.get_look(1, use_cache=False))
+        self.assertEqual(2, look.call_count)
+
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_response_cache_from_connection_extra(self, mock_get_connection):
+        self.looker_airflow_connection.extra = json.dumps({"response_cache_ttl": 600})
+        mock_get_connection.return_value = self.looker_airflow_connection
+
+        with mock.patch.dict(response_cache._response_caches, clear=True):
+            first_hook, second_hook = LookerHook(), LookerHook()
+            first_hook._get_looker_connection()
+            second_hook._get_looker_connection()
+
+        self.assertIs(first_hook.response_cache, second_hook.response_cache)
+        self.assertEqual(600, first_hook.response_cache.ttl)
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_get_derived_table_graph(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        graph_url = "{}{}".format(self.looker_host, "api/4.0/derived_table/graph/model/ecommerce")
+        graph_text = 'digraph ecommerce {\n "orders" -> "order_facts";\n customers -> order_facts [color=red];\n}'
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(graph_url, status_code=200, text=json.dumps({"graph_text": graph_text}))
+
+        self.assertEqual({"orders": set(), "customers": set(), "order_facts": {"orders", "customers"}},
+                         self.default_hook.get_derived_table_graph("ecommerce"))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_pdt_build(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        start_url = "{}{}".format(self.looker_host, "api/4.0/derived_table/ecommerce/orders/start")
+        status_url = "{}{}".format(self.looker_host, "api/4.0/derived_table/m-1/status")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        start = mock_request.get(start_url, status_code=200, text='{"materialization_id": "m-1"}')
+        mock_request.get(status_url, status_code=200,
+                         text=json.dumps({"materialization_id": "m-1", "resp_text": '{"status": "running"}'}))
+
+        self.assertEqual("m-1", self.default_hook.start_pdt_build("ecommerce", "orders"))
+        self.assertEqual(["true"], start.last_request.qs["force_rebuild"])
+        self.assertEqual("running", self.default_hook.get_pdt_build_status("m-1"))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_download_look_as_json_lines(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        results_url = "{}{}".format(self.looker_host, "api/3.0/looks/42/run/json")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(results_url, status_code=200, body=io.BytesIO(b'[{"id": 1}, {"id": 2}]'))
+
+        fileobj = io.BytesIO()
+        self.default_hook.download_look(42, "jsonl", fileobj, chunk_size=3)
+        self.assertEqual(b'{"id": 1}\n{"id": 2}\n', fileobj.getvalue())
+
+    def test_iter_json_array(self):
+        data = ' [ {"name": "caf\u00e9", "ids": [1, 2]} , {"id": 3}]'.encode('utf-8')
+        for chunk_size in (1, 2, 5, 100):
+            chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+            self.assertEqual([{"name": "caf\u00e9", "ids": [1, 2]}, {"id": 3}], list(iter_json_array(chunks)))
+        self.assertEqual([], list(iter_json_array([b"[]"])))
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[{"id": 1}, {"id"']))
+
+    def test_row_counter(self):
+        results = {
+            'csv': (b'id,comment\n1,"two\nlines"\n2,"say ""hi""\n"\n3,no newline', 3),
+            'jsonl': (b'{"id": 1}\n{"id": 2}\n', 2),
+            'json': (json.dumps([{"id": 1, "s": 'a\\"}{['}, {"nested": {"ids": [1, 2]}}, {}]).encode('utf-8'), 3),
+            'txt': (b'anything', None),
+        }
+        for result_format, (data, rows) in results.items():
+            for chunk_size in (1, 2, 5, 1000):
+                counter = RowCounter(result_format)
+                for i in range(0, len(data), chunk_size):
+                    counter.update(data[i:i + chunk_size])
+                self.assertEqual(rows, counter.rows, (result_format, chunk_size))
+
+    def test_endpoint_template(self):
+        self.assertEqual("looks/{id}/run/{fmt}", endpoint_template("api/3.0/looks/42/run/csv"))
+        self.assertEqual("query_tasks/{id}", endpoint_template("/api/3.0/query_tasks/0123456789abcdef0123?x=1"))
+        self.assertEqual("derived_table/orders/start", endpoint_template("/api/4.0/api/4.0/derived_table/orders/start"))
+        self.assertEqual("datagroups", endpoint_template("api/3.0/datagroups"))
+
+    @requests_mock.mock()
+    @mock.patch("airflow_looker.hooks.looker_hook.time.sleep")
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_records_metrics(self, mock_request, mock_get_connection, mock_sleep):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        look_url = "{}{}".format(self.looker_host, "api/3.0/looks/42")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(look_url, [
+            {'status_code': 503, 'text': 'busy', 'reason': 'Service Unavailable'},
+            {'status_code': 200, 'text': '{"id": 42}', 'reason': 'OK'},
+        ])
+
+        metrics = InMemorySink()
+        hook = LookerHook(response_cache=ResponseCache(ttl=60), metrics=metrics)
+        hook.get_look(42)
+        hook.get_look(42)
+
+        self.assertEqual(1, metrics.count("logins"))
+        self.assertEqual(2, metrics.count("requests", endpoint="looks/{id}", method="GET"))
+        self.assertEqual(1, metrics.count("requests", status="503"))
+        self.assertEqual(1, metrics.count("retries", endpoint="looks/{id}"))
+        self.assertEqual(1, metrics.count("cache_hits", endpoint="looks/{id}"))
+        self.assertEqual(len('busy') + len('{"id": 42}'), metrics.count("response_bytes"))
+        self.assertEqual(["login", "request"], sorted({name for name, _, _ in metrics.timings}))
+        self.assertEqual([("login", {"looker_conn_id": "looker_default"})] +
+                         [("request", {"endpoint": "looks/{id}", "method": "GET"})] * 2,
+                         metrics.spans)
+
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_metrics_sink_from_connection_extra(self, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        hook = LookerHook()
+        hook._get_looker_connection()
+        self.assertIs(MetricsSink, type(hook.metrics))
+
+        client = mock.Mock()
+        with mock.patch.dict("sys.modules", {"statsd": mock.Mock(StatsClient=mock.Mock(return_value=client))}):
+            sink = get_metrics_sink({"metrics": "statsd", "metrics_prefix": "airflow.looker"})
+        sink.incr("requests", tags={"endpoint": "looks/{id}", "method": "GET", "status": "200"})
+        sink.timing("request", 0.25, tags={"endpoint": "looks/{id}"})
+        self.assertIsInstance(sink, StatsdSink)
+        client.incr.assert_called_once_with("airflow.looker.requests.looks_id.GET.200", 1)
+        client.timing.assert_called_once_with("airflow.looker.request.looks_id", 250.0)
+
+    def test_redact_whole_quoted_values(self):
+        self.assertEqual('{"password": "***"}', redact('{"password": "hunter2 with spaces"}'))
+        self.assertEqual('{"client_secret": "***", "id": 1}', redact(r'{"client_secret": "abc\"def", "id": 1}'))
+        self.assertEqual("{'token': '***', 'id': 1}", redact("{'token': 'a b', 'id': 1}"))
+        self.assertEqual('{"id": 1, "password": "***"', redact('{"id": 1, "password": "cut sh'))
+        self.assertEqual('password=***&client_secret=***&limit=5',
+                         redact('password=two+words&client_secret=abc%22def&limit=5'))
+
+    def test_format_payload(self):
+        self.assertEqual('{"client_secret": "***", "id": 1}', format_payload({"client_secret": "hush", "id": 1}))
+        self.assertEqual('access_token=***&limit=5', format_payload(b'access_token=abc&limit=5'))
+        self.assertEqual('abcde... (5 more characters)', format_payload('abcdefghij', max_length=5))
+        self.assertEqual('[0, 1... (truncated)', format_payload(list(range(100000)), max_length=5))
+        self.assertEqual('None', format_payload(None))
+        self.assertEqual('x' * 2000, str(LogPayload('x' * 2000, max_length=None)))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_logs_bounded_redacted_payloads(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        looker_auth_url = "{}{}".format(self.looker_host, "login")
+        users_url = "{}{}".format(self.looker_host, "api/3.0/users")
+
+        mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.post(users_url, status_code=422, reason='Unprocessable Entity',
+                          text=json.dumps({"message": "Validation failed", "details": ["e" * 100] * 1000}))
+
+        hook = LookerHook(log_max_length=200)
+        with self.assertLogs(hook.log, level='INFO') as logs, self.assertRaises(AirflowException):
+            hook.call(method='POST', endpoint='api/3.0/users',
+                      data={"password": "hunter2", "names": ["n" * 100] * 1000})
+
+        self.assertTrue(all(len(record.getMessage()) < 400 for record in logs.records))
+        sent = [record.getMessage() for record in logs.records if record.getMessage().startswith("Sending")]
+        self.assertIn('{"password": "***", "names"', sent[0])
+        self.assertNotIn("hunter2", "".join(logs.output))
+        self.assertTrue(logs.output[-1].endswith("more bytes)"))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_payload_sampler_from_connection_extra(self, mock_request, mock_get_connection):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            payload_log_path = os.path.join(tmp_dir, "payloads.jsonl")
+            self.looker_airflow_connection.extra = json.dumps({"payload_log_path": payload_log_path})
+            mock_get_connection.return_value = self.looker_airflow_connection
+            looker_auth_url = "{}{}".format(self.looker_host, "login")
+            look_url = "{}{}".format(self.looker_host, "api/3.0/looks/42")
+
+            mock_request.post(looker_auth_url, status_code=200, text=json.dumps(self.login_response_payload))
+            mock_request.get(look_url, status_code=200, text=json.dumps({"id": 42, "title": "t" * 5000}))
+
+            hook = LookerHook(log_max_length=10)
+            hook.call(method='GET', endpoint='api/3.0/looks/42', data={"fields": "id,title"})
+
+            with open(payload_log_path) as f:
+                samples = [json.loads(line) for line in f]
+        self.assertEqual(1, len(samples))
+        self.assertEqual(("GET", 200, '{"fields": "id,title"}'),
+                         (samples[0]["method"], samples[0]["status"], samples[0]["request"]))
+        self.assertEqual({"id": 42, "title": "t" * 5000}, json.loads(samples[0]["response"]))
+
+    def _replicated_connections(self, extra):
+        """
+        Returns a `get_connection` side effect serving the primary connection,
+        with `extra`, and a replica connection
+        """
+        self.replica_host = "http://127.0.0.2:8080/"
+        self.looker_airflow_connection.extra = json.dumps(dict(extra, replica_conn_ids=["looker_replica"]))
+        replica_connection = Connection(conn_id="looker_replica", conn_type='http', host=self.replica_host,
+                                        login='looker_api_client_id', password='looker_api_client_secret')
+        connections = {self.airflow_looker_conn_id: self.looker_airflow_connection,
+                       "looker_replica": replica_connection}
+        return lambda conn_id: connections[conn_id]
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_spreads_reads_across_replicas(self, mock_request, mock_get_connection):
+        mock_get_connection.side_effect = self._replicated_connections({})
+        for host in (self.looker_host, self.replica_host):
+            mock_request.post(host + "login", status_code=200, text=json.dumps(self.login_response_payload))
+            mock_request.get(host + "api/3.0/looks/1", status_code=200, text=json.dumps({"id": 1}))
+        mock_request.post(self.looker_host + "api/3.0/query_tasks", status_code=200, text=json.dumps({"id": "a"}))
+        mock_request.get(self.looker_host + "api/3.0/query_tasks/a", status_code=200,
+                         text=json.dumps({"id": "a", "status": "complete"}))
+
+        hook = LookerHook(looker_conn_id=self.airflow_looker_conn_id)
+        for _ in range(4):
+            self.assertEqual({"id": 1}, hook.get_look(1))
+        self.assertEqual("a", hook.create_query_task(7))
+        self.assertTrue(hook.check_query_task("a"))
+
+        hosts = [request.netloc for request in mock_request.request_history if request.path != "/login"]
+        self.assertEqual(2, hosts[:4].count("127.0.0.2:8080"))
+        self.assertEqual(["127.0.0.1:8080", "127.0.0.1:8080"], hosts[4:])
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_fails_over_unhealthy_instances(self, mock_request, mock_get_connection):
+        mock_get_connection.side_effect = self._replicated_connections(
+            {"routing": "least_latency", "failover_error_rate": 0.3, "failover_cooldown": 60})
+        for host in (self.looker_host, self.replica_host):
+            mock_request.post(host + "login", status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(self.looker_host + "api/3.0/looks/1", status_code=503, reason="Service Unavailable")
+        mock_request.get(self.replica_host + "api/3.0/looks/1", status_code=200, text=json.dumps({"id": 1}))
+        metrics = InMemorySink()
+
+        hook = LookerHook(looker_conn_id=self.airflow_looker_conn_id, retry_limit=0, metrics=metrics)
+        for _ in range(4):
+            self.assertEqual({"id": 1}, hook.get_look(1))
+
+        primary_calls = [request for request in mock_request.request_history
+                         if request.netloc == "127.0.0.1:8080" and request.path != "/login"]
+        # the primary is skipped once its error rate reaches 0.3, after two failures
+        self.assertEqual(2, len(primary_calls))
+        self.assertFalse(hook.health.is_healthy())
+        self.assertEqual(2, metrics.count("instance_failures", looker_conn_id=self.airflow_looker_conn_id))
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_call_does_not_fail_over_client_errors(self, mock_request, mock_get_connection):
+        mock_get_connection.side_effect = self._replicated_connections({})
+        for host in (self.looker_host, self.replica_host):
+            mock_request.post(host + "login", status_code=200, text=json.dumps(self.login_response_payload))
+            mock_request.get(host + "api/3.0/looks/1", status_code=404, reason="Not Found")
+
+        hook = LookerHook(looker_conn_id=self.airflow_looker_conn_id)
+        with self.assertRaisesRegex(AirflowException, "404:Not Found"):
+            hook.get_look(1)
+
+        self.assertEqual(1, len([request for request in mock_request.request_history if request.path != "/login"]))
+        self.assertTrue(hook.health.is_healthy())
+
+    @requests_mock.mock()
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_api_errors_carry_the_status_code(self, mock_request, mock_get_connection):
+        mock_get_connection.return_value = self.looker_airflow_connection
+        mock_request.post(self.looker_host + "login", status_code=200, text=json.dumps(self.login_response_payload))
+        mock_request.get(self.looker_host + "api/3.0/looks/1", status_code=503, reason="Service Unavailable")
+
+        hook = LookerHook(looker_conn_id=self.airflow_looker_conn_id, retry_limit=0)
+        with self.assertRaises(LookerApiError) as raised:
+            hook.get_look(1)
+
+        self.assertEqual(503, raised.exception.status_code)
+        self.assertTrue(LookerHook._is_instance_failure(raised.exception))
+        self.assertTrue(LookerHook._is_instance_failure(LookerApiError("429:Too Many Requests", 429)))
+        self.assertFalse(LookerHook._is_instance_failure(LookerApiError("404:Not Found", 404)))
+        self.assertFalse(LookerHook._is_instance_failure(AirflowException("no look_id provided")))
+
+    @mock.patch.object(BaseHook, "get_connection")
+    def test_invalid_routing(self, mock_get_connection):
+        self.looker_airflow_connection.extra = json.dumps({"routing": "random"})
+        mock_get_connection.return_value = self.looker_airflow_connection
+        with self.assertRaisesRegex(AirflowException, "routing must be one of round_robin, least_latency"):
+            LookerHook(looker_conn_id=self.airflow_looker_conn_id).get_token()
+
+    def test_router_orders_healthy_instances_first(self):
+        health = {name: routing.InstanceHealth(error_rate=0.3) for name in ("a", "b", "c")}
+        health["b"].record_success(0.5)
+        health["c"].record_success(0.1)
+        health["a"].record_failure()
+        health["a"].record_failure()
+
+        round_robin = routing.Router("round_robin")
+        self.assertEqual([["b", "c", "a"], ["c", "b", "a"]],
+                         [round_robin.order(["a", "b", "c"], health.get) for _ in range(2)])
+        self.assertEqual(["c", "b", "a"], routing.Router("least_latency").order(["a", "b", "c"], health.get))
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestLookerHook)
 unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,629 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from requests import Response
+from airflow import AirflowException
+from airflow.exceptions import AirflowRescheduleException, TaskDeferred
+from airflow_looker.hooks.looker_hook import LookerHook
+from airflow_looker.operators.looker_operator import (
+    LookerDownloadLookOperator,
+    LookerExportLooksOperator,
+    LookerRebuildDerivedTablesOperator,
+    LookerRenderDashboardsOperator,
+    LookerRunQueryOperator,
+    LookerSyncContentOperator,
+    LookerUpdateDataGroupByIDOperator,
+    LookerUpdateDataGroupsOperator,
+    _atomic_path,
+)
+from airflow_looker.triggers.looker_trigger import LookerDatagroupTrigger, LookerQueryTaskTrigger
+
+
+class TestAtomicPath(unittest.TestCase):
+    def test_replaces_the_file_only_on_success(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.txt')
+            with _atomic_path(path) as part_path, open(part_path, 'w') as f:
+                f.write('complete')
+
+            with self.assertRaises(ValueError):
+                with _atomic_path(path) as part_path, open(part_path, 'w') as f:
+                    f.write('partial')
+                    raise ValueError()
+
+            with open(path) as f:
+                self.assertEqual('complete', f.read())
+            self.assertEqual(['out.txt'], os.listdir(directory))
+
+
+class TestLookerUpdateDataGroupByIDOperator(unittest.TestCase):
+    @mock.patch.object(LookerHook, 'call')
+    def test_deferrable_waits_for_trigger_check(self, mock_call):
+        operator = LookerUpdateDataGroupByIDOperator(task_id='update', datagroup_id=7, stale_before=1000,
+                                                     deferrable=True)
+
+        with self.assertRaises(TaskDeferred) as deferred:
+            operator.execute({})
+
+        mock_call.assert_called_once_with(method='PATCH', endpoint='api/3.0/datagroups/7',
+                                          data={'stale_before': 1000}, retry=True)
+        self.assertIsInstance(deferred.exception.trigger, LookerDatagroupTrigger)
+        self.assertEqual(1000, deferred.exception.trigger.stale_before)
+        operator.execute_complete({}, {'status': 'success', 'datagroup_id': 7, 'trigger_check_at': 1100})
+        with self.assertRaises(AirflowException):
+            operator.execute_complete({}, {'status': 'error', 'message': 'SQL error'})
+
+
+class TestLookerUpdateDataGroupsOperator(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock()}
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'call')
+    def test_updates_every_datagroup(self, mock_call, mock_get_token):
+        operator = LookerUpdateDataGroupsOperator(task_id='update', datagroup_ids=[1, 2, 3], stale_before=1234)
+
+        results = operator.execute(self.context)
+
+        self.assertEqual({
+            '1': {'success': True, 'error': None},
+            '2': {'success': True, 'error': None},
+            '3': {'success': True, 'error': None},
+        }, results)
+        self.assertCountEqual([
+            mock.call(method='PATCH', endpoint='api/3.0/datagroups/{}'.format(datagroup_id),
+                      data={'stale_before': 1234}, retry=True)
+            for datagroup_id in [1, 2, 3]
+        ], mock_call.call_args_list)
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'call')
+    def test_resolves_name_pattern(self, mock_call, mock_get_token):
+        datagroups_response = mock.Mock(spec=Response)
+        datagroups_response.json.return_value = [
+            {'id': 1, 'name': 'orders_daily'},
+            {'id': 2, 'name': 'customers_daily'},
+            {'id': 3, 'name': 'orders_hourly'},
+        ]
+        mock_call.return_value = datagroups_response
+        operator = LookerUpdateDataGroupsOperator(task_id='update', name_pattern='orders_*')
+
+        results = operator.execute(self.context)
+
+        self.assertEqual(['1', '3'], sorted(results))
+        mock_call.assert_any_call(method='GET', endpoint='api/3.0/datagroups', data=None, allow_replica=False)
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'call')
+    def test_fails_after_attempting_every_datagroup(self, mock_call, mock_get_token):
+        def call(method, endpoint, data, retry):
+            if endpoint.endswith('/2'):
+                raise AirflowException('404:Not Found')
+        mock_call.side_effect = call
+        operator = LookerUpdateDataGroupsOperator(task_id='update', datagroup_ids=[1, 2, 3])
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+
+        self.assertEqual(3, mock_call.call_count)
+        self.context['ti'].xcom_push.assert_called_once_with(key='return_value', value={
+            '1': {'success': True, 'error': None},
+            '2': {'success': False, 'error': '404:Not Found'},
+            '3': {'success': True, 'error': None},
+        })
+
+    def test_requires_ids_or_pattern(self):
+        with self.assertRaises(AirflowException):
+            LookerUpdateDataGroupsOperator(task_id='update')
+        with self.assertRaises(AirflowException):
+            LookerUpdateDataGroupsOperator(task_id='update', datagroup_ids=[1], name_pattern='orders_*')
+
+
+class TestLookerDownloadLookOperator(unittest.TestCase):
+    @mock.patch.object(LookerHook, 'download_look')
+    def test_downloads_look_to_path(self, mock_download_look):
+        operator = LookerDownloadLookOperator(task_id='download', look_id=42, path='/tmp/look_42.csv',
+                                              query_params={'limit': -1})
+
+        self.assertEqual('/tmp/look_42.csv', operator.execute({}))
+        mock_download_look.assert_called_once_with(look_id=42,
+                                                   result_format='csv',
+                                                   path_or_fileobj='/tmp/look_42.csv',
+                                                   chunk_size=1024 * 1024,
+                                                   params={'limit': -1})
+
+
+class TestLookerRunQueryOperator(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock(dag_id='dag', run_id='manual__2020-01-01T10:00:00+00:00',
+                                        task_id='run_query', map_index=-1)}
+        self.state_key = 'looker_query_task__dag__manual__2020-01-01T10:00:00+00:00__run_query__-1'
+
+    @mock.patch.object(LookerHook, 'get_query_task_results', return_value='id\n1\n')
+    @mock.patch.object(LookerHook, 'wait_for_query_task')
+    @mock.patch.object(LookerHook, 'create_query_task', return_value='abc123')
+    @mock.patch.object(LookerHook, 'get_look_query_id', return_value=7)
+    def test_poke_mode(self, mock_get_look_query_id, mock_create, mock_wait, mock_results):
+        operator = LookerRunQueryOperator(task_id='run_query', look_id=42, poke_interval=10, timeout=60)
+
+        self.assertEqual('id\n1\n', operator.execute(self.context))
+        mock_get_look_query_id.assert_called_once_with(42)
+        mock_create.assert_called_once_with(7, result_format='csv')
+        mock_wait.assert_called_once_with('abc123', max_poll_interval=10, timeout=60)
+        mock_results.assert_called_once_with('abc123', path_or_fileobj=None)
+
+    @mock.patch('airflow_looker.operators.looker_operator.Variable')
+    @mock.patch.object(LookerHook, 'check_query_task', return_value=False)
+    @mock.patch.object(LookerHook, 'create_query_task', return_value='abc123')
+    def test_reschedule_mode_starts_query_and_reschedules(self, mock_create, mock_check, mock_variable):
+        mock_variable.get.return_value = None
+        operator = LookerRunQueryOperator(task_id='run_query', query_id=7, mode='reschedule')
+
+        self.assertTrue(operator.reschedule)
+        with self.assertRaises(AirflowRescheduleException):
+            operator.execute(self.context)
+        mock_create.assert_called_once_with(7, result_format='csv')
+        self.assertEqual(self.state_key, mock_variable.set.call_args[0][0])
+        self.assertEqual('abc123', mock_variable.set.call_args[0][1]['query_task_id'])
+        mock_variable.delete.assert_not_called()
+
+    @mock.patch('airflow_looker.operators.looker_operator.Variable')
+    @mock.patch.object(LookerHook, 'get_query_task_results', return_value=100)
+    @mock.patch.object(LookerHook, 'check_query_task', return_value=True)
+    @mock.patch.object(LookerHook, 'create_query_task')
+    def test_reschedule_mode_fetches_results(self, mock_create, mock_check, mock_results, mock_variable):
+        mock_variable.get.return_value = {'query_task_id': 'abc123', 'started_at': 0}
+        operator = LookerRunQueryOperator(task_id='run_query', query_id=7, mode='reschedule', path='/tmp/query.csv')
+
+        self.assertEqual('/tmp/query.csv', operator.execute(self.context))
+        mock_create.assert_not_called()
+        mock_results.assert_called_once_with('abc123', path_or_fileobj='/tmp/query.csv')
+        mock_variable.delete.assert_called_once_with(self.state_key)
+
+    @mock.patch('airflow_looker.operators.looker_operator.Variable')
+    @mock.patch.object(LookerHook, 'check_query_task', side_effect=AirflowException('error'))
+    def test_reschedule_mode_clears_state_on_failure(self, mock_check, mock_variable):
+        mock_variable.get.return_value = {'query_task_id': 'abc123', 'started_at': 0}
+        operator = LookerRunQueryOperator(task_id='run_query', query_id=7, mode='reschedule')
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+        mock_variable.delete.assert_called_once_with(self.state_key)
+
+    def test_reschedule_state_is_per_run_and_map_index(self):
+        other_run = {'ti': mock.Mock(dag_id='dag', run_id='manual__2020-01-01T11:00:00+00:00',
+                                     task_id='run_query', map_index=-1)}
+        mapped = {'ti': mock.Mock(dag_id='dag', run_id='manual__2020-01-01T10:00:00+00:00',
+                                  task_id='run_query', map_index=2)}
+
+        keys = {LookerRunQueryOperator._state_key(context) for context in (self.context, other_run, mapped)}
+        self.assertEqual(3, len(keys))
+
+    @mock.patch.object(LookerHook, 'get_query_task_results', return_value='id\n1\n')
+    @mock.patch.object(LookerHook, 'create_query_task', return_value='abc123')
+    def test_deferrable(self, mock_create, mock_results):
+        operator = LookerRunQueryOperator(task_id='run_query', query_id=7, deferrable=True, timeout=60)
+
+        with self.assertRaises(TaskDeferred) as deferred:
+            operator.execute(self.context)
+
+        self.assertIsInstance(deferred.exception.trigger, LookerQueryTaskTrigger)
+        self.assertEqual('abc123', deferred.exception.trigger.query_task_id)
+        self.assertEqual('execute_complete', deferred.exception.method_name)
+        self.assertEqual('id\n1\n', operator.execute_complete(
+            self.context, {'status': 'success', 'query_task_id': 'abc123'}))
+        mock_results.assert_called_once_with('abc123', path_or_fileobj=None)
+
+    def test_requires_query_or_look(self):
+        with self.assertRaises(AirflowException):
+            LookerRunQueryOperator(task_id='run_query')
+        with self.assertRaises(AirflowException):
+            LookerRunQueryOperator(task_id='run_query', query_id=7, mode='deferred')
+
+
+class TestLookerRebuildDerivedTablesOperator(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock()}
+        # orders and customers feed order_facts, which feeds revenue
+        self.graph = {
+            'orders': set(),
+            'customers': set(),
+            'order_facts': {'orders', 'customers'},
+            'revenue': {'order_facts'},
+        }
+
+    def test_dependencies_skip_tables_that_were_not_requested(self):
+        dependencies = LookerRebuildDerivedTablesOperator._get_build_dependencies(
+            self.graph, ['orders', 'customers', 'revenue'])
+
+        self.assertEqual({'orders': set(), 'customers': set(), 'revenue': {'orders', 'customers'}}, dependencies)
+
+    @mock.patch('airflow_looker.operators.looker_operator.time.sleep')
+    @mock.patch.object(LookerHook, 'get_pdt_build_status', return_value='complete')
+    @mock.patch.object(LookerHook, 'start_pdt_build', side_effect=lambda model, view, force_rebuild: view + '-1')
+    @mock.patch.object(LookerHook, 'get_derived_table_graph')
+    def test_builds_in_dependency_order(self, mock_graph, mock_start, mock_status, mock_sleep):
+        mock_graph.return_value = self.graph
+        operator = LookerRebuildDerivedTablesOperator(task_id='rebuild', model_name='ecommerce',
+                                                      view_names=['revenue', 'order_facts', 'orders', 'customers'],
+                                                      max_active_builds=4)
+
+        results = operator.execute(self.context)
+
+        started = [args[1] for args, _ in mock_start.call_args_list]
+        self.assertEqual(['customers', 'orders', 'order_facts', 'revenue'], started)
+        self.assertEqual(3, mock_sleep.call_count)
+        self.assertTrue(all(result['status'] == 'success' for result in results.values()))
+        self.assertEqual('revenue-1', results['revenue']['materialization_id'])
+
+    @mock.patch('airflow_looker.operators.looker_operator.time.sleep')
+    @mock.patch.object(LookerHook, 'get_pdt_build_status')
+    @mock.patch.object(LookerHook, 'start_pdt_build', side_effect=lambda model, view, force_rebuild: view + '-1')
+    @mock.patch.object(LookerHook, 'get_derived_table_graph')
+    def test_respects_max_active_builds_and_skips_dependents_of_failures(self, mock_graph, mock_start,
+                                                                         mock_status, mock_sleep):
+        mock_graph.return_value = self.graph
+        mock_status.side_effect = lambda materialization_id: 'error' if materialization_id == 'orders-1' else 'complete'
+        operator = LookerRebuildDerivedTablesOperator(task_id='rebuild', model_name='ecommerce',
+                                                      view_names=['revenue', 'order_facts', 'orders', 'customers'],
+                                                      max_active_builds=1)
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+
+        self.assertEqual(['customers', 'orders'], [args[1] for args, _ in mock_start.call_args_list])
+        results = self.context['ti'].xcom_push.call_args[1]['value']
+        self.assertEqual({'customers': 'success', 'orders': 'failed', 'order_facts': 'skipped', 'revenue': 'skipped'},
+                         {view_name: result['status'] for view_name, result in results.items()})
+
+    @mock.patch('airflow_looker.operators.looker_operator.time.sleep')
+    @mock.patch.object(LookerHook, 'get_pdt_build_status')
+    @mock.patch.object(LookerHook, 'start_pdt_build', side_effect=lambda model, view, force_rebuild: view + '-1')
+    @mock.patch.object(LookerHook, 'get_derived_table_graph')
+    def test_fails_builds_with_unrecognised_status_or_timeout(self, mock_graph, mock_start, mock_status, mock_sleep):
+        mock_graph.return_value = self.graph
+        mock_status.side_effect = lambda materialization_id: {
+            'orders-1': 'model not found', 'customers-1': 'running'}[materialization_id]
+        operator = LookerRebuildDerivedTablesOperator(task_id='rebuild', model_name='ecommerce',
+                                                      view_names=['orders', 'customers'], build_timeout=0)
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+
+        results = self.context['ti'].xcom_push.call_args[1]['value']
+        self.assertEqual({'orders': 'failed', 'customers': 'failed'},
+                         {view_name: result['status'] for view_name, result in results.items()})
+        self.assertEqual(1, mock_sleep.call_count)
+
+    @mock.patch('airflow_looker.operators.looker_operator.time.sleep')
+    @mock.patch.object(LookerHook, 'get_pdt_build_status', return_value='error')
+    @mock.patch.object(LookerHook, 'start_pdt_build', side_effect=lambda model, view, force_rebuild: view + '-1')
+    @mock.patch.object(LookerHook, 'get_derived_table_graph')
+    def test_skips_chains_whose_dependents_sort_first(self, mock_graph, mock_start, mock_status, mock_sleep):
+        mock_graph.return_value = {'c': set(), 'b': {'c'}, 'a': {'b'}}
+        operator = LookerRebuildDerivedTablesOperator(task_id='rebuild', model_name='ecommerce',
+                                                      view_names=['a', 'b', 'c'])
+
+        with self.assertRaisesRegex(AirflowException, "Failed to rebuild 3 of 3 derived tables"):
+            operator.execute(self.context)
+
+        results = self.context['ti'].xcom_push.call_args[1]['value']
+        self.assertEqual({'c': 'failed', 'b': 'skipped', 'a': 'skipped'},
+                         {view_name: result['status'] for view_name, result in results.items()})
+
+    @mock.patch.object(LookerHook, 'get_derived_table_graph')
+    def test_fails_on_cycle(self, mock_graph):
+        mock_graph.return_value = {'a': {'b'}, 'b': {'a'}}
+        operator = LookerRebuildDerivedTablesOperator(task_id='rebuild', model_name='ecommerce', view_names=['a', 'b'])
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+
+
+class TestLookerExportLooksOperator(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock()}
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, 'exports')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def download_look(look_id, result_format, path, params=None, row_counter=None):
+        if look_id == 3:
+            raise AirflowException('500:Internal Server Error')
+        content = {
+            'csv': b'id,comment\n1,"two\nlines"\n2,plain\n',
+            'jsonl': b'{"id": 1}\n{"id": 2}\n',
+            'json': b'[{"id": 1}, {"id": 2}]',
+        }[result_format]
+        with open(path, 'wb') as f:
+            # written in small chunks, as download_look streams them
+            for i in range(0, len(content), 4):
+                f.write(content[i:i + 4])
+                row_counter.update(content[i:i + 4])
+        return len(content)
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'download_look')
+    def test_exports_looks_and_writes_manifest(self, mock_download_look, mock_get_token):
+        mock_download_look.side_effect = self.download_look
+        operator = LookerExportLooksOperator(task_id='export', directory=self.directory, look_ids=[1, 2])
+
+        manifest = operator.execute(self.context)
+
+        self.assertEqual([1, 2], [entry['look_id'] for entry in manifest])
+        self.assertEqual([2, 2], [entry['rows'] for entry in manifest])
+        self.assertEqual(os.path.join(self.directory, 'look_1.csv'), manifest[0]['path'])
+        self.assertTrue(os.path.exists(manifest[0]['path']))
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(manifest, json.load(f))
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'download_look')
+    def test_counts_json_rows(self, mock_download_look, mock_get_token):
+        mock_download_look.side_effect = self.download_look
+        for result_format in ('json', 'jsonl'):
+            operator = LookerExportLooksOperator(task_id='export', directory=self.directory, look_ids=[1],
+                                                 result_format=result_format)
+            self.assertEqual(2, operator.execute(self.context)[0]['rows'])
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'download_look')
+    def test_fails_after_attempting_every_look(self, mock_download_look, mock_get_token):
+        mock_download_look.side_effect = self.download_look
+        operator = LookerExportLooksOperator(task_id='export', directory=self.directory, look_ids=[1, 3, 2])
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+
+        manifest = self.context['ti'].xcom_push.call_args[1]['value']
+        self.assertEqual([True, False, True], [entry['success'] for entry in manifest])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'look_3.csv.part')))
+
+    @mock.patch.object(LookerHook, 'get_token')
+    @mock.patch.object(LookerHook, 'download_look')
+    @mock.patch.object(LookerHook, 'get_json', return_value=[{'id': 1}, {'id': 2}])
+    def test_resolves_folder(self, mock_get_json, mock_download_look, mock_get_token):
+        mock_download_look.side_effect = self.download_look
+        operator = LookerExportLooksOperator(task_id='export', directory=self.directory, folder_id=9)
+
+        manifest = operator.execute(self.context)
+
+        mock_get_json.assert_called_once_with('api/3.0/spaces/9/looks', fields=['id'])
+        self.assertEqual([1, 2], [entry['look_id'] for entry in manifest])
+
+
+class FakeLookerContent(object):
+    """
+    Looker content served through mocked `iter_items` and `get_json`
+    """
+    def __init__(self):
+        self.looks = {
+            1: {'id': 1, 'title': 'Orders', 'updated_at': '2024-01-01T00:00:00+00:00'},
+            2: {'id': 2, 'title': 'Revenue', 'updated_at': '2024-01-02T00:00:00+00:00'},
+        }
+        self.deleted_looks = {}
+        self.models = [{'name': 'ecommerce', 'explores': [{'name': 'orders', 'label': 'Orders'}]}]
+        self.fetched = []
+        # (endpoint, params, use_cache) of every read
+        self.reads = []
+
+    def iter_items(self, endpoint, page_size=100, fields=None, params=None, prefetch=True, record=None,
+                   use_cache=True):
+        params = params or {}
+        self.reads.append((endpoint, params, use_cache))
+        looks = self.deleted_looks if params.get('deleted') == 'true' else self.looks
+        sort = params.get('sorts', 'id').split()
+        items = sorted(looks.values(), key=lambda look: look[sort[0]], reverse=sort[-1] == 'desc')
+        return ({field: item.get(field) for field in fields} for item in items)
+
+    def get_json(self, endpoint, fields=None, params=None, record=None, use_cache=True):
+        self.reads.append((endpoint, params, use_cache))
+        if endpoint == 'api/3.0/lookml_models':
+            return self.models
+        look_id = int(endpoint.split('/')[-1])
+        self.fetched.append(look_id)
+        return {key: value for key, value in self.looks[look_id].items() if not fields or key in fields}
+
+
+class TestLookerSyncContentOperator(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock()}
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmp_dir.name, 'state.json')
+        self.output_path = os.path.join(self.tmp_dir.name, 'deltas.jsonl')
+        self.looker = FakeLookerContent()
+        patches = [
+            mock.patch.object(LookerHook, 'get_token'),
+            mock.patch.object(LookerHook, 'iter_items', side_effect=self.looker.iter_items),
+            mock.patch.object(LookerHook, 'get_json', side_effect=self.looker.get_json),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def sync(self, **kwargs):
+        operator = LookerSyncContentOperator(task_id='sync', state_path=self.state_path,
+                                             output_path=self.output_path, content_types=['looks', 'explores'],
+                                             **kwargs)
+        self.looker.fetched = []
+        summary = operator.execute(self.context)
+        with open(self.output_path) as f:
+            return summary, [json.loads(line) for line in f]
+
+    def test_first_sync_is_full(self):
+        summary, deltas = self.sync()
+
+        self.assertTrue(summary['full_sync'])
+        self.assertEqual({'looks': 2, 'explores': 1}, summary['upserts'])
+        self.assertEqual([('look', 1, 'upsert'), ('look', 2, 'upsert'), ('explore', 'ecommerce::orders', 'upsert')],
+                         [(delta['type'], delta['id'], delta['op']) for delta in deltas])
+        self.assertEqual({'model': 'ecommerce', 'name': 'orders', 'label': 'Orders', 'description': None,
+                          'group_label': None, 'hidden': None}, deltas[2]['object'])
+
+    def test_incremental_sync_fetches_only_changes(self):
+        self.sync()
+        self.looker.looks[2] = dict(self.looker.looks[2], title='Revenue v2', updated_at='2024-02-01T00:00:00+00:00')
+        self.looker.looks[3] = {'id': 3, 'title': 'Refunds', 'updated_at': '2024-02-02T00:00:00+00:00'}
+        self.looker.deleted_looks[1] = dict(self.looker.looks.pop(1), deleted_at='2024-02-03T00:00:00+00:00')
+
+        summary, deltas = self.sync()
+
+        self.assertFalse(summary['full_sync'])
+        self.assertEqual([3, 2], self.looker.fetched)
+        self.assertEqual([('look', 3, 'upsert'), ('look', 2, 'upsert'), ('look', 1, 'delete')],
+                         [(delta['type'], delta['id'], delta['op']) for delta in deltas])
+        self.assertEqual('Revenue v2', deltas[1]['object']['title'])
+
+        # nothing changed since
+        summary, deltas = self.sync()
+        self.assertEqual([], deltas)
+        self.assertEqual([], self.looker.fetched)
+
+    def test_unchanged_content_is_not_emitted(self):
+        self.sync(fields={'looks': ['id', 'title']})
+        self.looker.looks[1] = dict(self.looker.looks[1], updated_at='2024-03-01T00:00:00+00:00')
+
+        _, deltas = self.sync(fields={'looks': ['id', 'title']})
+
+        self.assertEqual([1], self.looker.fetched)
+        self.assertEqual([], deltas)
+
+    def test_full_sync_finds_hard_deletes(self):
+        self.sync()
+        del self.looker.looks[2]
+
+        _, deltas = self.sync()
+        self.assertEqual([], deltas)
+
+        summary, deltas = self.sync(full_sync_interval=0)
+        self.assertTrue(summary['full_sync'])
+        self.assertEqual([{'type': 'look', 'id': 2, 'op': 'delete'}], deltas)
+
+    def test_reads_bypass_the_cache(self):
+        self.sync()
+        self.looker.looks[2] = dict(self.looker.looks[2], updated_at='2024-02-01T00:00:00+00:00')
+        self.sync()
+
+        self.assertEqual(['api/3.0/looks/search', 'api/3.0/looks/1', 'api/3.0/looks/2', 'api/3.0/lookml_models',
+                          'api/3.0/looks/search', 'api/3.0/looks/search', 'api/3.0/looks/2', 'api/3.0/lookml_models'],
+                         [endpoint for endpoint, _, _ in self.looker.reads])
+        self.assertEqual({False}, {use_cache for _, _, use_cache in self.looker.reads})
+        self.assertEqual({'sorts': 'id'}, self.looker.reads[0][1])
+        self.assertEqual({'sorts': 'updated_at desc'}, self.looker.reads[4][1])
+
+    def test_failed_sync_keeps_state(self):
+        self.sync()
+        with open(self.state_path) as f:
+            state = json.load(f)
+        self.looker.looks[2] = dict(self.looker.looks[2], updated_at='2024-02-01T00:00:00+00:00')
+        self.looker.models = None
+
+        with self.assertRaises(TypeError):
+            self.sync()
+
+        with open(self.state_path) as f:
+            self.assertEqual(state, json.load(f))
+        self.assertFalse(os.path.exists(self.output_path + '.part'))
+
+
+class TestLookerRenderDashboardsOperator(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock()}
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, 'renders')
+        # polls left per render task before it finishes, and the status it finishes with
+        self.polls = {}
+        self.statuses = {}
+        self.active = 0
+        self.max_active = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_dashboard_render_task(self, dashboard_id, **kwargs):
+        if dashboard_id == 'missing':
+            raise AirflowException('404:Not Found')
+        render_task_id = 'render-{}'.format(dashboard_id)
+        self.polls[render_task_id] = 5 if dashboard_id == 1 else 0
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        return render_task_id
+
+    def get_render_task_status(self, render_task_id):
+        if self.polls[render_task_id]:
+            self.polls[render_task_id] -= 1
+            return 'rendering'
+        self.active -= 1
+        return self.statuses.get(render_task_id, 'success')
+
+    @staticmethod
+    def get_render_task_results(render_task_id, path):
+        with open(path, 'wb') as f:
+            f.write(b'%PDF ' + render_task_id.encode('utf-8'))
+        return 5 + len(render_task_id)
+
+    def patch_hook(self):
+        patches = [
+            mock.patch.object(LookerHook, 'get_token'),
+            mock.patch.object(LookerHook, 'create_dashboard_render_task',
+                              side_effect=self.create_dashboard_render_task),
+            mock.patch.object(LookerHook, 'get_render_task_status', side_effect=self.get_render_task_status),
+            mock.patch.object(LookerHook, 'get_render_task_results', side_effect=self.get_render_task_results),
+            mock.patch('airflow_looker.operators.looker_operator.time.sleep'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return patches[-1].target.sleep
+
+    def test_renders_dashboards_with_bounded_concurrency(self):
+        mock_sleep = self.patch_hook()
+        operator = LookerRenderDashboardsOperator(task_id='render', directory=self.directory,
+                                                  dashboard_ids=[1, 2, 3, 4], max_active_renders=2,
+                                                  poll_interval=1, max_poll_interval=3)
+
+        manifest = operator.execute(self.context)
+
+        self.assertEqual([1, 2, 3, 4], [entry['dashboard_id'] for entry in manifest])
+        self.assertTrue(all(entry['success'] for entry in manifest))
+        self.assertEqual(2, self.max_active)
+        with open(os.path.join(self.directory, 'dashboard_3.pdf'), 'rb') as f:
+            self.assertEqual(b'%PDF render-3', f.read())
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(manifest, json.load(f))
+        # the wait resets while renders finish, then doubles up to max_poll_interval while dashboard 1 runs alone
+        self.assertEqual([1, 1, 1, 1, 2, 3], [args[0] for args, _ in mock_sleep.call_args_list])
+
+    def test_fails_after_attempting_every_dashboard(self):
+        self.patch_hook()
+        self.statuses['render-2'] = 'failure'
+        operator = LookerRenderDashboardsOperator(task_id='render', directory=self.directory,
+                                                  dashboard_ids=['missing', 2, 3], result_format='png')
+
+        with self.assertRaises(AirflowException):
+            operator.execute(self.context)
+
+        manifest = self.context['ti'].xcom_push.call_args[1]['value']
+        self.assertEqual([False, False, True], [entry['success'] for entry in manifest])
+        self.assertEqual('render-2', manifest[1]['render_task_id'])
+        self.assertEqual(os.path.join(self.directory, 'dashboard_3.png'), manifest[2]['path'])
+
+    def test_rejects_unknown_format(self):
+        with self.assertRaises(AirflowException):
+            LookerRenderDashboardsOperator(task_id='render', directory=self.directory, dashboard_ids=[1],
+                                           result_format='xlsx')
+
+    def test_requires_distinct_dashboard_ids(self):
+        for dashboard_ids in (None, []):
+            with self.assertRaisesRegex(AirflowException, "dashboard_ids must be a non-empty list"):
+                LookerRenderDashboardsOperator(task_id='render', directory=self.directory, dashboard_ids=dashboard_ids)
+        with self.assertRaisesRegex(AirflowException, "must not repeat dashboards: 1$"):
+            LookerRenderDashboardsOperator(task_id='render', directory=self.directory, dashboard_ids=[1, 2, '1'])
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+from airflow import AirflowException
+from airflow_looker.hooks.looker_hook import LookerHook
+from airflow_looker.sensors.looker_sensor import LookerDatagroupSensor
+
+
+class TestLookerDatagroupSensor(unittest.TestCase):
+    def setUp(self):
+        self.context = {'ti': mock.Mock(start_date=datetime.fromtimestamp(1000, tz=timezone.utc))}
+        self.datagroups = [
+            {'id': 1, 'triggered_at': 900, 'trigger_check_at': 1100, 'trigger_error': None},
+            {'id': 2, 'triggered_at': 900, 'trigger_check_at': 950, 'trigger_error': None},
+            {'id': 3, 'triggered_at': 900, 'trigger_check_at': 1200, 'trigger_error': None},
+        ]
+
+    def mock_call(self, mock_call):
+        mock_call.return_value.json.side_effect = lambda: self.datagroups
+
+    def test_defaults_to_reschedule_mode(self):
+        sensor = LookerDatagroupSensor(task_id='wait', datagroup_ids=[1])
+
+        self.assertEqual('reschedule', sensor.mode)
+        self.assertTrue(sensor.exponential_backoff)
+        with self.assertRaises(AirflowException):
+            LookerDatagroupSensor(task_id='wait')
+
+    @mock.patch.object(LookerHook, 'call')
+    def test_pokes_many_datagroups_in_one_call(self, mock_call):
+        self.mock_call(mock_call)
+        sensor = LookerDatagroupSensor(task_id='wait', datagroup_ids=[1, 2, 3])
+
+        self.assertFalse(sensor.poke(self.context))
+        self.datagroups[1]['trigger_check_at'] = 1050
+        self.assertTrue(sensor.poke(self.context))
+
+        self.assertEqual(2, mock_call.call_count)
+        mock_call.assert_called_with(method='GET', endpoint='api/3.0/datagroups', use_cache=False, allow_replica=False,
+                                     data={'fields': 'id,triggered_at,trigger_check_at,trigger_error'})
+
+    @mock.patch.object(LookerHook, 'call')
+    def test_stale_before(self, mock_call):
+        self.mock_call(mock_call)
+        sensor = LookerDatagroupSensor(task_id='wait', datagroup_ids=[1, 3], stale_before='1150')
+
+        self.assertFalse(sensor.poke(self.context))
+
+    @mock.patch.object(LookerHook, 'call')
+    def test_fails_on_trigger_error(self, mock_call):
+        self.mock_call(mock_call)
+        self.datagroups[1]['trigger_error'] = 'SQL error'
+        sensor = LookerDatagroupSensor(task_id='wait', datagroup_ids=[1, 2])
+
+        with self.assertRaises(AirflowException):
+            sensor.poke(self.context)
+
+    @mock.patch.object(LookerHook, 'get_pdt_build_status')
+    def test_waits_for_builds(self, mock_status):
+        statuses = {'orders-1': 'complete', 'revenue-1': 'running'}
+        mock_status.side_effect = lambda materialization_id: statuses[materialization_id]
+        sensor = LookerDatagroupSensor(task_id='wait', materialization_ids=['orders-1', 'revenue-1'])
+
+        self.assertFalse(sensor.poke(self.context))
+        statuses['revenue-1'] = 'complete'
+        self.assertTrue(sensor.poke(self.context))
+
+        statuses['revenue-1'] = 'error'
+        with self.assertRaises(AirflowException):
+            sensor.poke(self.context)
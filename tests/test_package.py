@@ -0,0 +1,36 @@
+import sys
+import unittest
+from unittest import mock
+
+import airflow_looker
+from airflow_looker.hooks.looker_hook import LookerHook
+from airflow_looker.operators import looker_operator
+
+HOOK_MODULE = 'airflow_looker.hooks.looker_hook'
+
+
+class TestPackage(unittest.TestCase):
+    def import_fresh(self, statement):
+        """
+        Runs an import statement with none of the package loaded yet and
+        returns the names of the package modules it loaded
+        """
+        with mock.patch.dict(sys.modules):
+            for name in [name for name in sys.modules if name.split('.')[0] == 'airflow_looker']:
+                del sys.modules[name]
+            exec(statement, {})
+            return {name for name in sys.modules if name.split('.')[0] == 'airflow_looker'}
+
+    def test_operators_import_without_the_hook(self):
+        for statement in ('import airflow_looker',
+                          'from airflow_looker import LookerUpdateDataGroupByIDOperator',
+                          'from airflow_looker import LookerDatagroupSensor'):
+            self.assertNotIn(HOOK_MODULE, self.import_fresh(statement), statement)
+        self.assertIn(HOOK_MODULE, self.import_fresh('from airflow_looker import LookerHook'))
+
+    def test_lazy_package_attributes(self):
+        self.assertIs(LookerHook, airflow_looker.LookerHook)
+        self.assertIs(looker_operator.LookerRunQueryOperator, airflow_looker.LookerRunQueryOperator)
+        self.assertIn('LookerDatagroupSensor', dir(airflow_looker))
+        with self.assertRaises(AttributeError):
+            airflow_looker.LookerMissingOperator
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from unittest import mock
+from airflow.hooks.base_hook import BaseHook
+from benchmarks.fake_looker import FakeLooker
+from airflow_looker.hooks.token_cache import default_token_cache
+from airflow_looker.triggers.looker_trigger import LookerDatagroupTrigger, LookerQueryTaskTrigger
+
+
+class TestLookerTrigger(unittest.TestCase):
+    def setUp(self):
+        default_token_cache.clear()
+        self.looker = FakeLooker().start()
+        self.addCleanup(self.looker.stop)
+
+    def run_trigger(self, trigger):
+        async def run():
+            with mock.patch.object(BaseHook, 'get_connection', return_value=self.looker.connection('looker_default')), \
+                    mock.patch('airflow_looker.triggers.looker_trigger.asyncio.sleep') as mock_sleep:
+                events = [event async for event in trigger.run()]
+            return events, mock_sleep
+        return asyncio.run(run())
+
+    def test_query_task_trigger_completes(self):
+        self.looker.responses['/api/3.0/query_tasks/abc123'] = [
+            (200, {'id': 'abc123', 'status': 'running'}),
+            (200, {'id': 'abc123', 'status': 'running'}),
+            (200, {'id': 'abc123', 'status': 'complete'}),
+        ]
+        trigger = LookerQueryTaskTrigger(query_task_id='abc123', poll_interval=1, max_poll_interval=10)
+
+        events, mock_sleep = self.run_trigger(trigger)
+
+        self.assertEqual([{'status': 'success', 'query_task_id': 'abc123'}], [event.payload for event in events])
+        self.assertEqual([mock.call(1), mock.call(2)], mock_sleep.call_args_list)
+        self.assertEqual(1, self.looker.logins)
+        authorization = self.looker.requests[-1]['headers']['Authorization']
+        self.assertTrue(self.looker.is_valid(authorization[len('token '):]))
+
+    def test_query_task_trigger_error(self):
+        self.looker.responses['/api/3.0/query_tasks/abc123'] = [(200, {'id': 'abc123', 'status': 'error'})]
+
+        events, _ = self.run_trigger(LookerQueryTaskTrigger(query_task_id='abc123'))
+
+        self.assertEqual('error', events[0].payload['status'])
+
+    def test_trigger_refreshes_token_on_401(self):
+        self.looker.responses['/api/3.0/query_tasks/abc123'] = [
+            (401, {'message': 'Requires authentication.'}),
+            (200, {'id': 'abc123', 'status': 'complete'}),
+        ]
+
+        events, _ = self.run_trigger(LookerQueryTaskTrigger(query_task_id='abc123'))
+
+        self.assertEqual('success', events[0].payload['status'])
+        self.assertEqual(2, self.looker.logins)
+
+    def test_datagroup_trigger(self):
+        self.looker.responses['/api/3.0/datagroups/7'] = [
+            (200, {'id': 7, 'trigger_check_at': 900, 'trigger_error': None}),
+            (200, {'id': 7, 'trigger_check_at': 1100, 'trigger_error': None}),
+        ]
+
+        events, _ = self.run_trigger(LookerDatagroupTrigger(datagroup_id=7, stale_before=1000))
+
+        self.assertEqual([{'status': 'success', 'datagroup_id': 7, 'trigger_check_at': 1100}],
+                         [event.payload for event in events])
+
+    def test_datagroup_trigger_error(self):
+        self.looker.responses['/api/3.0/datagroups/7'] = [
+            (200, {'id': 7, 'trigger_check_at': 1100, 'trigger_error': 'SQL error'}),
+        ]
+
+        events, _ = self.run_trigger(LookerDatagroupTrigger(datagroup_id=7, stale_before=1000))
+
+        self.assertEqual('error', events[0].payload['status'])
+
+    def test_serialize(self):
+        trigger = LookerDatagroupTrigger(datagroup_id=7, stale_before=1000, looker_conn_id='looker', poll_interval=2)
+
+        classpath, kwargs = trigger.serialize()
+
+        self.assertEqual('airflow_looker.triggers.looker_trigger.LookerDatagroupTrigger', classpath)
+        self.assertEqual({'datagroup_id': 7, 'stale_before': 1000, 'looker_conn_id': 'looker',
+                          'poll_interval': 2, 'max_poll_interval': 60}, kwargs)